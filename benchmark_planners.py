@@ -0,0 +1,182 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from path_planner import field_grid, prune_path
+from planning_utils import PLANNERS, string_pull
+
+FIELDS = ['map', 'planner', 'found', 'time', 'expansions', 'peak_memory', 'cost', 'cells', 'waypoints', 'prune_time']
+
+
+def random_map(size, density, seed, kind='blocks'):
+    '''
+    Reproducible size x size occupancy grid with about `density` of the cells blocked
+    kind: 'noise' blocks single cells, 'blocks' drops rectangles (buildings / no-fly zones)
+    The start (0, 0) and goal (size-1, size-1) corners are kept free.
+    '''
+    rng = np.random.default_rng(seed)
+    if kind == 'noise':
+        grid = (rng.random((size, size)) < density).astype(np.uint8)
+    else:
+        grid = np.zeros((size, size), dtype=np.uint8)
+        while grid.mean() < density:
+            h, w = rng.integers(max(size//20, 1), max(size//5, 2), size=2)
+            r, c = rng.integers(0, size, size=2)
+            grid[r:r + h, c:c + w] = 1
+    grid[0:3, 0:3] = 0
+    grid[-3:, -3:] = 0
+    return grid
+
+def benchmark_maps(sizes=(100, 200), densities=(0.1, 0.3), seeds=(0,), kinds=('blocks', 'noise')):
+    '''
+    Yields dicts with name, grid, start and goal for every combination
+    '''
+    for kind in kinds:
+        for size in sizes:
+            for density in densities:
+                for seed in seeds:
+                    yield {'name': f'{kind}-{size}-{density}-{seed}',
+                           'grid': random_map(size, density, seed, kind),
+                           'start': (0, 0), 'goal': (size - 1, size - 1)}
+
+def zones_map(zones, home, goal, GRID_SIZE=200, inflation=0.0):
+    '''
+    Map of the flying field with the no-fly zones of a GeoJSON/KML/.plan/fence file
+    '''
+    geo = field_grid(GRID_SIZE, zones, inflation)
+    return {'name': f'zones-{zones}-{GRID_SIZE}', 'grid': geo.grid,
+            'start': geo.to_cell(*home), 'goal': geo.to_cell(*goal)}
+
+def run(planner, grid, start, goal, repeat=3):
+    '''
+    Best wall time of `repeat` runs, plus a separate traced run for the peak memory (tracemalloc
+    slows the planner down, so it is not timed)
+    '''
+    if repeat < 1:
+        raise ValueError(f'repeat must be at least 1, got {repeat}')
+    with contextlib.redirect_stdout(io.StringIO()):     # the planners print their outcome
+        times = []
+        for _ in range(repeat):
+            stats = {}
+            start_time = time.perf_counter()
+            path, cost = PLANNERS[planner](grid, start, goal, stats=stats)
+            times.append(time.perf_counter() - start_time)
+        tracemalloc.start()
+        PLANNERS[planner](grid, start, goal)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    start_time = time.perf_counter()
+    waypoints = prune_path(string_pull(grid, path)) if len(path) else []
+    prune_time = time.perf_counter() - start_time
+    return {'planner': planner, 'found': bool(len(path)), 'time': min(times),
+            'expansions': stats.get('expansions'), 'peak_memory': peak, 'cost': float(cost),
+            'cells': len(path), 'waypoints': len(waypoints), 'prune_time': prune_time}
+
+def run_all(maps, planners, repeat=3):
+    results = []
+    for benchmark_map in maps:
+        for planner in planners:
+            result = run(planner, benchmark_map['grid'], benchmark_map['start'], benchmark_map['goal'], repeat)
+            result['map'] = benchmark_map['name']
+            results.append(result)
+            print('{map:<24} {planner:<16} {time:9.4f}s {expansions!s:>9} exp {peak_memory:>11,d} B '
+                  'cost {cost:9.2f} {waypoints:5d} wp'.format(**result))
+    return results
+
+def check_regressions(results, baseline, time_tolerance=0.5, cost_tolerance=0.01, expansion_tolerance=0.1):
+    '''
+    Compares results with a baseline run of the same maps and planners
+    Returns:
+        list: messages of every metric that got worse than its tolerance (relative)
+    '''
+    reference = {(r['map'], r['planner']): r for r in baseline}
+    failures = []
+    for result in results:
+        base = reference.get((result['map'], result['planner']))
+        if base is None:
+            continue
+        name = f"{result['map']} {result['planner']}"
+        if base['found'] and not result['found']:
+            failures.append(f'{name}: no path found anymore')
+            continue
+        for key, tolerance in (('time', time_tolerance), ('cost', cost_tolerance),
+                               ('expansions', expansion_tolerance)):
+            if base.get(key) is not None and result.get(key) is not None \
+               and result[key] > base[key]*(1 + tolerance):
+                failures.append(f'{name}: {key} {result[key]:.6g} > {base[key]:.6g} (+{tolerance:.0%})')
+    return failures
+
+def save(results, path):
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=1)
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
+def load(path):
+    if path.endswith('.json'):
+        with open(path) as f:
+            return json.load(f)
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        row['found'] = row['found'] == 'True'
+        for key in ('time', 'cost', 'prune_time'):
+            row[key] = float(row[key])
+        for key in ('expansions', 'peak_memory', 'cells', 'waypoints'):
+            row[key] = int(row[key]) if row[key] not in ('', 'None') else None
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the grid planners on seeded maps')
+    parser.add_argument('--planners', nargs='+', default=[p for p in PLANNERS if p != 'a_star'],
+                        choices=list(PLANNERS), help='planners to run (a_star is slow on large maps)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 200])
+    parser.add_argument('--densities', type=float, nargs='+', default=[0.1, 0.3])
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0])
+    parser.add_argument('--kinds', nargs='+', default=['blocks', 'noise'], choices=['blocks', 'noise'])
+    parser.add_argument('--zones', default=None,
+                        help='also benchmark the field grid with the no-fly zones of this file')
+    parser.add_argument('--home', type=float, nargs=2, default=[38.161437, -122.454534], metavar=('LAT', 'LON'))
+    parser.add_argument('--goal', type=float, nargs=2, default=[38.16210, -122.45653], metavar=('LAT', 'LON'))
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per planner and map')
+    parser.add_argument('--output', nargs='+', default=[], help='.json and/or .csv result files')
+    parser.add_argument('--baseline', default=None, help='earlier results to check for regressions')
+    parser.add_argument('--time-tolerance', type=float, default=0.5)
+    parser.add_argument('--cost-tolerance', type=float, default=0.01)
+    parser.add_argument('--expansion-tolerance', type=float, default=0.1)
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    maps = list(benchmark_maps(args.sizes, args.densities, args.seeds, args.kinds))
+    if args.zones is not None:
+        maps.append(zones_map(args.zones, args.home, args.goal))
+    results = run_all(maps, args.planners, args.repeat)
+    for path in args.output:
+        save(results, path)
+    if args.baseline is None:
+        return 0
+    failures = check_regressions(results, load(args.baseline), args.time_tolerance,
+                                 args.cost_tolerance, args.expansion_tolerance)
+    for failure in failures:
+        print('REGRESSION', failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
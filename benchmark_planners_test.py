@@ -0,0 +1,93 @@
+"""Tests for benchmark_planners, the seeded maps, result files and regression check."""
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import benchmark_planners
+from benchmark_planners import check_regressions, load, random_map, run, save
+
+
+def _quiet(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def _result(map_name='blocks-100-0.1-0', planner='a_star_fast', found=True, time=0.01, cost=100.0, expansions=500):
+    return {'map': map_name, 'planner': planner, 'found': found, 'time': time, 'expansions': expansions,
+            'peak_memory': 2048, 'cost': cost, 'cells': 90, 'waypoints': 6, 'prune_time': 0.001}
+
+
+class RandomMapTest(unittest.TestCase):
+
+    def test_seed(self):
+        for kind in ('blocks', 'noise'):
+            grid = random_map(60, 0.2, seed=3, kind=kind)
+            np.testing.assert_array_equal(grid, random_map(60, 0.2, seed=3, kind=kind))
+            self.assertFalse(np.array_equal(grid, random_map(60, 0.2, seed=4, kind=kind)))
+
+    def test_density_and_free_corners(self):
+        for kind in ('blocks', 'noise'):
+            grid = random_map(100, 0.3, seed=0, kind=kind)
+            self.assertEqual(grid.shape, (100, 100))
+            self.assertAlmostEqual(grid.mean(), 0.3, delta=0.1)
+            self.assertFalse(grid[0:3, 0:3].any() or grid[-3:, -3:].any())
+
+
+class RunTest(unittest.TestCase):
+
+    def test_run(self):
+        result = run('a_star_fast', random_map(40, 0.1, seed=0), (0, 0), (39, 39), repeat=2)
+        self.assertTrue(result['found'])
+        self.assertGreater(result['cells'], 39)
+        self.assertGreater(result['peak_memory'], 0)
+        self.assertLessEqual(result['waypoints'], result['cells'])
+
+    def test_repeat_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            run('a_star_fast', random_map(20, 0.1, seed=0), (0, 0), (19, 19), repeat=0)
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            benchmark_planners.parse_args(['--repeat', '0'])
+
+
+class CheckRegressionsTest(unittest.TestCase):
+
+    def test_within_tolerance(self):
+        baseline = [_result()]
+        self.assertEqual(check_regressions([_result(time=0.0149, cost=100.9, expansions=549)], baseline), [])
+        # Better, or on a map the baseline does not have
+        self.assertEqual(check_regressions([_result(time=0.001, cost=50), _result(map_name='other', time=9)],
+                                           baseline), [])
+
+    def test_thresholds(self):
+        baseline = [_result()]
+        failures = check_regressions([_result(time=0.016, cost=101.1, expansions=551)], baseline)
+        self.assertEqual(len(failures), 3)
+        self.assertTrue(failures[0].startswith('blocks-100-0.1-0 a_star_fast: time'))
+        self.assertEqual(check_regressions([_result(time=0.016)], baseline, time_tolerance=1.0), [])
+        self.assertEqual(len(check_regressions([_result(cost=100.5)], baseline, cost_tolerance=0.001)), 1)
+
+    def test_path_lost(self):
+        failures = check_regressions([_result(found=False, cost=float('inf'))], [_result()])
+        self.assertEqual(failures, ['blocks-100-0.1-0 a_star_fast: no path found anymore'])
+
+    def test_missing_metrics_are_skipped(self):
+        self.assertEqual(check_regressions([_result(expansions=10**6)], [_result(expansions=None)]), [])
+
+
+class ResultFilesTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        results = [_result(), _result(planner='d_star_lite', found=False, cost=float('inf'), expansions=None)]
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('results.csv', 'results.json'):
+                path = os.path.join(directory, name)
+                save(results, path)
+                self.assertEqual(load(path), results)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import cv2
+import numpy as np
+
+from geo import get_location_offset_meters
+
+
+def rotation_zyx(yaw, pitch, roll):
+    """ Rotation matrix from a body (FRD) frame to NED for yaw, pitch, roll in radians """
+    cy, sy = np.cos(yaw), np.sin(yaw)
+    cp, sp = np.cos(pitch), np.sin(pitch)
+    cr, sr = np.cos(roll), np.sin(roll)
+    Rz = np.array([[cy, -sy, 0], [sy, cy, 0], [0, 0, 1]])
+    Ry = np.array([[cp, 0, sp], [0, 1, 0], [-sp, 0, cp]])
+    Rx = np.array([[1, 0, 0], [0, cr, -sr], [0, sr, cr]])
+    return Rz @ Ry @ Rx
+
+# OpenCV camera axes (x right, y down, z optical axis) expressed in the gimbal FRD frame
+CAMERA_TO_GIMBAL = np.array([[0., 0., 1.],
+                             [1., 0., 0.],
+                             [0., 1., 0.]])
+
+
+class DemRaster():
+    """Digital elevation model on a regular lat/lon grid
+    Attributes:
+        elevation (np.ndarray): (rows, cols) terrain heights in meters, row 0 at lat0
+        lat0, lon0 (float): coordinates of the cell [0, 0]
+        dlat, dlon (float): grid spacing in degrees (may be negative)
+        home_elevation (float): terrain height at the home position, heights are returned relative to it
+    """
+
+    def __init__(self, elevation, lat0, lon0, dlat, dlon, home_elevation=0.0):
+        self.elevation = np.asarray(elevation, dtype=np.float64)
+        self.lat0, self.lon0 = lat0, lon0
+        self.dlat, self.dlon = dlat, dlon
+        self.home_elevation = home_elevation
+
+    def height(self, lats, lons):
+        """ Bilinearly sampled terrain height relative to home, clamped at the raster border """
+        rows, cols = self.elevation.shape
+        r = np.clip((np.asarray(lats) - self.lat0)/self.dlat, 0, rows - 1)
+        c = np.clip((np.asarray(lons) - self.lon0)/self.dlon, 0, cols - 1)
+        r0 = np.minimum(np.floor(r).astype(np.int64), rows - 2 if rows > 1 else 0)
+        c0 = np.minimum(np.floor(c).astype(np.int64), cols - 2 if cols > 1 else 0)
+        r1, c1 = np.minimum(r0 + 1, rows - 1), np.minimum(c0 + 1, cols - 1)
+        fr, fc = r - r0, c - c0
+        e = self.elevation
+        top = e[r0, c0]*(1 - fc) + e[r0, c1]*fc
+        bottom = e[r1, c0]*(1 - fc) + e[r1, c1]*fc
+        return top*(1 - fr) + bottom*fr - self.home_elevation
+
+
+class CameraModel():
+    """Pinhole camera model used to geolocate detections
+    Pixel centers are undistorted, rotated through the gimbal and vehicle attitude into NED rays
+    and intersected with the ground plane (or a DEM), all batched over the detections.
+    Attributes:
+        K (np.ndarray): 3x3 intrinsics matrix for image_size, built from hfov/vfov if not given
+        dist (np.ndarray): OpenCV distortion coefficients or None
+        image_size (tuple): (width, height) K was calibrated at, None if K comes from the FOV
+        hfov, vfov (float): fields of view in radians, used when K is None
+        gimbal_pitch, gimbal_roll, gimbal_yaw (float): gimbal angles in degrees, pitch -90 = nadir
+        stabilized (bool): gimbal holds its angles in the horizon frame (vehicle roll/pitch ignored)
+        dem (DemRaster): optional terrain model, flat ground at home altitude if None
+    """
+
+    def __init__(self, K=None, dist=None, image_size=None, hfov=2, vfov=82*3.14/180,
+                 gimbal_pitch=-90, gimbal_roll=0, gimbal_yaw=0, stabilized=True, dem=None):
+        self.K = None if K is None else np.asarray(K, dtype=np.float64)
+        self.dist = None if dist is None else np.asarray(dist, dtype=np.float64)
+        self.image_size = image_size
+        self.hfov = hfov
+        self.vfov = vfov
+        self.gimbal_pitch = gimbal_pitch
+        self.gimbal_roll = gimbal_roll
+        self.gimbal_yaw = gimbal_yaw
+        self.stabilized = stabilized
+        self.dem = dem
+
+    def intrinsics(self, img_shape):
+        """ K for an image of shape img_shape (h, w, ...) """
+        h, w = img_shape[0:2]
+        if self.K is None:
+            fx = (w/2)/np.tan(self.hfov/2)
+            fy = (h/2)/np.tan(self.vfov/2)
+            return np.array([[fx, 0, w/2], [0, fy, h/2], [0, 0, 1]])
+        if self.image_size is None or tuple(self.image_size) == (w, h):
+            return self.K
+        scale = np.diag([w/self.image_size[0], h/self.image_size[1], 1])
+        return scale @ self.K
+
+    def camera_to_ned(self, roll=0, pitch=0, yaw=0):
+        """ Rotation from the camera frame to NED for a vehicle attitude in degrees """
+        gimbal = rotation_zyx(np.radians(self.gimbal_yaw), np.radians(self.gimbal_pitch),
+                              np.radians(self.gimbal_roll))
+        if self.stabilized:
+            body = rotation_zyx(np.radians(yaw), 0, 0)
+        else:
+            body = rotation_zyx(np.radians(yaw), np.radians(pitch), np.radians(roll))
+        return body @ gimbal @ CAMERA_TO_GIMBAL
+
+    def pixel_rays(self, pixels, img_shape, roll=0, pitch=0, yaw=0):
+        """ (N,2) pixel coordinates -> (N,3) NED ray directions (not normalized) """
+        K = self.intrinsics(img_shape)
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        if self.dist is not None:
+            normalized = cv2.undistortPoints(pixels.reshape(-1, 1, 2), K, self.dist).reshape(-1, 2)
+        else:
+            normalized = (pixels - K[0:2, 2])/np.diag(K)[0:2]
+        rays = np.concatenate((normalized, np.ones((len(normalized), 1))), axis=1)
+        return rays @ self.camera_to_ned(roll, pitch, yaw).T
+
+    def ground_offsets(self, rays, alt, lat=None, lon=None, iterations=4):
+        """ Intersect NED rays from a camera `alt` meters above home with the ground
+        Returns:
+            np.ndarray: (N,2) north/east offsets in meters, NaN for rays that miss the ground
+        """
+        down = rays[:, 2]
+        valid = down > 1e-6
+        height = np.full(len(rays), float(alt))
+        for _ in range(iterations if self.dem is not None else 1):
+            scale = np.where(valid, height/np.where(valid, down, 1), np.nan)
+            offsets = rays[:, 0:2]*scale[:, None]
+            if self.dem is None:
+                break
+            lats, lons = get_location_offset_meters(lat, lon, offsets[:, 0], offsets[:, 1])
+            height = alt - np.nan_to_num(self.dem.height(lats, lons))
+            valid &= height > 0
+        return offsets
+
+    def geolocate_boxes(self, boxes, img_shape, pose):
+        """ Maps (N,4) normalized [top, left, bottom, right] boxes to (N,2) [lat, lon]
+        Args:
+            boxes (np.ndarray): normalized boxes
+            img_shape (tuple): shape of the image the boxes refer to
+            pose (dict): lat, lon, alt (relative, m), roll, pitch, yaw (deg), e.g. PoseHistory.interpolate()
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        h, w = img_shape[0:2]
+        pixels = np.stack((w*(boxes[:, 1] + boxes[:, 3])/2, h*(boxes[:, 0] + boxes[:, 2])/2), axis=-1)
+        rays = self.pixel_rays(pixels, img_shape, pose.get('roll', 0), pose.get('pitch', 0), pose['yaw'])
+        offsets = self.ground_offsets(rays, pose['alt'], pose['lat'], pose['lon'])
+        lats, lons = get_location_offset_meters(pose['lat'], pose['lon'], offsets[:, 0], offsets[:, 1])
+        return np.stack((lats, lons), axis=-1)
@@ -0,0 +1,89 @@
+"""Tests for camera_model, the geolocation of boxes through the gimbal and vehicle attitude."""
+import unittest
+
+import numpy as np
+
+from camera_model import CameraModel, DemRaster
+from geo import EARTH_RADIUS
+
+LAT, LON = 38.1614, -122.4545
+SHAPE = (480, 640, 3)
+
+
+def _offsets(locations):
+    """ [lat, lon] locations -> north/east meters from (LAT, LON) """
+    north = np.radians(locations[:, 0] - LAT)*EARTH_RADIUS
+    east = np.radians(locations[:, 1] - LON)*EARTH_RADIUS*np.cos(np.radians(LAT))
+    return np.stack((north, east), axis=-1)
+
+
+def _box(x, y, size=0.02):
+    """ Normalized box centered on the normalized image point (x, y) """
+    return [y - size, x - size, y + size, x + size]
+
+
+class CameraModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pose = {'lat': LAT, 'lon': LON, 'alt': 50.0, 'roll': 0.0, 'pitch': 0.0, 'yaw': 0.0}
+
+    def test_nadir_center_is_below_the_drone(self):
+        locations = CameraModel().geolocate_boxes([_box(0.5, 0.5)], SHAPE, self.pose)
+        np.testing.assert_allclose(_offsets(locations), [[0, 0]], atol=1e-6)
+
+    def test_nadir_image_axes_heading_north(self):
+        camera = CameraModel(hfov=np.radians(90), vfov=np.radians(90))
+        # Right edge of the image is east, top edge is north, at alt*tan(fov/2)
+        locations = camera.geolocate_boxes([_box(1.0, 0.5), _box(0.5, 0.0)], SHAPE, self.pose)
+        np.testing.assert_allclose(_offsets(locations), [[0, 50], [50, 0]], atol=1e-3)
+
+    def test_vehicle_yaw_rotates_the_footprint(self):
+        camera = CameraModel(hfov=np.radians(90), vfov=np.radians(90))
+        self.pose['yaw'] = 90.0
+        # Heading east, the right edge of the image is south
+        locations = camera.geolocate_boxes([_box(1.0, 0.5)], SHAPE, self.pose)
+        np.testing.assert_allclose(_offsets(locations), [[-50, 0]], atol=1e-3)
+
+    def test_gimbal_yaw_adds_to_the_vehicle_yaw(self):
+        boxes = [_box(0.8, 0.3), _box(0.1, 0.9)]
+        turned = CameraModel(gimbal_yaw=-90).geolocate_boxes(boxes, SHAPE, self.pose)
+        self.pose['yaw'] = -90.0
+        expected = CameraModel().geolocate_boxes(boxes, SHAPE, self.pose)
+        np.testing.assert_allclose(turned, expected, atol=1e-9)
+
+    def test_stabilized_gimbal_ignores_roll_and_pitch(self):
+        boxes = [_box(0.8, 0.3)]
+        level = CameraModel().geolocate_boxes(boxes, SHAPE, self.pose)
+        self.pose.update(roll=10.0, pitch=-5.0)
+        np.testing.assert_allclose(CameraModel().geolocate_boxes(boxes, SHAPE, self.pose), level)
+        tilted = CameraModel(stabilized=False).geolocate_boxes(boxes, SHAPE, self.pose)
+        self.assertGreater(np.abs(_offsets(tilted) - _offsets(level)).max(), 1.0)
+
+    def test_rays_above_the_horizon_miss_the_ground(self):
+        camera = CameraModel(gimbal_pitch=0)
+        self.assertTrue(np.isnan(camera.geolocate_boxes([_box(0.5, 0.3)], SHAPE, self.pose)).all())
+
+    def test_intrinsics_scale_to_the_image_size(self):
+        K = np.array([[500., 0, 320], [0, 500., 240], [0, 0, 1]])
+        camera = CameraModel(K=K, image_size=(640, 480))
+        np.testing.assert_allclose(camera.intrinsics((240, 320)), [[250, 0, 160], [0, 250, 120], [0, 0, 1]])
+        # Normalized boxes land on the same ground point at any resolution
+        boxes = [_box(0.7, 0.2)]
+        np.testing.assert_allclose(camera.geolocate_boxes(boxes, (240, 320), self.pose),
+                                   camera.geolocate_boxes(boxes, SHAPE, self.pose))
+
+    def test_dem_shortens_the_rays(self):
+        boxes = [_box(0.9, 0.1)]
+        flat = _offsets(CameraModel().geolocate_boxes(boxes, SHAPE, self.pose))
+        dem = DemRaster(np.full((3, 3), 10.0), LAT - 0.01, LON - 0.01, 0.01, 0.01)
+        raised = _offsets(CameraModel(dem=dem).geolocate_boxes(boxes, SHAPE, self.pose))
+        # Ground 10 m higher under a camera 50 m above home
+        np.testing.assert_allclose(raised, flat*40/50, rtol=1e-6)
+
+    def test_dem_bilinear_height(self):
+        dem = DemRaster([[0.0, 10.0], [20.0, 30.0]], 0.0, 0.0, 1.0, 1.0, home_elevation=5.0)
+        np.testing.assert_allclose(dem.height([0.0, 0.5, 1.0, 2.0], [0.0, 0.5, 1.0, -1.0]), [-5, 10, 25, 15])
+
+
+if __name__ == '__main__':
+    unittest.main()
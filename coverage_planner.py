@@ -0,0 +1,167 @@
+import cv2
+import numpy as np
+
+from camera_model import CameraModel
+from geo_grid import GeoGrid, zone_points
+from path_planner import plan_cells
+
+
+def camera_footprint(alt, camera=None, img_shape=(480, 640)):
+    '''
+    Ground footprint of a level camera `alt` meters above flat ground, flying north
+    Returns:
+        (across, along): guaranteed covered width across the track and length along it in meters
+    '''
+    camera = camera if camera is not None else CameraModel()
+    if camera.image_size is not None:
+        img_shape = (camera.image_size[1], camera.image_size[0])
+    h, w = img_shape[0:2]
+    corners = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float64)
+    offsets = camera.ground_offsets(camera.pixel_rays(corners, img_shape), alt)
+    if np.isnan(offsets).any():
+        raise ValueError('The camera sees above the horizon, there is no bounded footprint')
+    # The inner two of the four corner coordinates bound what every pass is sure to see
+    north, east = np.sort(offsets[:, 0]), np.sort(offsets[:, 1])
+    return east[2] - east[1], north[2] - north[1]
+
+def lane_spacing(alt, camera=None, overlap=0.2):
+    '''
+    Distance between neighbouring lanes so that their footprints overlap by `overlap`
+    '''
+    across, _ = camera_footprint(alt, camera)
+    return across*(1 - overlap)
+
+
+def _metric(grid, cells):
+    ''' Fractional (row, col) cells -> (y north, x east) meters on the grid '''
+    cell_h, cell_w = grid.cell_size
+    return np.asarray(cells, dtype=np.float64)*(np.sign(grid.dlat)*cell_h, np.sign(grid.dlon)*cell_w)
+
+def _cells(grid, points):
+    cell_h, cell_w = grid.cell_size
+    return np.asarray(points, dtype=np.float64)/(np.sign(grid.dlat)*cell_h, np.sign(grid.dlon)*cell_w)
+
+def _lookup(grid, mask, points):
+    ''' mask value of the cells under (..., 2) metric points, False outside of the grid '''
+    cells = np.rint(_cells(grid, points)).astype(np.int64)
+    rows, cols = cells[..., 0], cells[..., 1]
+    inside = grid.contains(rows, cols)
+    values = np.zeros(rows.shape, dtype=bool)
+    values[inside] = mask[rows[inside], cols[inside]]
+    return values
+
+def sweep_angle(vertices):
+    '''
+    Lane direction (radians from north towards east) along one of the polygon edges that minimizes
+    the width of the polygon across the lanes, i.e. the number of lanes (optimal for convex areas)
+    '''
+    edges = np.diff(np.concatenate((vertices, vertices[:1])), axis=0)
+    angles = np.arctan2(edges[:, 1], edges[:, 0])
+    normals = np.stack((-np.sin(angles), np.cos(angles)), axis=-1)
+    widths = np.ptp(vertices @ normals.T, axis=0)
+    return angles[np.argmin(widths)]
+
+def _area(polygon, grid, spacing):
+    ''' Grid around the polygon if none is given, and the mask of the free cells inside the polygon '''
+    if grid is None:
+        grid = GeoGrid.around(zone_points([{'polygon': polygon}]), margin=spacing,
+                              resolution=max(min(spacing/8, 2.0), 0.25))
+    inside = GeoGrid(grid.lat0, grid.lon0, grid.dlat, grid.dlon, *grid.shape)
+    inside.add_polygon(polygon, inflation=0)
+    return grid, (inside.grid == 1) & (grid.grid != 1)
+
+def _connect(grid, points):
+    '''
+    Inserts detours planned on the occupancy grid where the straight flight between two consecutive
+    (metric) waypoints would cross an obstacle
+    '''
+    free = grid.grid != 1
+    step = min(grid.cell_size)/2
+    connected = [points[0]]
+    for a, b in zip(points[:-1], points[1:]):
+        n = max(int(np.ceil(np.linalg.norm(b - a)/step)), 1)
+        samples = a + (b - a)*np.linspace(0, 1, n + 1)[:, None]
+        if not _lookup(grid, free, samples).all():
+            start = tuple(np.rint(_cells(grid, a)).astype(int))
+            goal = tuple(np.rint(_cells(grid, b)).astype(int))
+            _, waypoints, _ = plan_cells(grid.grid, start, goal)
+            connected += list(_metric(grid, waypoints[1:-1]))
+        connected.append(b)
+    return np.array(connected)
+
+def lawnmower(polygon, spacing, grid=None, angle=None):
+    '''
+    Boustrophedon coverage of a [lat, lon] polygon (ring or rings with holes) with lanes `spacing` meters apart
+    Lanes are cut where they leave the polygon or cross obstacles of the GeoGrid, segments are
+    flown back and forth and transitions detour around obstacles.
+    Returns:
+        np.ndarray: (N,2) [lat, lon] waypoints
+    '''
+    grid, allowed = _area(polygon, grid, spacing)
+    rows, cols = np.nonzero(allowed)
+    if len(rows) == 0:
+        return np.zeros((0, 2))
+    outline = cv2.convexHull(np.stack((rows, cols), axis=-1).astype(np.float32)).reshape(-1, 2)
+    vertices = _metric(grid, outline)
+    if angle is None:
+        angle = sweep_angle(vertices) if len(vertices) > 2 else 0.0
+    direction = np.array([np.cos(angle), np.sin(angle)])
+    normal = np.array([-np.sin(angle), np.cos(angle)])
+    across, along = vertices @ normal, vertices @ direction
+    offsets = np.arange(across.min() + spacing/2, across.max(), spacing)
+    if len(offsets) == 0:
+        offsets = np.array([(across.min() + across.max())/2])
+    step = min(grid.cell_size)/2
+    t = np.arange(along.min() - step, along.max() + 2*step, step)
+    # Every sample of every lane at once: (lanes, samples)
+    samples = offsets[:, None, None]*normal + t[None, :, None]*direction
+    valid = _lookup(grid, allowed, samples)
+    edges = np.diff(np.pad(valid.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    points = []
+    for lane in range(len(offsets)):
+        starts, ends = np.nonzero(edges[lane] == 1)[0], np.nonzero(edges[lane] == -1)[0] - 1
+        segments = [(samples[lane, s], samples[lane, e]) for s, e in zip(starts, ends) if e > s]
+        if lane % 2:
+            segments = [(b, a) for a, b in segments[::-1]]
+        for a, b in segments:
+            points += [a, b]
+    if not points:
+        return np.zeros((0, 2))
+    cells = _cells(grid, _connect(grid, np.array(points)))
+    return np.stack(grid.to_latlon(cells[:, 0], cells[:, 1]), axis=-1)
+
+def spiral(polygon, spacing, grid=None):
+    '''
+    Inward spiral coverage: rings at spacing/2, 3*spacing/2, ... from the border of the free part of
+    the polygon (so they also wrap around obstacles), each entered next to where the previous ended
+    Returns:
+        np.ndarray: (N,2) [lat, lon] waypoints
+    '''
+    grid, allowed = _area(polygon, grid, spacing)
+    cell = np.sqrt(np.prod(grid.cell_size))     # distanceTransform assumes square cells
+    distance = cv2.distanceTransform(allowed.astype(np.uint8), cv2.DIST_L2, 5)*cell
+    points = []
+    level = spacing/2
+    while (distance >= level).any():
+        contours, _ = cv2.findContours((distance >= level).astype(np.uint8), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        for contour in contours:
+            ring = cv2.approxPolyDP(contour, 1.0, True).reshape(-1, 2)[:, ::-1]     # (col, row) -> (row, col)
+            ring = _metric(grid, ring)
+            if points:
+                first = np.argmin(np.linalg.norm(ring - points[-1], axis=1))
+                ring = np.roll(ring, -first, axis=0)
+            points += list(ring) + [ring[0]]
+        level += spacing
+    if not points:
+        return np.zeros((0, 2))
+    cells = _cells(grid, _connect(grid, np.array(points)))
+    return np.stack(grid.to_latlon(cells[:, 0], cells[:, 1]), axis=-1)
+
+PATTERNS = {'lawnmower': lawnmower, 'spiral': spiral}
+
+def coverage_path(polygon, alt, pattern='lawnmower', camera=None, overlap=0.2, grid=None, **kwargs):
+    '''
+    Search pattern over a [lat, lon] polygon with the lane spacing of the camera footprint at `alt`
+    '''
+    spacing = lane_spacing(alt, camera, overlap)
+    return PATTERNS[pattern](polygon, spacing, grid, **kwargs)
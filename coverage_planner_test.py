@@ -0,0 +1,102 @@
+"""Tests for coverage_planner, the lawnmower and spiral search patterns over a polygon."""
+import contextlib
+import io
+import unittest
+
+import numpy as np
+
+import coverage_planner
+from camera_model import CameraModel
+from coverage_planner import camera_footprint, coverage_path, lane_spacing, lawnmower, spiral, sweep_angle
+from geo_grid import GeoGrid
+
+LAT, LON = 38.16, -122.455
+
+
+def _quiet(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+class FootprintTest(unittest.TestCase):
+
+    def test_square_fov(self):
+        camera = CameraModel(hfov=np.radians(90), vfov=np.radians(90))
+        np.testing.assert_allclose(camera_footprint(50.0, camera), (100, 100), rtol=1e-6)
+        np.testing.assert_allclose(lane_spacing(50.0, camera, overlap=0.25), 75, rtol=1e-6)
+
+    def test_oblique_camera(self):
+        # The far edge of a forward looking camera is above the horizon
+        with self.assertRaises(ValueError):
+            camera_footprint(50.0, CameraModel(gimbal_pitch=-20))
+        # Tilted forward, the guaranteed width narrows to the near edge
+        level = camera_footprint(50.0, CameraModel())
+        tilted = camera_footprint(50.0, CameraModel(gimbal_pitch=-70))
+        self.assertLess(tilted[0], level[0])
+
+    def test_sweep_angle(self):
+        # 100 x 20 m rectangle, long side east: lanes run east
+        vertices = np.array([[0, 0], [0, 100], [20, 100], [20, 0]], dtype=np.float64)
+        self.assertAlmostEqual(abs(np.sin(sweep_angle(vertices))), 1.0)
+        self.assertAlmostEqual(abs(np.cos(sweep_angle(vertices[:, ::-1]))), 1.0)
+
+
+class PatternTest(unittest.TestCase):
+
+    def setUp(self):
+        # 1 m cells, 120 x 120 m, the polygon is the 100 x 100 m square in the middle
+        self.grid = GeoGrid.from_bounds(LAT, LON, LAT + 0.00108, LON + 0.00137, resolution=1.0)
+        self.polygon = [self.grid.to_latlon(r, c) for r, c in ((10, 10), (10, 110), (110, 110), (110, 10))]
+        self.grid.grid[50:70, 40:80] = 1
+
+    def _cells(self, path):
+        """ (N,2) [lat, lon] waypoints -> (M,2) (row, col) cells sampled along the legs """
+        rows, cols = self.grid.to_cell(path[:, 0], path[:, 1])
+        points = np.stack((rows, cols), axis=-1).astype(np.float64)
+        t = np.linspace(0, 1, 50)[:, None]
+        samples = [a + (b - a)*t for a, b in zip(points[:-1], points[1:])]
+        return np.rint(np.concatenate(samples)).astype(np.int64)
+
+    def assertCovers(self, path, spacing):
+        cells = self._cells(path)
+        self.assertFalse(self.grid.grid[cells[:, 0], cells[:, 1]].any(), 'the path crosses the obstacle')
+        self.assertTrue(((cells >= 8) & (cells <= 112)).all(), 'the path leaves the polygon')
+        # Every free cell of the polygon is within half a (square) footprint, and a cell, of the path
+        rows, cols = np.nonzero(self.grid.grid[10:111, 10:111] == 0)
+        free = np.stack((rows + 10, cols + 10), axis=-1)[::7]
+        distance = np.abs(free[:, None] - cells[None]).max(axis=-1).min(axis=1)
+        self.assertLessEqual(distance.max(), spacing/2 + 2)
+
+    def test_lawnmower(self):
+        path = _quiet(lawnmower, self.polygon, 20.0, self.grid)
+        self.assertCovers(path, 20.0)
+        # Straight lanes: far fewer waypoints than cells
+        self.assertLess(len(path), 60)
+
+    def test_lawnmower_angle(self):
+        path = _quiet(lawnmower, self.polygon, 20.0, self.grid, angle=np.pi/4)
+        self.assertCovers(path, 20.0)
+
+    def test_spiral(self):
+        path = _quiet(spiral, self.polygon, 20.0, self.grid)
+        self.assertCovers(path, 20.0)
+
+    def test_default_grid(self):
+        path = _quiet(lawnmower, self.polygon, 20.0)
+        rows, cols = self.grid.to_cell(path[:, 0], path[:, 1])
+        self.assertTrue(((rows >= 8) & (rows <= 112) & (cols >= 8) & (cols <= 112)).all())
+
+    def test_no_free_area(self):
+        self.grid.grid[:] = 1
+        self.assertEqual(lawnmower(self.polygon, 20.0, self.grid).shape, (0, 2))
+        self.assertEqual(spiral(self.polygon, 20.0, self.grid).shape, (0, 2))
+
+    def test_coverage_path(self):
+        camera = CameraModel(hfov=np.radians(90), vfov=np.radians(90))
+        path = _quiet(coverage_path, self.polygon, 12.5, 'spiral', camera, overlap=0.2, grid=self.grid)
+        np.testing.assert_allclose(path, _quiet(spiral, self.polygon, 20.0, self.grid))
+        self.assertEqual(set(coverage_planner.PATTERNS), {'lawnmower', 'spiral'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import cv2
 import numpy as np
 
-from mavsdk_utils import get_location_offset_meters
+from geo import get_location_offset_meters
 
 np.random.seed(2)
 COLORS = np.random.randint(0, 255, size=(91, 3), dtype="uint8")
@@ -34,11 +34,11 @@ def draw_outputs(img, outputs, class_names, detector='ssd'):
                 x1y1, cv2.FONT_HERSHEY_COMPLEX_SMALL, 1, (0, 0, 255), 2)
     return img
 
-def keep_person_only(boxes_squeezed, scores_squeezed, classes_squeezed, confidence=0.5, detector='ssd'):
-    if detector == 'ssd':
-        idx = np.logical_and(classes_squeezed == 1, scores_squeezed >= confidence)
-    else:
-        idx = np.logical_and(classes_squeezed == 0, scores_squeezed >= confidence)
+def keep_person_only(boxes_squeezed, scores_squeezed, classes_squeezed, confidence=0.5, detector='ssd', person_class=None):
+    ''' person_class (e.g. detectors.Detector.person_class) overrides the per-detector default '''
+    if person_class is None:
+        person_class = 1 if detector == 'ssd' else 0
+    idx = np.logical_and(classes_squeezed == person_class, scores_squeezed >= confidence)
     nums = len(classes_squeezed[idx])     # Number of detected persons with confidence
     return boxes_squeezed[idx], scores_squeezed[idx], classes_squeezed[idx], nums
 
@@ -61,14 +61,17 @@ def show_in_window(fig):
     sys.exit(app.exec_())
 
 def coordinates_plot(person_lat, person_lon, home_lat, home_lon):
-    lats = [person_lat, home_lat]
-    lons = [person_lon, home_lon]
+    ''' person_lat/person_lon may be single values or lists, one per located person '''
+    person_lats = list(np.atleast_1d(person_lat))
+    person_lons = list(np.atleast_1d(person_lon))
+    lats = person_lats + [home_lat]
+    lons = person_lons + [home_lon]
     fig = go.Figure(go.Scattermapbox(
         lat=lats,
         lon=lons,
         mode='markers',
-        marker={'size': 15, 'symbol': ['clothing-store', 'airport']},
-        text=['Average Person Location','UAV Home Location'],))
+        marker={'size': 15, 'symbol': ['clothing-store']*len(person_lats) + ['airport']},
+        text=[f'Person {i+1} Location' for i in range(len(person_lats))] + ['UAV Home Location'],))
     fig.update_layout(
         hovermode='closest',
         mapbox=dict(
@@ -86,33 +89,54 @@ def rotate_image(image, angle):
     result = cv2.warpAffine(image, rot_mat, image.shape[1::-1], flags=cv2.INTER_LINEAR)
     return result
 
-def localize_person(img, boxes, nums, alt, yaw, drone_lat, drone_lon):
-    hfov = 2            # rad
-    vfov = 82*3.14/180  # rad = 1.43
-    yaw = yaw - 90
+def geolocate_boxes(boxes, img_shape, alt, drone_lat, drone_lon, hfov=2, vfov=82*3.14/180):
+    '''
+    Maps an (N,4) array of normalized [top, left, bottom, right] boxes to an (N,2) array of
+    [lat, lon] in one shot, assuming a nadir camera (triangle similarity).
+    '''
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    h, w = img_shape[0:2]
     gnd_width_m = alt*2*np.tan(hfov/2)
     gnd_height_m = alt*2*np.tan(vfov/2)
-    h, w = rotate_image(img, -yaw).shape[0:2]
     m_to_pixels_w = gnd_width_m/w
     m_to_pixels_h = gnd_height_m/h
-    # lists to return
-    person_lats = []
-    person_lons = []
-    for box in boxes:
-        # Note: North = y = height = h      &       East = x = width = w
+    # Note: North = y = height = h      &       East = x = width = w
+    center_x = (w*(boxes[:, 3]+boxes[:, 1])/2).astype(np.int32)
+    center_y = (h*(boxes[:, 2]+boxes[:, 0])/2).astype(np.int32)
+    dY, dX = h//2 - center_y, center_x - w//2   # difference in pixels; Y(+ve if above center), X(+ve if east of center)
+    person_lats, person_lons = get_location_offset_meters(original_lat=drone_lat, original_lon=drone_lon,
+                                                          dNorth=m_to_pixels_h*dY, dEast=m_to_pixels_w*dX)
+    return np.stack((person_lats, person_lons), axis=-1)
+
+def draw_locations(img, boxes, person_lats, person_lons, yaw=None):
+    '''
+    Writes the located coordinates next to each box, if yaw is given the north-up view is shown too.
+    '''
+    h, w = img.shape[0:2]
+    for box, person_lat, person_lon in zip(boxes, person_lats, person_lons):
         center_x, center_y = int(w*(box[3]+box[1])/2), int(h*(box[2]+box[0])/2)
-        dY, dX = h//2 - center_y, center_x - w//2   # difference in pixels; Y(+ve if above center), X(+ve if east of center)
-        print(f'yaw:{yaw}')
-        print(f'dX:{dX}, dY:{dY}')
-        dN_m, dE_m = m_to_pixels_h*dY, m_to_pixels_w*dX
-        print(f'dN_m:{dN_m}, dE_m:{dE_m}')
-        person_lat, person_lon = get_location_offset_meters(original_lat=drone_lat, original_lon=drone_lon, 
-                                                            dNorth=dN_m, dEast=dE_m)
-        print(f'A person is detected at:\n{person_lat}, {person_lon}')
         img = cv2.putText(img, f'lat:{person_lat}, lon:{person_lon}', (center_x,center_y), 
                           cv2.FONT_HERSHEY_COMPLEX_SMALL, 0.3, 
                           (255,255,255), 1)
-        person_lats.append(person_lat)
-        person_lons.append(person_lon)
-    cv2.imshow('rotated image', rotate_image(img, -yaw))
-    return person_lats, person_lons
+    if yaw is not None:
+        cv2.imshow('rotated image', rotate_image(img, 90 - yaw))
+    return img
+
+def localize_person(img, boxes, nums, alt=None, yaw=None, drone_lat=None, drone_lon=None,
+                    pose_history=None, timestamp=None, camera=None):
+    '''
+    The drone pose is either passed explicitly (alt, yaw, drone_lat, drone_lon) or interpolated
+    from pose_history (mavsdk_utils.PoseHistory) at the frame capture timestamp.
+    With a camera (camera_model.CameraModel) the gimbal angles and vehicle attitude are ray-cast
+    to the ground, otherwise the nadir triangle-similarity approximation is used.
+    Rendering is left to draw_locations().
+    '''
+    if pose_history is not None:
+        pose = pose_history.interpolate(timestamp)
+    else:
+        pose = {'lat': drone_lat, 'lon': drone_lon, 'alt': alt, 'yaw': yaw}
+    if camera is not None:
+        locations = camera.geolocate_boxes(boxes, img.shape, pose)
+    else:
+        locations = geolocate_boxes(boxes, img.shape, pose['alt'], pose['lat'], pose['lon'])
+    return list(locations[:, 0]), list(locations[:, 1])
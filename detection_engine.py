@@ -0,0 +1,188 @@
+import asyncio
+import queue
+import threading
+from time import time
+
+import numpy as np
+
+
+class DropOldestQueue(queue.Queue):
+    """Bounded queue that never blocks the producer.
+    When the queue is full the oldest item is discarded to make room for the new one,
+    so consumers always work on the most recent frames.
+    Attributes:
+        dropped (int): Number of items discarded so far
+        on_drop (callable): optional on_drop(item) called with every discarded item
+    """
+
+    def __init__(self, maxsize=2, on_drop=None):
+        super().__init__(maxsize=maxsize)
+        self.dropped = 0
+        self.on_drop = on_drop
+
+    def put_latest(self, item):
+        discarded = None
+        with self.mutex:
+            if 0 < self.maxsize <= self._qsize():
+                discarded = self._get()
+                self.dropped += 1
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+        if discarded is not None and self.on_drop is not None:
+            self.on_drop(discarded)
+
+
+class DetectionEngine():
+    """Pipelined producer/consumer detection engine
+    Capture, preprocessing, inference and post-processing each run on their own thread and are
+    connected by bounded drop-oldest queues, so preprocessing of frame N+1 overlaps inference of
+    frame N and a slow stage never backs up the camera. Results are handed to the asyncio event
+    loop, where telemetry dependent work (localization) runs without being blocked by inference.
+    Attributes:
+        capture (callable): capture(timeout) -> (seq, timestamp, frame) or None, e.g. Video.next_frame.
+            Frames are not copied, each one has to stay valid until it is released.
+        release (callable): optional release(seq), e.g. Video.release, called once a frame is dropped,
+            was consumed (the next result is requested) or is still queued when the engine stops
+        preprocess (callable): preprocess(frame) -> model input
+        infer (callable): infer(model_input) -> raw model outputs
+        postprocess (callable): postprocess(raw_outputs) -> detections
+        gate (callable): optional gate(frame, timestamp) -> bool, or per tile bool array handed to
+            preprocess(frame, active), e.g. a MotionGate. Frames it rejects skip preprocessing and
+            inference and are yielded with detections None, in order with the others.
+        queue_size (int): Capacity of every inter-stage queue
+        skipped (int): Number of frames rejected by the gate
+    """
+
+    def __init__(self, capture, preprocess, infer, postprocess, queue_size=2, gate=None, release=None):
+        self.capture = capture
+        self.release = release
+        self.preprocess = preprocess
+        self.infer = infer
+        self.postprocess = postprocess
+        self.queue_size = queue_size
+        self.gate = gate
+        self.skipped = 0
+
+        self._frames = DropOldestQueue(queue_size, on_drop=self._release)
+        self._inputs = DropOldestQueue(queue_size, on_drop=self._release)
+        self._outputs = DropOldestQueue(queue_size, on_drop=self._release)
+        self._results = None
+        self._loop = None
+        self._stop = threading.Event()
+        self._threads = []
+        self._results_dropped = 0
+
+    def start(self, loop=None):
+        """ Start all pipeline stages
+        Args:
+            loop (asyncio loop, optional): loop that consumes results, defaults to the current loop
+        """
+        self._loop = loop or asyncio.get_event_loop()
+        self._results = asyncio.Queue(maxsize=self.queue_size)
+        self._stop.clear()
+        stages = [self._capture_stage, self._preprocess_stage, self._infer_stage, self._postprocess_stage]
+        self._threads = [threading.Thread(target=stage, daemon=True) for stage in stages]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """ Signal all stages to finish and wait for them """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+        for q in (self._frames, self._inputs, self._outputs):
+            while not q.empty():
+                self._release(q.get_nowait())
+        while self._results is not None and not self._results.empty():
+            self._release(self._results.get_nowait())
+
+    @property
+    def dropped(self):
+        """ Total number of frames discarded by backpressure """
+        return self._frames.dropped + self._inputs.dropped + self._outputs.dropped + self._results_dropped
+
+    def _release(self, item):
+        if self.release is not None:
+            self.release(item['seq'])
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _capture_stage(self):
+        while not self._stop.is_set():
+            captured = self.capture(timeout=0.1)
+            if captured is None:
+                continue
+            seq, timestamp, frame = captured
+            # The item owns the frame (e.g. a slot of the Video ring) until it is released
+            self._frames.put_latest({'seq': seq, 'image': frame, 'timestamp': timestamp})
+
+    def _preprocess_stage(self):
+        while not self._stop.is_set():
+            item = self._get(self._frames)
+            if item is None:
+                break
+            active = True if self.gate is None else self.gate(item['image'], item['timestamp'])
+            item['active'] = active
+            item['skipped'] = not np.any(active)
+            if item['skipped']:
+                item['input'] = None
+                self.skipped += 1
+            elif np.ndim(active):
+                item['input'] = self.preprocess(item['image'], active)
+            else:
+                item['input'] = self.preprocess(item['image'])
+            self._inputs.put_latest(item)
+
+    def _infer_stage(self):
+        while not self._stop.is_set():
+            item = self._get(self._inputs)
+            if item is None:
+                break
+            t1 = time()
+            model_input = item.pop('input')
+            item['outputs'] = None if model_input is None else self.infer(model_input)
+            item['inference_time'] = time() - t1
+            self._outputs.put_latest(item)
+
+    def _postprocess_stage(self):
+        while not self._stop.is_set():
+            item = self._get(self._outputs)
+            if item is None:
+                break
+            outputs = item.pop('outputs')
+            item['detections'] = None if outputs is None else self.postprocess(outputs)
+            self._loop.call_soon_threadsafe(self._put_result, item)
+
+    def _put_result(self, item):
+        if self._stop.is_set():     # scheduled before stop() drained the results
+            self._release(item)
+            return
+        if self._results.full():
+            self._release(self._results.get_nowait())
+            self._results_dropped += 1
+        self._results.put_nowait(item)
+
+    async def results(self):
+        """ Async generator over processed frames, the oldest ones are dropped under backpressure
+        Yields:
+            dict: seq, image, timestamp, active (the gate decision), skipped, inference_time and
+                detections of a frame. The image is released when the next result is requested.
+        """
+        item = None
+        try:
+            while not self._stop.is_set():
+                item = await self._results.get()
+                yield item
+                self._release(item)
+                item = None
+        finally:
+            if item is not None:
+                self._release(item)
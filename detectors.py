@@ -0,0 +1,628 @@
+import os
+
+import cv2
+import numpy as np
+
+# Registry of detector backends, filled by the @register_detector decorator
+DETECTORS = {}
+
+
+def register_detector(*names):
+    """ Class decorator that makes a backend selectable by name(s) """
+    def decorator(cls):
+        for name in names:
+            DETECTORS[name] = cls
+        return cls
+    return decorator
+
+
+def list_detectors():
+    return sorted(DETECTORS)
+
+
+def get_detector(name, tiles=None, overlap=0.2, **kwargs):
+    """
+    Instantiate the backend registered as `name`, kwargs are passed to its constructor
+    tiles: (rows, cols) to run it on overlapping tiles of every frame (see TiledDetector)
+    """
+    if name not in DETECTORS:
+        raise ValueError(f'Unknown detector "{name}", choose one of: {", ".join(list_detectors())}')
+    detector = DETECTORS[name](name=name, **kwargs)
+    return detector if tiles is None else TiledDetector(detector, tiles, overlap)
+
+
+def category_index_from_names(names_file, first_id=0):
+    """ Builds a TF object-detection style category index {id: {'id', 'name'}} from a names file """
+    names = [c.strip() for c in open(names_file).readlines()]
+    return {i + first_id: {'id': i + first_id, 'name': name} for i, name in enumerate(names)}
+
+
+def category_index_from_labelmap(path_to_labels):
+    from utils import label_map_util
+    return label_map_util.create_category_index_from_labelmap(path_to_labels, use_display_name=True)
+
+
+def class_ids(category_index, names):
+    """ Ids of the category names (case insensitive, e.g. 'person' and OID's 'Person') """
+    ids = {category['name'].lower(): i for i, category in category_index.items()}
+    missing = [name for name in names if name.lower() not in ids]
+    if missing:
+        raise ValueError(f'Classes not in the label map: {", ".join(missing)}')
+    return sorted(ids[name.lower()] for name in names)
+
+
+def select_classes(boxes, scores, classes, nums, target_ids):
+    """ Keeps the detections of target_ids, still padded and in score order, for backends with in-graph NMS """
+    keep = np.isin(classes, target_ids) & (np.arange(classes.shape[1]) < np.reshape(nums, (-1, 1)))
+    order = np.argsort(~keep, axis=1, kind='stable')
+    keep = np.take_along_axis(keep, order, axis=1)
+    boxes = np.take_along_axis(boxes, order[..., None], axis=1)*keep[..., None]
+    scores = np.take_along_axis(scores, order, axis=1)*keep
+    classes = np.take_along_axis(classes, order, axis=1)*keep
+    return boxes, scores, classes, keep.sum(axis=1).astype(np.int32)
+
+
+class Detector():
+    """Detector backend interface
+    Every backend returns detections in the same format: normalized [top, left, bottom, right]
+    boxes, scores, integer class ids of `category_index` and the number of valid detections,
+    batched along the first axis.
+    Attributes:
+        name (str): registry name of the backend
+        category_index (dict): {class id: {'id', 'name'}}
+        person_class (int): class id of 'person' in category_index
+        confidence (float): default score threshold for this backend
+        target_classes (list): names of the classes to detect (e.g. ['person']), None for all.
+            Backends prune the head / NMS to them where the model allows it and filter otherwise.
+    """
+
+    person_class = 1
+    confidence = 0.5
+
+    def __init__(self, name=None, target_classes=None):
+        self.name = name
+        self.target_classes = target_classes
+        self.target_ids = None
+        self.category_index = {}
+
+    def load(self):
+        """ Load the model, must be called before detect() """
+        raise NotImplementedError
+
+    def warmup(self, shape=(480, 640, 3), runs=2):
+        """ Run a few dummy batches so graph building/allocation is not paid on the first frame """
+        batch = np.zeros((1,) + tuple(shape), dtype=np.uint8)
+        for _ in range(runs):
+            self.detect(batch)
+
+    def preprocess(self, frames):
+        """ (N,H,W,3) uint8 BGR frames -> model input """
+        return frames
+
+    def infer(self, inputs):
+        """ model input -> (boxes, scores, classes, nums) as NumPy arrays """
+        raise NotImplementedError
+
+    def filter_classes(self, outputs):
+        """ Drops the detections that are not target classes, when the model could not be pruned """
+        if self.target_ids is None:
+            return outputs
+        return select_classes(*outputs, self.target_ids)
+
+    def detect(self, frames):
+        """ (N,H,W,3) uint8 BGR frames -> (boxes (N,K,4), scores (N,K), classes (N,K), nums (N,)) """
+        return self.infer(self.preprocess(frames))
+
+
+@register_detector('yolo', 'yolo-tiny')
+class YoloDetector(Detector):
+    """ YOLOv3 / YOLOv3-Tiny with the TF2 yolov3_tf2 implementation """
+
+    person_class = 0
+    confidence = 0.2
+
+    def __init__(self, name='yolo-tiny', weights=None, classes_file='./yolo_data/coco.names',
+                 num_classes=80, size=416, compiled=True, jit_compile=False, target_classes=None,
+                 pruned_weights=False, batch_size=1):
+        super().__init__(name, target_classes)
+        self.tiny = name == 'yolo-tiny'
+        if weights is None:
+            weights = './checkpoints/yolov3-tiny.tf' if self.tiny else './checkpoints/yolov3.tf'
+        self.weights = weights
+        self.classes_file = classes_file
+        self.num_classes = num_classes
+        self.size = size
+        self.compiled = compiled
+        self.jit_compile = jit_compile
+        self.pruned_weights = pruned_weights
+        self.batch_size = batch_size
+        self.model = None
+
+    def load(self):
+        import tensorflow as tf
+        self.category_index = category_index_from_names(self.classes_file)
+        if self.target_classes is not None:
+            self.target_ids = class_ids(self.category_index, self.target_classes)
+        physical_devices = tf.config.experimental.list_physical_devices('GPU')
+        if len(physical_devices) > 0:
+            tf.config.experimental.set_memory_growth(physical_devices[0], True)
+        if self.compiled:
+            # Resize, normalization, forward pass and NMS in one traced graph
+            from yolov3_tf2.inference import YoloInference
+            # The head is pruned to the target classes, nothing is left to filter afterwards
+            self.model = YoloInference(self.weights, tiny=self.tiny, classes=self.num_classes,
+                                       size=self.size, batch_size=self.batch_size, jit_compile=self.jit_compile,
+                                       target_classes=self.target_ids, pruned_weights=self.pruned_weights)
+        else:
+            from yolov3_tf2.models import YoloV3, YoloV3Tiny
+            self.model = YoloV3Tiny(classes=self.num_classes) if self.tiny else YoloV3(classes=self.num_classes)
+            self.model.load_weights(self.weights)
+        print('weights loaded')
+        print('classes loaded')
+
+    def preprocess(self, frames):
+        if self.compiled:
+            return frames   # done inside the compiled graph
+        import tensorflow as tf
+        frames = np.ascontiguousarray(frames[..., ::-1])    # BGR -> RGB
+        return transform_images_for_yolo(tf.convert_to_tensor(frames), self.size)
+
+    def infer(self, inputs):
+        if self.compiled:
+            boxes, scores, classes, nums = self.model(inputs)
+        else:
+            boxes, scores, classes, nums = self.model.predict(inputs)
+        # yolov3_tf2 boxes are [x1, y1, x2, y2]
+        boxes = np.asarray(boxes)[..., [1, 0, 3, 2]]
+        outputs = boxes, np.asarray(scores), np.asarray(classes).astype(np.int32), np.asarray(nums)
+        return outputs if self.compiled else self.filter_classes(outputs)
+
+
+def transform_images_for_yolo(x_train, size):
+    import tensorflow as tf
+    x_train = tf.image.resize(x_train, (size, size))
+    x_train = x_train / 255
+    return x_train
+
+
+SSD_OUTPUTS = ['detection_boxes:0', 'detection_scores:0', 'detection_classes:0', 'num_detections:0']
+# Decoded boxes and per-class scores (background in column 0) before the Postprocessor's multiclass NMS
+RAW_OUTPUTS = ['raw_detection_boxes:0', 'raw_detection_scores:0']
+
+
+class SsdInference():
+    """Prepared inference on a frozen object-detection graph
+    The input/output tensors are resolved once and the graph is run through a callable, either
+    Session.make_callable (mode='session') or a pruned TF2 concrete function (mode='function'),
+    so no graph lookups or feed_dict building happen per frame.
+    Attributes:
+        graph_def (GraphDef): the frozen graph
+        batch_size (int): if set, every batch is zero padded to this size so the graph always
+            sees the same input shape (needed by TensorRT engines built for a fixed batch)
+        target_classes (list): label map ids to detect. If the graph exports its raw outputs, only
+            those are fetched, so the 90/600-class multiclass NMS never runs and the target columns
+            go through NumPy NMS instead; older graphs are filtered after their NMS.
+        raw (bool): the raw outputs are used
+    """
+
+    def __init__(self, graph_def, mode='session', batch_size=None, config=None, target_classes=None,
+                 iou_threshold=0.6, score_threshold=0.01, max_detections=100):
+        import tensorflow as tf
+        self.graph_def = graph_def
+        self.mode = mode
+        self.batch_size = batch_size
+        self.target_classes = None if target_classes is None else list(target_classes)
+        self.iou_threshold = iou_threshold
+        self.score_threshold = score_threshold
+        self.max_detections = max_detections
+        nodes = {node.name for node in graph_def.node}
+        self.raw = self.target_classes is not None and all(name[:-2] in nodes for name in RAW_OUTPUTS)
+        fetches = RAW_OUTPUTS if self.raw else SSD_OUTPUTS
+        if mode == 'session':
+            self.graph = tf.Graph()
+            with self.graph.as_default():
+                tf.import_graph_def(graph_def, name='')
+            self.sess = tf.compat.v1.Session(graph=self.graph, config=config)
+            image_tensor = self.graph.get_tensor_by_name('image_tensor:0')
+            output_tensors = [self.graph.get_tensor_by_name(name) for name in fetches]
+            self._run = self.sess.make_callable(output_tensors, feed_list=[image_tensor])
+        elif mode == 'function':
+            wrapped = tf.compat.v1.wrap_function(lambda: tf.import_graph_def(graph_def, name=''), [])
+            self.graph = wrapped.graph
+            self.sess = None
+            function = wrapped.prune(feeds='image_tensor:0', fetches=fetches)
+            self._run = lambda images: [output.numpy() for output in function(tf.constant(images))]
+        else:
+            raise ValueError(f'Unknown SSD inference mode "{mode}"')
+
+    def __call__(self, images):
+        """ (N,H,W,3) uint8 images -> [boxes, scores, classes, num_detections] """
+        if self.batch_size is None:
+            outputs = self._run(images)
+        else:
+            outputs = [self._run_fixed(images[i:i + self.batch_size])
+                       for i in range(0, len(images), self.batch_size)]
+            outputs = [np.concatenate(output) for output in zip(*outputs)]
+        if self.raw:
+            return self._nms(*outputs)
+        if self.target_classes is not None:
+            boxes, scores, classes, nums = outputs
+            return select_classes(boxes, scores, classes, nums.astype(np.int32), self.target_classes)
+        return outputs
+
+    def _nms(self, boxes, scores):
+        """ NMS of the target class columns only, one candidate per anchor and target class """
+        from utils.np_nms_ops import batched_non_max_suppression
+        k = len(self.target_classes)
+        scores = scores[..., self.target_classes].reshape(len(scores), -1)
+        boxes = np.repeat(boxes, k, axis=1)
+        classes = np.resize(np.asarray(self.target_classes, dtype=np.float32), scores.shape)
+        return list(batched_non_max_suppression(boxes, scores, classes, self.iou_threshold,
+                                                self.score_threshold, self.max_detections))
+
+    def _run_fixed(self, images):
+        n = len(images)
+        if n < self.batch_size:
+            padding = np.zeros((self.batch_size - n,) + images.shape[1:], dtype=images.dtype)
+            images = np.concatenate((images, padding))
+        return [output[:n] for output in self._run(images)]
+
+    def close(self):
+        if self.sess is not None:
+            self.sess.close()
+
+
+def initialize_ssd_detector(model_name='trt_ssdlite', path_to_labels=os.path.join('data', 'mscoco_label_map.pbtxt'),
+                            mode='session', batch_size=None, config=None, target_classes=None):
+    """ target_classes: class names of the label map to detect, None for all """
+    import tensorflow as tf
+    PATH_TO_FROZEN_GRAPH = model_name + '/frozen_inference_graph.pb'
+    od_graph_def = tf.compat.v1.GraphDef()
+    with tf.io.gfile.GFile(PATH_TO_FROZEN_GRAPH, 'rb') as fid:
+        serialized_graph = fid.read()
+        od_graph_def.ParseFromString(serialized_graph)
+    category_index = category_index_from_labelmap(path_to_labels)
+    target_ids = None if target_classes is None else class_ids(category_index, target_classes)
+    inference = SsdInference(od_graph_def, mode=mode, batch_size=batch_size, config=config, target_classes=target_ids)
+    return inference, category_index
+
+
+@register_detector('ssd')
+class SsdFrozenGraphDetector(Detector):
+    """ Frozen TF1 object-detection API graph (SSD-MobileNet, SSDlite, TensorRT optimized SSDlite) """
+
+    def __init__(self, name='ssd', model_name='trt_ssdlite',
+                 labels=os.path.join('data', 'mscoco_label_map.pbtxt'), mode='session', batch_size=None,
+                 target_classes=None):
+        super().__init__(name, target_classes)
+        self.model_name = model_name
+        self.labels = labels
+        self.mode = mode
+        self.batch_size = batch_size
+        self.inference = None
+
+    def load(self):
+        import tensorflow as tf
+        config = tf.compat.v1.ConfigProto()
+        config.gpu_options.allow_growth = True
+        self.inference, self.category_index = initialize_ssd_detector(self.model_name, self.labels, mode=self.mode,
+                                                                      batch_size=self.batch_size, config=config,
+                                                                      target_classes=self.target_classes)
+
+    def infer(self, inputs):
+        boxes, scores, classes, nums = self.inference(inputs)
+        return boxes, scores, classes.astype(np.int32), nums.astype(np.int32)
+
+
+@register_detector('onnx')
+class OnnxDetector(Detector):
+    """ ONNX Runtime CPU backend for exported object-detection models
+    The model is expected to take a uint8 (N,H,W,3) RGB image and to return the
+    object-detection API outputs (detection_boxes, detection_scores, detection_classes,
+    num_detections), e.g. a tf2onnx conversion of one of the SSD frozen graphs.
+    """
+
+    def __init__(self, name='onnx', model_path='ssdlite_mobilenet_v2_coco_2018_05_09/model.onnx',
+                 labels=os.path.join('data', 'mscoco_label_map.pbtxt'), input_size=None,
+                 output_names=('detection_boxes:0', 'detection_scores:0', 'detection_classes:0', 'num_detections:0'),
+                 num_threads=0, target_classes=None):
+        super().__init__(name, target_classes)
+        self.model_path = model_path
+        self.labels = labels
+        self.input_size = input_size
+        self.output_names = list(output_names)
+        self.num_threads = num_threads
+        self.session = None
+
+    def load(self):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        self.session = ort.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = np.float32 if 'float' in model_input.type else np.uint8
+        self.category_index = category_index_from_labelmap(self.labels)
+        if self.target_classes is not None:
+            self.target_ids = class_ids(self.category_index, self.target_classes)
+
+    def preprocess(self, frames):
+        frames = frames[..., ::-1]     # BGR -> RGB
+        if self.input_size is not None:
+            frames = np.stack([cv2.resize(frame, self.input_size) for frame in frames])
+        return np.ascontiguousarray(frames, dtype=self.input_dtype)
+
+    def infer(self, inputs):
+        boxes, scores, classes, nums = self.session.run(self.output_names, {self.input_name: inputs})
+        return self.filter_classes((boxes, scores, classes.astype(np.int32), nums.astype(np.int32)))
+
+
+def _tflite_input(frames, details):
+    """ Float model input -> input tensor of a TFLite model, quantized with the scale and zero point
+    the converter calibrated for it (q = x/scale + zero_point) when the input is integer """
+    scale, zero_point = details['quantization']
+    if scale:
+        # Saturate like the converter does, a value past the calibrated range must not wrap around
+        info = np.iinfo(details['dtype'])
+        frames = np.clip(np.round(frames/scale + zero_point), info.min, info.max)
+    return frames.astype(details['dtype'])
+
+
+@register_detector('tflite')
+class TfliteDetector(Detector):
+    """ TFLite CPU backend for SSD models exported with the TFLite_Detection_PostProcess op
+    Uses tflite_runtime when installed (Jetson / Raspberry Pi), TensorFlow's interpreter otherwise.
+    The post-processing op returns 0-based classes, class_offset maps them onto the label map ids.
+    """
+
+    def __init__(self, name='tflite', model_path='ssdlite_mobilenet_v2_coco_2018_05_09/model.tflite',
+                 labels=os.path.join('data', 'mscoco_label_map.pbtxt'), class_offset=1, num_threads=None,
+                 target_classes=None):
+        super().__init__(name, target_classes)
+        self.model_path = model_path
+        self.labels = labels
+        self.class_offset = class_offset
+        self.num_threads = num_threads
+        self.interpreter = None
+
+    def load(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.interpreter = Interpreter(model_path=self.model_path, num_threads=self.num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()
+        self.category_index = category_index_from_labelmap(self.labels)
+        if self.target_classes is not None:
+            self.target_ids = class_ids(self.category_index, self.target_classes)
+
+    def preprocess(self, frames):
+        _, height, width, _ = self.input_details['shape']
+        frames = np.stack([cv2.resize(frame[..., ::-1], (width, height)) for frame in frames])
+        if self.input_details['dtype'] != np.float32 and not self.input_details['quantization'][0]:
+            return frames.astype(self.input_details['dtype'])     # integer input without quantization: raw pixels
+        return _tflite_input((frames.astype(np.float32) - 127.5)/127.5, self.input_details)
+
+    def infer(self, inputs):
+        results = []
+        # The interpreter has a fixed batch of one
+        for image in inputs:
+            self.interpreter.set_tensor(self.input_details['index'], image[None])
+            self.interpreter.invoke()
+            boxes, classes, scores, nums = [self.interpreter.get_tensor(output['index'])
+                                            for output in self.output_details[0:4]]
+            results.append((boxes[0], scores[0], classes[0].astype(np.int32) + self.class_offset, int(nums[0])))
+        boxes, scores, classes, nums = zip(*results)
+        return self.filter_classes((np.stack(boxes), np.stack(scores), np.stack(classes), np.array(nums, dtype=np.int32)))
+
+
+# Anchors of yolov3_tf2.models, repeated so that the TFLite backend runs without TensorFlow
+YOLO_ANCHORS = np.array([(10, 13), (16, 30), (33, 23), (30, 61), (62, 45), (59, 119),
+                         (116, 90), (156, 198), (373, 326)], np.float32) / 416
+YOLO_ANCHOR_MASKS = [[6, 7, 8], [3, 4, 5], [0, 1, 2]]
+YOLO_TINY_ANCHORS = np.array([(10, 14), (23, 27), (37, 58), (81, 82), (135, 169), (344, 319)], np.float32) / 416
+YOLO_TINY_ANCHOR_MASKS = [[3, 4, 5], [0, 1, 2]]
+
+
+def _sigmoid(x):
+    return 1/(1 + np.exp(-x))
+
+
+def yolo_decode_numpy(outputs, anchors, masks):
+    """ yolov3_tf2.inference.yolo_decode in NumPy
+    Raw (N,g,g,anchors,5+classes) heads -> (N,boxes,4) [x1, y1, x2, y2], (N,boxes,classes) scores """
+    bbox, scores = [], []
+    for output, mask in zip(outputs, masks):
+        batch, grid_h, grid_w = output.shape[0:3]
+        grid = np.stack(np.meshgrid(np.arange(grid_w), np.arange(grid_h)), axis=-1)[:, :, None, :]
+        box_xy = (_sigmoid(output[..., 0:2]) + grid)/(grid_w, grid_h)
+        box_wh = np.exp(output[..., 2:4])*anchors[mask]
+        box = np.concatenate((box_xy - box_wh/2, box_xy + box_wh/2), axis=-1)
+        bbox.append(box.reshape(batch, -1, 4))
+        scores.append((_sigmoid(output[..., 4:5])*_sigmoid(output[..., 5:])).reshape(batch, -1, output.shape[-1] - 5))
+    return np.concatenate(bbox, axis=1), np.concatenate(scores, axis=1)
+
+
+@register_detector('yolo-tflite')
+class YoloTfliteDetector(Detector):
+    """ YOLOv3 / YOLOv3-Tiny TFLite CPU backend, e.g. the INT8 models written by quantize.py
+    The model returns the raw heads (2 for tiny, 3 for YOLOv3), decoding and class-aware NMS run in
+    NumPy. Heads exported with fewer classes than the names file are pruned to target_classes.
+    """
+
+    person_class = 0
+    confidence = 0.2
+
+    def __init__(self, name='yolo-tflite', model_path='./checkpoints/yolov3-tiny_int8.tflite',
+                 classes_file='./yolo_data/coco.names', num_threads=None, max_boxes=100,
+                 iou_threshold=0.5, score_threshold=0.5, target_classes=None):
+        super().__init__(name, target_classes)
+        self.model_path = model_path
+        self.classes_file = classes_file
+        self.num_threads = num_threads
+        self.max_boxes = max_boxes
+        self.iou_threshold = iou_threshold
+        self.score_threshold = score_threshold
+        self.interpreter = None
+
+    def load(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.interpreter = Interpreter(model_path=self.model_path, num_threads=self.num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        # Coarsest grid first, in the order of the anchor masks
+        self.output_details = sorted(self.interpreter.get_output_details(), key=lambda output: output['shape'][1])
+        tiny = len(self.output_details) == 2
+        self.anchors = YOLO_TINY_ANCHORS if tiny else YOLO_ANCHORS
+        self.masks = YOLO_TINY_ANCHOR_MASKS if tiny else YOLO_ANCHOR_MASKS
+        self.category_index = category_index_from_names(self.classes_file)
+        if self.target_classes is not None:
+            self.target_ids = class_ids(self.category_index, self.target_classes)
+        head_classes = self.output_details[0]['shape'][-1] - 5
+        self.head_ids = np.arange(head_classes)
+        if head_classes < len(self.category_index):
+            if self.target_ids is None or len(self.target_ids) != head_classes:
+                raise ValueError(f'{self.model_path} predicts {head_classes} classes, give the target_classes it was pruned to')
+            self.head_ids, self.target_ids = np.array(self.target_ids), None
+
+    def preprocess(self, frames):
+        _, height, width, _ = self.input_details['shape']
+        frames = np.stack([cv2.resize(frame[..., ::-1], (width, height)) for frame in frames]).astype(np.float32)/255
+        return _tflite_input(frames, self.input_details)
+
+    def _output(self, output):
+        value = self.interpreter.get_tensor(output['index'])
+        scale, zero_point = output['quantization']
+        return (value.astype(np.float32) - zero_point)*scale if scale else value
+
+    def infer(self, inputs):
+        from utils.np_nms_ops import batched_non_max_suppression
+        heads = [[] for _ in self.output_details]
+        # The interpreter has a fixed batch of one
+        for image in inputs:
+            self.interpreter.set_tensor(self.input_details['index'], image[None])
+            self.interpreter.invoke()
+            for head, output in zip(heads, self.output_details):
+                head.append(self._output(output))
+        boxes, scores = yolo_decode_numpy([np.concatenate(head) for head in heads], self.anchors, self.masks)
+        # Like combined_non_max_suppression: one candidate per box and class above the threshold
+        candidates = scores >= self.score_threshold
+        counts = candidates.sum(axis=(1, 2))
+        size = max(int(counts.max()), 1)
+        candidate_boxes = np.zeros((len(boxes), size, 4), dtype=np.float32)
+        candidate_scores = np.full((len(boxes), size), -1, dtype=np.float32)
+        candidate_classes = np.zeros((len(boxes), size), dtype=np.int32)
+        for i in range(len(boxes)):
+            box, cls = np.nonzero(candidates[i])
+            candidate_boxes[i, :len(box)], candidate_scores[i, :len(box)] = boxes[i, box], scores[i, box, cls]
+            candidate_classes[i, :len(box)] = self.head_ids[cls]
+        boxes, scores, classes, nums = batched_non_max_suppression(candidate_boxes, candidate_scores, candidate_classes,
+                                                                   self.iou_threshold, 0.0, self.max_boxes)
+        # [x1, y1, x2, y2] -> [top, left, bottom, right]
+        return self.filter_classes((boxes[..., [1, 0, 3, 2]], scores, classes, nums))
+
+
+def tile_layout(shape, tiles=(2, 2), overlap=0.2):
+    """
+    Overlapping tiles covering a (H, W) frame
+    Returns:
+        (N,4) int array of [top, left, bottom, right] pixel bounds, all tiles have the same size
+    """
+    height, width = shape[0:2]
+    bounds = []
+    for size, n in ((height, tiles[0]), (width, tiles[1])):
+        tile = int(np.ceil(size/(n - (n - 1)*overlap))) if n > 1 else size
+        starts = np.linspace(0, size - tile, n).round().astype(np.int64)
+        bounds.append(np.stack((starts, starts + tile), axis=-1))
+    rows, cols = bounds
+    return np.array([[top, left, bottom, right] for top, bottom in rows for left, right in cols])
+
+
+def tile_regions(shape, active, tiles=(2, 2), overlap=0.2):
+    """ Normalized [top, left, bottom, right] bounds of the active tiles of a (H, W) frame """
+    height, width = shape[0:2]
+    layout = tile_layout(shape, tiles, overlap)
+    return layout[np.asarray(active, dtype=bool)].astype(np.float64)/(height, width, height, width)
+
+class TiledDetector(Detector):
+    """Sliced inference for small targets
+    Every frame is split into overlapping tiles that go through the wrapped backend as one batch,
+    so a person a few pixels wide is not lost when the backend resizes its input (e.g. 416x416 for
+    YOLO). With full_frame the downscaled frame is added as one more tile for large objects. The
+    tile boxes are mapped back to normalized full-frame coordinates and merged with class-aware NMS.
+    preprocess() can be limited to the active tiles of a MotionGate.
+    Attributes:
+        detector (Detector): wrapped backend
+        tiles (tuple): (rows, cols) of tiles
+        overlap (float): fraction of a tile shared with its neighbour, should exceed the target size
+    """
+
+    def __init__(self, detector, tiles=(2, 2), overlap=0.2, full_frame=False, iou_threshold=0.5, max_detections=100):
+        super().__init__(detector.name, detector.target_classes)
+        self.detector = detector
+        self.tiles = tuple(tiles)
+        self.overlap = overlap
+        self.full_frame = full_frame
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+        self.layout = None
+        self._shape = None
+        # Backends with a static batch (compiled YOLO) get one slot per tile
+        if getattr(detector, 'batch_size', None) is not None:
+            detector.batch_size = len(tile_layout((1, 1), self.tiles)) + int(full_frame)
+
+    @property
+    def person_class(self):
+        return self.detector.person_class
+
+    @property
+    def confidence(self):
+        return self.detector.confidence
+
+    def load(self):
+        self.detector.load()
+        self.category_index = self.detector.category_index
+
+    def preprocess(self, frames, active=None):
+        """ active: optional bool per tile (e.g. from a MotionGate), the other tiles are not run """
+        if self._shape != frames.shape[1:3]:
+            self._shape = frames.shape[1:3]
+            self.layout = tile_layout(self._shape, self.tiles, self.overlap)
+        active = np.ones(len(self.layout), dtype=bool) if active is None else np.asarray(active, dtype=bool)
+        tile_h, tile_w = self.layout[0, 2:] - self.layout[0, :2]
+        tiles = []
+        for frame in frames:
+            tiles += [frame[top:bottom, left:right] for (top, left, bottom, right), run in zip(self.layout, active) if run]
+            if self.full_frame:
+                tiles.append(cv2.resize(frame, (int(tile_w), int(tile_h))))
+        count = len(tiles)
+        batch_size = getattr(self.detector, 'batch_size', None)
+        if batch_size is not None and count < batch_size:     # static batch, pad with blank tiles
+            tiles += [np.zeros_like(tiles[0])]*(batch_size - count)
+        return self.detector.preprocess(np.stack(tiles)), active, count
+
+    def infer(self, inputs):
+        from utils.np_nms_ops import batched_non_max_suppression
+        inputs, active, count = inputs
+        boxes, scores, classes, nums = [np.asarray(output)[:count] for output in self.detector.infer(inputs)]
+        height, width = self._shape
+        bounds = self.layout[active].astype(np.float64)/(height, width, height, width)
+        if self.full_frame:
+            bounds = np.concatenate((bounds, [[0, 0, 1, 1]]))
+        n_tiles = len(bounds)
+        # Tile-normalized -> frame-normalized, bounds broadcast over the K boxes of each tile
+        boxes = np.asarray(boxes).reshape((-1, n_tiles) + np.shape(boxes)[1:])
+        origin, extent = bounds[:, None, 0:2], bounds[:, None, 2:4] - bounds[:, None, 0:2]
+        boxes = np.concatenate((origin + boxes[..., 0:2]*extent, origin + boxes[..., 2:4]*extent), axis=-1)
+        valid = np.arange(np.shape(scores)[1]) < np.reshape(nums, (-1, 1))
+        scores = np.where(valid, scores, -1).reshape(len(boxes), -1)
+        return batched_non_max_suppression(boxes.reshape(len(boxes), -1, 4), scores,
+                                           np.reshape(classes, (len(boxes), -1)), self.iou_threshold,
+                                           0.0, self.max_detections)
@@ -0,0 +1,65 @@
+"""Tests for the NumPy parts of the detector backends."""
+import unittest
+
+import numpy as np
+
+from detectors import TfliteDetector, YoloTfliteDetector, yolo_decode_numpy
+
+
+def _logit(p):
+    return np.log(p/(1 - p))
+
+
+class YoloDecodeTest(unittest.TestCase):
+
+    def test_decode(self):
+        anchors = np.array([(0.1, 0.2), (0.3, 0.4), (0.5, 0.6)])
+        masks = [np.array([2]), np.array([0, 1])]
+        # 1x1 grid with one anchor and 2x2 grid with two anchors, 2 classes
+        coarse = np.zeros((1, 1, 1, 1, 7))
+        coarse[0, 0, 0, 0] = [0, 0, 0, 0, _logit(0.5), _logit(0.8), _logit(0.2)]
+        fine = np.zeros((1, 2, 2, 2, 7))
+        # row 1, col 0, second anchor: center (0.25, 0.75) + offsets, twice the anchor size
+        fine[0, 1, 0, 1] = [_logit(0.5), _logit(0.5), np.log(2), np.log(2), _logit(0.9), _logit(0.5), _logit(0.1)]
+        boxes, scores = yolo_decode_numpy([coarse, fine], anchors, masks)
+        self.assertEqual(boxes.shape, (1, 1 + 8, 4))
+        self.assertEqual(scores.shape, (1, 1 + 8, 2))
+        np.testing.assert_allclose(boxes[0, 0], [0.25, 0.2, 0.75, 0.8])
+        np.testing.assert_allclose(scores[0, 0], [0.4, 0.1])
+        # cells are ordered row, col, anchor
+        index = 1 + (1*2 + 0)*2 + 1
+        np.testing.assert_allclose(boxes[0, index], [0.25 - 0.3, 0.75 - 0.4, 0.25 + 0.3, 0.75 + 0.4])
+        np.testing.assert_allclose(scores[0, index], [0.45, 0.09])
+
+
+class TfliteInputTest(unittest.TestCase):
+
+    def _preprocess(self, backend, frame, quantization, dtype=np.uint8):
+        detector = object.__new__(backend)
+        detector.input_details = {'shape': (1,) + frame.shape, 'quantization': quantization, 'dtype': dtype}
+        return detector.preprocess(frame[None])[0]
+
+    def test_quantized_ssd_input(self):
+        frame = np.arange(256, dtype=np.uint8).reshape(16, 16, 1).repeat(3, axis=-1)
+        # Calibrated on pixels 64..191: (x - 127.5)/127.5 in [-0.5, 0.5]
+        scale, zero_point = 1/255, 128
+        q = self._preprocess(TfliteDetector, frame, (scale, zero_point)).astype(float)
+        pixels = (q - zero_point)*scale*127.5 + 127.5
+        expected = np.clip(frame, 64, 191)
+        self.assertLessEqual(np.abs(pixels - expected).max(), 0.5 + 1e-6)
+
+    def test_unquantized_inputs(self):
+        frame = np.random.default_rng(0).integers(0, 256, (8, 8, 3)).astype(np.uint8)
+        np.testing.assert_array_equal(self._preprocess(TfliteDetector, frame, (0.0, 0)), frame[..., ::-1])
+        normalized = self._preprocess(TfliteDetector, frame, (0.0, 0), np.float32)
+        np.testing.assert_allclose(normalized, (frame[..., ::-1] - 127.5)/127.5, rtol=1e-6)
+
+    def test_yolo_input_saturates(self):
+        frame = np.full((8, 8, 3), 255, dtype=np.uint8)
+        # int8 input calibrated on [0, 0.5]: brighter pixels saturate instead of wrapping around
+        q = self._preprocess(YoloTfliteDetector, frame, (0.5/255, -128), np.int8)
+        self.assertTrue((q == 127).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import hashlib
+import os
+
+import cv2
+import numpy as np
+
+try:
+    from scipy.ndimage import distance_transform_edt
+except ImportError:     # scipy is optional, OpenCV's transform assumes square cells
+    distance_transform_edt = None
+
+CACHE_DIR = 'default'       # $UAV_PLANNING_CACHE, or ~/.cache/uav_planning when it is not set
+CACHE_ENV = 'UAV_PLANNING_CACHE'
+_memory = {}        # grid hash -> field, shared by every query of this process
+MEMORY_SIZE = 8
+
+
+def grid_hash(grid, cell_size=1.0):
+    ''' Key of an occupancy grid (1 = obstacle) and its cell size '''
+    blocked = np.packbits(np.asarray(grid) == 1)
+    key = hashlib.sha1(blocked.tobytes())
+    key.update(repr((np.shape(grid), np.round(np.broadcast_to(cell_size, 2), 9).tolist())).encode())
+    return key.hexdigest()
+
+def cache_directory(cache_dir=CACHE_DIR):
+    ''' Disk cache directory of the fields, None when the disk cache is disabled (also by an empty $UAV_PLANNING_CACHE) '''
+    if cache_dir != CACHE_DIR:
+        return cache_dir
+    return os.environ.get(CACHE_ENV, os.path.join(os.path.expanduser('~'), '.cache', 'uav_planning')) or None
+
+def _compute(grid, cell_size):
+    free = np.asarray(grid) != 1
+    if free.all():
+        return np.full(free.shape, np.inf, dtype=np.float32)
+    cell_h, cell_w = np.broadcast_to(cell_size, 2)
+    if distance_transform_edt is not None:
+        return distance_transform_edt(free, sampling=(cell_h, cell_w)).astype(np.float32)
+    field = cv2.distanceTransform(free.astype(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+    return field*np.float32(np.sqrt(cell_h*cell_w))
+
+def distance_field(grid, cell_size=1.0, cache_dir=CACHE_DIR):
+    '''
+    Euclidean distance (in the unit of cell_size) from every cell to the nearest obstacle, 0 on obstacles
+    Fields are cached in memory and as .npy files in cache_dir (None disables the disk cache) under
+    the hash of the grid, so repeated queries on the same map reuse them. The returned field is
+    shared by those queries, so it is read-only.
+    cell_size: a number or (height, width) of a cell, e.g. GeoGrid.cell_size
+    '''
+    key = grid_hash(grid, cell_size)
+    if key in _memory:
+        return _memory[key]
+    cache_dir = cache_directory(cache_dir)
+    path = None if cache_dir is None else os.path.join(cache_dir, key + '.npy')
+    if path is not None and os.path.exists(path):
+        field = np.load(path)
+    else:
+        field = _compute(grid, cell_size)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(path + '.tmp.npy', field)
+            os.replace(path + '.tmp.npy', path)     # other processes never see a partial file
+    field.setflags(write=False)
+    if len(_memory) >= MEMORY_SIZE:
+        _memory.pop(next(iter(_memory)))
+    _memory[key] = field
+    return field
+
+def inflate(grid, margin, cell_size=1.0, cache_dir=CACHE_DIR):
+    '''
+    Occupancy grid with every cell closer than `margin` to an obstacle blocked as well
+    '''
+    if margin <= 0:
+        return np.asarray(grid).copy()
+    blocked = distance_field(grid, cell_size, cache_dir) < margin
+    return blocked.astype(np.asarray(grid).dtype)
+
+def clearance_cost(grid, safe_distance=5.0, weight=1.0, cell_size=1.0, cache_dir=CACHE_DIR):
+    '''
+    Extra cost of entering each cell, growing linearly from 0 at safe_distance to `weight` next to
+    an obstacle, so planners keep away from no-fly zone edges when there is room
+    '''
+    field = distance_field(grid, cell_size, cache_dir)
+    return weight*np.clip(1 - field/safe_distance, 0, 1)
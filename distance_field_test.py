@@ -0,0 +1,114 @@
+"""Tests for distance_field, the cached obstacle distance transform and its derived grids."""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import distance_field
+from distance_field import clearance_cost, grid_hash, inflate
+
+
+def _brute_force(grid, cell_size):
+    cell_h, cell_w = np.broadcast_to(cell_size, 2)
+    obstacles = np.argwhere(grid == 1)*(cell_h, cell_w)
+    cells = np.argwhere(np.ones(grid.shape, dtype=bool))*(cell_h, cell_w)
+    distance = np.linalg.norm(cells[:, None] - obstacles[None], axis=-1).min(axis=1)
+    return distance.reshape(grid.shape)
+
+
+class DistanceFieldTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.grid = (rng.random((40, 50)) < 0.02).astype(np.uint8)
+        distance_field._memory.clear()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        distance_field._memory.clear()
+        self.directory.cleanup()
+
+    def test_matches_brute_force(self):
+        field = distance_field.distance_field(self.grid, cache_dir=None)
+        np.testing.assert_allclose(field, _brute_force(self.grid, 1.0), atol=0.05)
+        self.assertTrue((field[self.grid == 1] == 0).all())
+
+    def test_anisotropic_cells(self):
+        if distance_field.distance_transform_edt is None:
+            self.skipTest('rectangular cells need scipy')
+        field = distance_field.distance_field(self.grid, (2.0, 0.5), cache_dir=None)
+        np.testing.assert_allclose(field, _brute_force(self.grid, (2.0, 0.5)), rtol=1e-5)
+        self.assertNotEqual(grid_hash(self.grid, (2.0, 0.5)), grid_hash(self.grid, (0.5, 2.0)))
+
+    def test_free_grid(self):
+        field = distance_field.distance_field(np.zeros((5, 5)), cache_dir=None)
+        self.assertTrue(np.isinf(field).all())
+
+    def test_memory_and_disk_cache(self):
+        field = distance_field.distance_field(self.grid, 2.0, self.directory.name)
+        self.assertIs(distance_field.distance_field(self.grid, 2.0, self.directory.name), field)
+        path = os.path.join(self.directory.name, grid_hash(self.grid, 2.0) + '.npy')
+        self.assertEqual(os.listdir(self.directory.name), [os.path.basename(path)])
+        # A new process finds the field on disk
+        distance_field._memory.clear()
+        np.save(path, np.full(self.grid.shape, 7, dtype=np.float32))
+        self.assertTrue((distance_field.distance_field(self.grid, 2.0, self.directory.name) == 7).all())
+
+    def test_shared_field_is_read_only(self):
+        field = distance_field.distance_field(self.grid, cache_dir=None)
+        with self.assertRaises(ValueError):
+            field[0, 0] = 0
+        distance_field._memory.clear()
+        distance_field.distance_field(self.grid, cache_dir=self.directory.name)
+        distance_field._memory.clear()
+        self.assertFalse(distance_field.distance_field(self.grid, cache_dir=self.directory.name).flags.writeable)
+        # Derived grids are new arrays
+        self.assertTrue(inflate(self.grid, 2.0, cache_dir=None).flags.writeable)
+        self.assertTrue(clearance_cost(self.grid, cache_dir=None).flags.writeable)
+
+    def test_cache_directory(self):
+        with mock.patch.dict(os.environ, {'UAV_PLANNING_CACHE': self.directory.name}):
+            self.assertEqual(distance_field.cache_directory(), self.directory.name)
+            distance_field.distance_field(self.grid)
+            self.assertEqual(os.listdir(self.directory.name), [grid_hash(self.grid) + '.npy'])
+            # An explicit directory wins over the environment
+            self.assertIsNone(distance_field.cache_directory(None))
+        with mock.patch.dict(os.environ, {'UAV_PLANNING_CACHE': ''}):
+            self.assertIsNone(distance_field.cache_directory())
+        with mock.patch.dict(os.environ):
+            os.environ.pop('UAV_PLANNING_CACHE', None)
+            self.assertEqual(distance_field.cache_directory(),
+                             os.path.join(os.path.expanduser('~'), '.cache', 'uav_planning'))
+
+    def test_memory_is_bounded(self):
+        for i in range(distance_field.MEMORY_SIZE + 3):
+            grid = np.zeros((4, 4), dtype=np.uint8)
+            grid.flat[i] = 1
+            distance_field.distance_field(grid, cache_dir=None)
+        self.assertEqual(len(distance_field._memory), distance_field.MEMORY_SIZE)
+
+    def test_inflate(self):
+        grid = np.zeros((21, 21), dtype=np.int64)
+        grid[10, 10] = 1
+        inflated = inflate(grid, 3.0, cache_dir=None)
+        self.assertEqual(inflated.dtype, grid.dtype)
+        self.assertEqual((inflated[10, 7], inflated[10, 6], inflated[8, 8], inflated[7, 7]), (0, 0, 1, 0))
+        self.assertEqual(inflated[10, 8], 1)
+        np.testing.assert_array_equal(inflate(grid, 0, cache_dir=None), grid)
+        # Cells strictly closer than the margin: x^2 + y^2 < 9
+        self.assertEqual(inflated.sum(), 25)
+        # Margins are in the unit of cell_size
+        np.testing.assert_array_equal(inflate(grid, 3.0, cell_size=0.5, cache_dir=None),
+                                      inflate(grid, 6.0, cache_dir=None))
+
+    def test_clearance_cost(self):
+        grid = np.zeros((1, 12), dtype=np.uint8)
+        grid[0, 0] = 1
+        cost = clearance_cost(grid, safe_distance=4.0, weight=2.0, cache_dir=None)
+        np.testing.assert_allclose(cost[0, :6], [2.0, 1.5, 1.0, 0.5, 0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
 #!/usr/bin/env python
 
+import asyncio
+import threading
+from time import time
+
 import cv2
 import gi
 import numpy as np
@@ -10,8 +14,14 @@ from gi.repository import Gst
 
 class Video():
     """BlueRov video capture class constructor
+    Decoded frames are copied straight from the mapped GstBuffer into a ring of preallocated
+    NumPy frames. A frame returned by next_frame() belongs to the caller until it hands it back
+    with release(seq); only free slots are written, so a frame never changes under its consumer.
+    When every slot is held, new samples are dropped until one is released.
     Attributes:
         port (int): Video UDP port
+        ring_size (int): Number of preallocated frames in the ring buffer, more than the consumers keep in flight
+        dropped (int): Number of samples dropped because no slot was free
         video_codec (string): Source h264 parser
         video_decode (string): Transform YUV (12bits) to BGR (24bits)
         video_pipe (object): GStreamer top-level pipeline
@@ -20,16 +30,26 @@ class Video():
         video_source (string): Udp source ip and port
     """
 
-    def __init__(self, port=5600):
+    def __init__(self, port=5600, ring_size=16):
         """Summary
         Args:
             port (int, optional): UDP port
+            ring_size (int, optional): Number of preallocated frames
         """
 
         Gst.init(None)
 
         self.port = port
+        self.ring_size = ring_size
         self._frame = None
+        self._free = None       # slots no consumer holds, the only ones the callback writes
+        self._slots = {}        # seq -> slot of the latest frame and of the frames handed out
+        self._refs = {}         # seq -> next_frame() calls not released yet
+        self.dropped = 0
+        self._seq = 0
+        self._timestamp = None
+        self._read_seq = 0
+        self._new_frame = threading.Condition()
 
         # [Software component diagram](https://www.ardusub.com/software/components.html)
         # UDP video stream (:5600)
@@ -75,23 +95,31 @@ class Video():
         self.video_sink = self.video_pipe.get_by_name('appsink0')
 
     @staticmethod
-    def gst_to_opencv(sample):
-        """Transform byte array into np array
+    def gst_to_opencv(sample, out=None):
+        """Transform a sample into np array
         Args:
-            sample (TYPE): Description
+            sample (Gst.Sample): Decoded BGR sample
+            out (np.ndarray, optional): Preallocated (height, width, 3) frame to fill
         Returns:
-            TYPE: Description
+            np.ndarray: BGR image
         """
         buf = sample.get_buffer()
         caps = sample.get_caps()
-        array = np.ndarray(
-            (
-                caps.get_structure(0).get_value('height'),
-                caps.get_structure(0).get_value('width'),
-                3
-            ),
-            buffer=buf.extract_dup(0, buf.get_size()), dtype=np.uint8)
-        return array
+        height = caps.get_structure(0).get_value('height')
+        width = caps.get_structure(0).get_value('width')
+        if out is None:
+            out = np.empty((height, width, 3), dtype=np.uint8)
+        ok, map_info = buf.map(Gst.MapFlags.READ)
+        if not ok:
+            raise RuntimeError('Could not map the video buffer')
+        try:
+            # Rows may be padded to a 4 byte stride
+            stride = map_info.size // height
+            mapped = np.frombuffer(map_info.data, dtype=np.uint8, count=stride*height)
+            np.copyto(out, mapped.reshape(height, stride)[:, :width*3].reshape(height, width, 3))
+        finally:
+            buf.unmap(map_info)
+        return out
 
     def frame(self):
         """ Get Frame
@@ -107,6 +135,40 @@ class Video():
         """
         return type(self._frame) != type(None)
 
+    def next_frame(self, timeout=None, after=None):
+        """ Block until a frame newer than `after` arrives
+        Args:
+            timeout (float, optional): seconds to wait, None waits forever
+            after (int, optional): sequence number already seen, defaults to the last one returned
+        Returns:
+            tuple: (seq, timestamp, frame) or None on timeout, release(seq) once done with the frame
+        """
+        with self._new_frame:
+            if after is None:
+                after = self._read_seq
+            if not self._new_frame.wait_for(lambda: self._seq > after, timeout):
+                return None
+            self._read_seq = self._seq
+            self._refs[self._seq] = self._refs.get(self._seq, 0) + 1
+            return self._seq, self._timestamp, self._frame
+
+    def release(self, seq):
+        """ Hand the frame `seq` of next_frame() back to the ring """
+        with self._new_frame:
+            self._refs[seq] -= 1
+            self._recycle(seq)
+
+    def _recycle(self, seq):
+        # Called with the lock held: the slot is free once it is neither the latest frame nor held
+        if seq != self._seq and not self._refs.get(seq) and seq in self._slots:
+            self._refs.pop(seq, None)
+            self._free.append(self._slots.pop(seq))
+
+    async def next_frame_async(self, timeout=None, after=None):
+        """ Awaitable version of next_frame() that does not block the event loop """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.next_frame, timeout, after)
+
     def run(self):
         """ Get frame to update _frame
         """
@@ -123,8 +185,25 @@ class Video():
 
     def callback(self, sink):
         sample = sink.emit('pull-sample')
-        new_frame = self.gst_to_opencv(sample)
-        self._frame = new_frame
+        timestamp = time()
+        with self._new_frame:
+            if self._free is None:
+                structure = sample.get_caps().get_structure(0)
+                shape = (structure.get_value('height'), structure.get_value('width'), 3)
+                self._free = [np.empty(shape, dtype=np.uint8) for _ in range(self.ring_size)]
+            if not self._free:      # every slot is still held downstream
+                self.dropped += 1
+                return Gst.FlowReturn.OK
+            slot = self._free.pop()
+        # No consumer can hold a free slot, so it is filled outside of the lock
+        new_frame = self.gst_to_opencv(sample, out=slot)
+        with self._new_frame:
+            self._frame = new_frame
+            self._timestamp = timestamp
+            self._seq += 1
+            self._slots[self._seq] = new_frame
+            self._recycle(self._seq - 1)
+            self._new_frame.notify_all()
 
         return Gst.FlowReturn.OK
 
@@ -136,10 +215,12 @@ if __name__ == '__main__':
 
     while True:
         # Wait for the next frame
-        if not video.frame_available():
+        captured = video.next_frame(timeout=1)
+        if captured is None:
             continue
 
-        frame = video.frame()
+        seq, _, frame = captured
         cv2.imshow('frame', frame)
+        video.release(seq)
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
\ No newline at end of file
@@ -0,0 +1,17 @@
+import numpy as np
+
+EARTH_RADIUS = 6378137.0    # Radius of "spherical" earth
+
+
+def get_location_offset_meters(original_lat, original_lon, dNorth, dEast):
+    '''
+    Works on scalars as well as NumPy arrays (broadcasted), e.g. offsets of many detections at once.
+    '''
+    # Coordinate offsets in radians
+    dLat = np.asarray(dNorth)/EARTH_RADIUS
+    dLon = np.asarray(dEast)/(EARTH_RADIUS*np.cos(np.pi*np.asarray(original_lat)/180))
+
+    #New position in decimal degrees
+    newlat = original_lat + (dLat * 180/np.pi)
+    newlon = original_lon + (dLon * 180/np.pi)
+    return newlat, newlon
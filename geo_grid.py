@@ -0,0 +1,202 @@
+import json
+import xml.etree.ElementTree as ET
+
+import cv2
+import numpy as np
+
+from geo import EARTH_RADIUS
+
+SHIFT = 8                   # fractional bits of the polygon vertices handed to cv2.fillPoly
+
+
+def _rings(polygon):
+    """ A single ring or a list of rings (outer boundary first, then holes) -> list of (N,2) arrays """
+    polygon = [np.asarray(ring, dtype=np.float64) for ring in polygon] \
+        if np.ndim(polygon[0]) == 2 else [np.asarray(polygon, dtype=np.float64)]
+    return [ring.reshape(-1, 2) for ring in polygon]
+
+
+class GeoGrid():
+    """Occupancy grid on a regular lat/lon raster
+    Cell [r, c] is centered at (lat0 + r*dlat, lon0 + c*dlon), so lat/lon <-> cell conversions are a
+    scale and an offset. No-fly zones are rasterized with cv2.fillPoly on the bounding box of each
+    polygon and inflated with a dilation by the safety margin.
+    Attributes:
+        grid (np.ndarray): (rows, cols) uint8 occupancy, 1 = obstacle
+        lat0, lon0 (float): coordinates of the cell [0, 0]
+        dlat, dlon (float): grid spacing in degrees
+        inflation (float): default margin in meters added around every zone
+    """
+
+    def __init__(self, lat0, lon0, dlat, dlon, rows, cols, inflation=0.0):
+        self.grid = np.zeros((rows, cols), dtype=np.uint8)
+        self.lat0, self.lon0 = lat0, lon0
+        self.dlat, self.dlon = dlat, dlon
+        self.inflation = inflation
+
+    @classmethod
+    def from_bounds(cls, lat_min, lon_min, lat_max, lon_max, resolution=1.0, inflation=0.0):
+        """ Square cells of `resolution` meters covering the box """
+        dlat = np.degrees(resolution/EARTH_RADIUS)
+        dlon = dlat/np.cos(np.radians((lat_min + lat_max)/2))
+        rows = int(np.ceil((lat_max - lat_min)/dlat)) + 1
+        cols = int(np.ceil((lon_max - lon_min)/dlon)) + 1
+        return cls(lat_min, lon_min, dlat, dlon, rows, cols, inflation)
+
+    @classmethod
+    def around(cls, points, margin=50.0, resolution=1.0, inflation=0.0):
+        """ Grid covering (N,2) [lat, lon] points (e.g. home, goal and zone vertices) plus a margin in meters """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        dlat = np.degrees(margin/EARTH_RADIUS)
+        dlon = dlat/np.cos(np.radians(points[:, 0].mean()))
+        return cls.from_bounds(points[:, 0].min() - dlat, points[:, 1].min() - dlon,
+                               points[:, 0].max() + dlat, points[:, 1].max() + dlon, resolution, inflation)
+
+    @property
+    def shape(self):
+        return self.grid.shape
+
+    @property
+    def cell_size(self):
+        """ (height, width) of a cell in meters """
+        height = np.radians(abs(self.dlat))*EARTH_RADIUS
+        width = np.radians(abs(self.dlon))*EARTH_RADIUS*np.cos(np.radians(self.lat0))
+        return height, width
+
+    def to_cell(self, lat, lon):
+        """ Nearest cell of lat/lon scalars or arrays, may lie outside of the grid (see contains) """
+        row = np.rint((np.asarray(lat) - self.lat0)/self.dlat).astype(np.int64)
+        col = np.rint((np.asarray(lon) - self.lon0)/self.dlon).astype(np.int64)
+        if row.ndim == 0:
+            return int(row), int(col)
+        return row, col
+
+    def to_latlon(self, row, col):
+        """ Center of cells, scalars or arrays """
+        return self.lat0 + np.asarray(row)*self.dlat, self.lon0 + np.asarray(col)*self.dlon
+
+    def contains(self, row, col):
+        rows, cols = self.shape
+        return (0 <= np.asarray(row)) & (np.asarray(row) < rows) & (0 <= np.asarray(col)) & (np.asarray(col) < cols)
+
+    def _fractional(self, ring):
+        """ (N,2) [lat, lon] -> (N,2) fractional [col, row] as expected by OpenCV """
+        return np.stack(((ring[:, 1] - self.lon0)/self.dlon, (ring[:, 0] - self.lat0)/self.dlat), axis=-1)
+
+    def _mask(self, polygon, inflation):
+        """ Rasterized and inflated polygon inside its bounding box -> (mask, row slice, col slice) """
+        rings = [self._fractional(ring) for ring in _rings(polygon)]
+        cell_h, cell_w = self.cell_size
+        pad_r, pad_c = int(np.ceil(inflation/cell_h)), int(np.ceil(inflation/cell_w))
+        low = np.floor(np.min([ring.min(axis=0) for ring in rings], axis=0)).astype(np.int64) - (pad_c, pad_r)
+        high = np.ceil(np.max([ring.max(axis=0) for ring in rings], axis=0)).astype(np.int64) + (pad_c, pad_r)
+        rows, cols = self.shape
+        c0, r0 = max(low[0], 0), max(low[1], 0)
+        c1, r1 = min(high[0] + 1, cols), min(high[1] + 1, rows)
+        if c0 >= c1 or r0 >= r1:
+            return None, slice(0, 0), slice(0, 0)
+        # Rasterize in a box that still holds the full margin so the dilation is not cut at the grid border
+        mask = np.zeros((high[1] - low[1] + 1, high[0] - low[0] + 1), dtype=np.uint8)
+        points = [np.rint((ring - low)*(1 << SHIFT)).astype(np.int32) for ring in rings]
+        cv2.fillPoly(mask, points, 1, lineType=cv2.LINE_8, shift=SHIFT)
+        if inflation > 0:
+            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2*pad_c + 1, 2*pad_r + 1))
+            mask = cv2.dilate(mask, kernel)
+        mask = mask[r0 - low[1]:r1 - low[1], c0 - low[0]:c1 - low[0]]
+        return mask, slice(r0, r1), slice(c0, c1)
+
+    def add_polygon(self, polygon, inflation=None):
+        """ Marks a no-fly zone, polygon is a ring of [lat, lon] or a list of rings (outer, holes...) """
+        mask, rows, cols = self._mask(polygon, self.inflation if inflation is None else inflation)
+        if mask is not None:
+            self.grid[rows, cols] |= mask
+
+    def add_fence(self, polygon, inflation=None):
+        """ Marks everything outside of an inclusion fence (shrunk by the inflation margin) """
+        inflation = self.inflation if inflation is None else inflation
+        inside = np.zeros(self.shape, dtype=np.uint8)
+        mask, rows, cols = self._mask(polygon, 0)
+        if mask is not None:
+            inside[rows, cols] = mask
+        if inflation > 0:
+            cell_h, cell_w = self.cell_size
+            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2*int(np.ceil(inflation/cell_w)) + 1,
+                                                                   2*int(np.ceil(inflation/cell_h)) + 1))
+            inside = cv2.erode(inside, kernel)
+        self.grid |= 1 - inside
+
+    def add_zones(self, zones, inflation=None):
+        """ Adds the zones returned by load_zones() """
+        for zone in zones:
+            if zone.get('inclusion', False):
+                self.add_fence(zone['polygon'], inflation)
+            else:
+                self.add_polygon(zone['polygon'], inflation)
+
+def zone_points(zones):
+    """ Every vertex of the zones as a (N,2) [lat, lon] array, e.g. for GeoGrid.around() """
+    rings = [ring for zone in zones for ring in _rings(zone['polygon'])]
+    return np.concatenate(rings) if rings else np.zeros((0, 2))
+
+
+def _geojson_polygons(geometry):
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    if geometry['type'] == 'GeometryCollection':
+        return [p for g in geometry['geometries'] for p in _geojson_polygons(g)]
+    return []
+
+def load_geojson(path):
+    """ Polygons of a GeoJSON file as zones, a feature with "inclusion": true in its properties is a fence """
+    with open(path) as f:
+        data = json.load(f)
+    features = data['features'] if data['type'] == 'FeatureCollection' else \
+        [data] if data['type'] == 'Feature' else [{'geometry': data, 'properties': {}}]
+    zones = []
+    for feature in features:
+        inclusion = bool((feature.get('properties') or {}).get('inclusion', False))
+        for polygon in _geojson_polygons(feature['geometry']):
+            # GeoJSON positions are [lon, lat(, alt)]
+            rings = [[(point[1], point[0]) for point in ring] for ring in polygon]
+            zones.append({'polygon': rings, 'inclusion': inclusion})
+    return zones
+
+def load_kml(path):
+    """ Every <Polygon> of a KML file as a no-fly zone """
+    def ring(element):
+        points = [p.split(',') for p in element.text.split()]
+        return [(float(p[1]), float(p[0])) for p in points]
+    def rings(polygon, boundary):
+        return [ring(coordinates) for element in polygon.iter() if element.tag.endswith(boundary)
+                for coordinates in element.iter() if coordinates.tag.endswith('coordinates')]
+    return [{'polygon': rings(polygon, 'outerBoundaryIs') + rings(polygon, 'innerBoundaryIs'), 'inclusion': False}
+            for polygon in ET.parse(path).iter() if polygon.tag.endswith('Polygon')]
+
+def load_plan_fence(path):
+    """ Geofence polygons of a QGroundControl .plan file """
+    with open(path) as f:
+        fence = json.load(f).get('geoFence', {})
+    return [{'polygon': polygon['polygon'], 'inclusion': polygon.get('inclusion', True)}
+            for polygon in fence.get('polygons', [])]
+
+def load_fence(path):
+    """
+    ArduPilot fence points file ("lat lon" per line, the first point is the return point),
+    the boundary is an inclusion fence.
+    """
+    points = [tuple(map(float, line.split()[0:2])) for line in open(path)
+              if line.strip() and not line.startswith('#')]
+    return [{'polygon': points[1:], 'inclusion': True}]
+
+def load_zones(path):
+    """ No-fly zones / fences from a .geojson, .json, .kml, .plan or ArduPilot fence file """
+    extension = path.lower().rsplit('.', 1)[-1]
+    if extension in ('geojson', 'json'):
+        return load_geojson(path)
+    if extension == 'kml':
+        return load_kml(path)
+    if extension == 'plan':
+        return load_plan_fence(path)
+    return load_fence(path)
@@ -0,0 +1,120 @@
+"""Tests for geo_grid, the geo-referenced occupancy grid and the zone file loaders."""
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from geo_grid import GeoGrid, load_zones, zone_points
+
+LAT, LON = 38.16, -122.455
+
+
+class GeoGridTest(unittest.TestCase):
+
+    def setUp(self):
+        # 1 m cells, 100 x 100 m
+        self.geo = GeoGrid.from_bounds(LAT, LON, LAT + 0.0009, LON + 0.00114, resolution=1.0)
+
+    def _square(self, r0, c0, r1, c1):
+        """ [lat, lon] ring through the centers of the corner cells """
+        return [self.geo.to_latlon(r, c) for r, c in ((r0, c0), (r0, c1), (r1, c1), (r1, c0))]
+
+    def test_cell_size_and_conversions(self):
+        np.testing.assert_allclose(self.geo.cell_size, (1.0, 1.0), rtol=1e-4)
+        lat, lon = self.geo.to_latlon(np.array([3, 40]), np.array([7, 90]))
+        rows, cols = self.geo.to_cell(lat, lon)
+        np.testing.assert_array_equal(rows, [3, 40])
+        np.testing.assert_array_equal(cols, [7, 90])
+        self.assertEqual(self.geo.to_cell(*self.geo.to_latlon(5, 6)), (5, 6))
+        self.assertFalse(self.geo.contains(-1, 5))
+        self.assertTrue(self.geo.contains(0, 0))
+
+    def test_polygon_is_rasterized(self):
+        self.geo.add_polygon(self._square(10, 20, 30, 50))
+        expected = np.zeros(self.geo.shape, dtype=np.uint8)
+        expected[10:31, 20:51] = 1
+        np.testing.assert_array_equal(self.geo.grid, expected)
+
+    def test_inflation(self):
+        self.geo.add_polygon(self._square(40, 40, 50, 50), inflation=5.0)
+        self.assertTrue(self.geo.grid[35, 45] and self.geo.grid[45, 55])
+        self.assertFalse(self.geo.grid[33, 45] or self.geo.grid[45, 57])
+        # Elliptic kernel, the diagonal corner stays free
+        self.assertFalse(self.geo.grid[35, 35])
+
+    def test_holes(self):
+        self.geo.add_polygon([self._square(10, 10, 60, 60), self._square(30, 30, 40, 40)])
+        self.assertEqual(self.geo.grid[20, 20], 1)
+        self.assertEqual(self.geo.grid[35, 35], 0)
+
+    def test_zone_outside_of_the_grid(self):
+        self.geo.add_polygon(self._square(200, 200, 210, 210))
+        self.assertFalse(self.geo.grid.any())
+        # Partly outside, clipped at the border
+        self.geo.add_polygon(self._square(-10, -10, 5, 5))
+        self.assertEqual(self.geo.grid.sum(), 36)
+
+    def test_fence(self):
+        self.geo.add_fence(self._square(10, 10, 89, 89), inflation=2.0)
+        self.assertEqual(self.geo.grid[5, 50], 1)
+        self.assertEqual(self.geo.grid[11, 50], 1)
+        self.assertEqual(self.geo.grid[13, 50], 0)
+        self.assertEqual(self.geo.grid[50, 50], 0)
+
+    def test_around(self):
+        points = np.array([[LAT, LON], [LAT + 0.001, LON + 0.001]])
+        geo = GeoGrid.around(points, margin=20.0, resolution=2.0)
+        rows, cols = geo.to_cell(points[:, 0], points[:, 1])
+        self.assertTrue(geo.contains(rows, cols).all())
+        self.assertEqual((rows.min(), cols.min()), (10, 10))
+
+
+class LoadZonesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _write(self, name, text):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_geojson(self):
+        ring = [[LON, LAT], [LON + 0.001, LAT], [LON + 0.001, LAT + 0.001], [LON, LAT]]
+        data = {'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Polygon', 'coordinates': [ring]}},
+            {'type': 'Feature', 'properties': {'inclusion': True},
+             'geometry': {'type': 'MultiPolygon', 'coordinates': [[ring], [ring]]}}]}
+        zones = load_zones(self._write('zones.geojson', json.dumps(data)))
+        self.assertEqual([zone['inclusion'] for zone in zones], [False, True, True])
+        # GeoJSON is [lon, lat], zones are [lat, lon]
+        self.assertEqual(zones[0]['polygon'][0][1], (LAT, LON + 0.001))
+        self.assertEqual(zone_points(zones).shape, (12, 2))
+
+    def test_kml(self):
+        coordinates = ' '.join(f'{LON + dx},{LAT + dy},0' for dx, dy in ((0, 0), (0.001, 0), (0, 0.001), (0, 0)))
+        kml = ('<kml xmlns="http://www.opengis.net/kml/2.2"><Placemark><Polygon><outerBoundaryIs><LinearRing>'
+               f'<coordinates>{coordinates}</coordinates></LinearRing></outerBoundaryIs></Polygon></Placemark></kml>')
+        zones = load_zones(self._write('zones.kml', kml))
+        self.assertEqual(len(zones), 1)
+        self.assertEqual(zones[0]['polygon'][0][1], (LAT, LON + 0.001))
+
+    def test_plan_and_fence_files(self):
+        plan = {'geoFence': {'polygons': [{'polygon': [[LAT, LON], [LAT, LON + 0.001], [LAT + 0.001, LON]],
+                                           'inclusion': False}]}}
+        zones = load_zones(self._write('mission.plan', json.dumps(plan)))
+        self.assertEqual(zones, [{'polygon': plan['geoFence']['polygons'][0]['polygon'], 'inclusion': False}])
+        fence = f'# return point first\n{LAT} {LON}\n{LAT} {LON}\n{LAT + 0.001} {LON}\n{LAT} {LON + 0.001}\n'
+        zones = load_zones(self._write('fence.txt', fence))
+        self.assertEqual(zones, [{'polygon': [(LAT, LON), (LAT + 0.001, LON), (LAT, LON + 0.001)],
+                                  'inclusion': True}])
+
+
+if __name__ == '__main__':
+    unittest.main()
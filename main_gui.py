@@ -1,221 +1,174 @@
+import argparse
+import threading
 import tkinter as tk
 import numpy as np
-import sys, os
 import cv2
-from time import time
-import tensorflow as tf
-from yolov3_tf2.models import (YoloV3, YoloV3Tiny)
-import argparse
 
-detector = 'yolo-tiny'   # detector: 'yolo', 'yolo-tiny', 'ssd'
-
-if detector == 'ssd':
-    sys.path.append("..")
-    from utils import label_map_util
-    import tensorflow.compat.v1 as tf
-    tf.disable_v2_behavior()
+from detectors import get_detector, tile_regions
 
 from gazebo_camera import Video
 video = Video()
-from cv_utils import coordinates_plot, draw_outputs, keep_person_only, localize_person
+from detection_engine import DetectionEngine
+from camera_model import CameraModel
+from tracker import BoxTracker, GeoFusion
+from motion_gate import MotionGate
+from cv_utils import coordinates_plot, draw_locations, draw_outputs, keep_person_only, localize_person
 
 from mavsdk import System, MissionItem, OffboardError, PositionNedYaw
-from mavsdk_utils import connect_sitl, get_relative_altitude, get_euler_angles, get_lat_lon, land, square_mission, square_mission_offboard, search_mission
+from mavsdk.action import ActionError
+from mavsdk.mission import MissionError
+from mavsdk.param import ParamError
+from mavsdk_utils import TelemetryCache, connect_sitl, get_relative_altitude, get_euler_angles, get_lat_lon, land, square_mission, square_mission_offboard, search_mission
 import asyncio
 
-def transform_images_for_yolo(x_train, size):
-    x_train = tf.image.resize(x_train, (size, size))
-    x_train = x_train / 255
-    return x_train
-
-def initialize_ssd_detector():
-    MODEL_NAME = 'trt_ssdlite'
-    PATH_TO_FROZEN_GRAPH = MODEL_NAME + '/frozen_inference_graph.pb'
-    PATH_TO_LABELS = os.path.join('data', 'mscoco_label_map.pbtxt')
-    detection_graph = tf.Graph()
-    with detection_graph.as_default():
-        od_graph_def = tf.GraphDef()
-        with tf.gfile.GFile(PATH_TO_FROZEN_GRAPH, 'rb') as fid:
-            serialized_graph = fid.read()
-            od_graph_def.ParseFromString(serialized_graph)
-            tf.import_graph_def(od_graph_def, name='')
-    category_index = label_map_util.create_category_index_from_labelmap(PATH_TO_LABELS, use_display_name=True)
-    return detection_graph, category_index
-
-async def mission(search_lat, search_lon, show_frames=True):
+CAM_PITCH, CAM_YAW = -90, 0    # gimbal angles of the mission items, also used to geolocate the detections
+
+async def mission(search_lat, search_lon, detector='yolo-tiny', show_frames=True, motion_gate=False, **detector_args):
     times = []
-    person_lats_all = []
-    person_lons_all = []
-
-    if detector == 'ssd':
-        config = tf.ConfigProto()
-        config.gpu_options.allow_growth = True
-    else:
-        physical_devices = tf.config.experimental.list_physical_devices('GPU')
-        if len(physical_devices) > 0:
-            tf.config.experimental.set_memory_growth(physical_devices[0], True)
-    with tf.device('/gpu:0'):
-        if detector == 'yolo' or detector == 'yolo-tiny':
-            # initiallizing the detecor
-            coco_classes = './yolo_data/coco.names'    # Path to classes file
-            num_classes = 80    # number of classes in the model
-            size = 416    # resize images to
-            # size = 320
-            if detector == 'yolo-tiny':
-                print('Detector: YOLO-Tiny')
-                weights = './checkpoints/yolov3-tiny.tf'    # path to weights file
-                yolo = YoloV3Tiny(classes=num_classes)
-            else:
-                weights = './checkpoints/yolov3.tf'    # path to weights file
-                yolo = YoloV3(classes=num_classes)
-            yolo.load_weights(weights)
-            print('weights loaded')
-            class_names = [c.strip() for c in open(coco_classes).readlines()]
-            print('classes loaded')
+    camera = CameraModel(gimbal_pitch=CAM_PITCH, gimbal_yaw=CAM_YAW)    # intrinsics from the simulated camera FOV
+    tracker = BoxTracker()    # image-space tracks of the detected persons
+    targets = GeoFusion()     # fused world-space estimate per person
+
+    # initiallizing the detecor
+    backend = get_detector(detector, **detector_args)
+    print(f'Detector: {detector}')
+    backend.load()
+    backend.warmup()
+    try:
+        # Starting the pre-planned mission after loading the detector to eliminate the delayed start of the detection
+        drone, home_lat, home_lon = await search_mission(search_lat=search_lat, search_lon=search_lon,
+                                                         mission_alt=5, mission_spd=50, mission_north=10,
+                                                                                        mission_east=-10,
+                                                                                        mission_south=-10,
+                                                                                        RTL_alt=5,
+                                                                                        CAM_pitch=CAM_PITCH,
+                                                                                        CAM_yaw=CAM_YAW)
+    except (ActionError, MissionError, ParamError) as error:
+        print(f"\nMission couldn't be started: {error}\n\n")
+        return
+    telemetry = TelemetryCache(drone).start()    # Subscribes once to position & attitude
+    try:
+        await telemetry.wait_ready()    # the gate and localization interpolate the pose history
+    except TimeoutError as error:
+        print(f"\nDetection couldn't be started: {error}\n\n")
+        telemetry.stop()
+        return
+
+    def postprocess(outputs):
+        boxes, scores, classes, nums = outputs
+        return keep_person_only(boxes[0], scores[0], classes[0],
+                                confidence=backend.confidence,
+                                person_class=backend.person_class)
+
+    gate = None
+    # Set by the loop after each tracker update, the gate reads it on the preprocess thread
+    unconfirmed = threading.Event()
+    if motion_gate:
+        # The detector only runs on new content, or while a track still has to be confirmed
+        gate = MotionGate(camera, telemetry.history, tiles=getattr(backend, 'tiles', None),
+                          overlap=getattr(backend, 'overlap', 0.2), force=unconfirmed.is_set)
+
+    # Capture, preprocessing, inference and post-processing run on their own threads
+    engine = DetectionEngine(capture=video.next_frame, release=video.release,
+                             preprocess=lambda img, *active: backend.preprocess(img[np.newaxis], *active),
+                             infer=backend.infer, postprocess=postprocess, gate=gate)
+    engine.start()
+    async for result in engine.results():
+        img = result['image']
+        if result['skipped']:   # nothing new in the frame, the tracks are only predicted
+            tracker.coast()
+            boxes_squeezed, scores_squeezed, classes_squeezed, nums = np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=np.int32), 0
+            tracks = []
+        else:
+            times.append(result['inference_time'])
+            times = times[-20:]
+            boxes_squeezed,scores_squeezed,classes_squeezed,nums = result['detections']
+            # Tracks in the tiles the gate skipped were not looked for, they coast instead of missing
+            regions = None
+            if np.ndim(result['active']):
+                regions = tile_regions(img.shape, result['active'], backend.tiles, backend.overlap)
+            # A person is only localized once its track is confirmed over several frames
+            tracks = tracker.update(boxes_squeezed, scores_squeezed, regions=regions)
+        if len(tracker.tracks) > 0 and not tracker.stable():
+            unconfirmed.set()
+        else:
+            unconfirmed.clear()
+        if nums > 0:    # A person was detected
+            print(f'{detector} nums: {nums}')
+            print(f'score: {scores_squeezed}')
+        if tracks:
+            track_boxes = np.array([track.box for track in tracks])
             try:
-                drone, home_lat, home_lon = await search_mission(search_lat=search_lat, search_lon=search_lon,
-                                                                 mission_alt=5, mission_spd=50, mission_north=10, 
-                                                                                                mission_east=-10, 
-                                                                                                mission_south=-10, 
-                                                                                                RTL_alt=5, 
-                                                                                                CAM_pitch=-90, 
-                                                                                                CAM_yaw=0)
-            except:
-                print("\nMission couldn't be started!\n\n")
-            while True:
-                if not video.frame_available():
-                    continue
-
-                img = video.frame()
-                image_tf = cv2.cvtColor(img, cv2.COLOR_BGR2RGB) 
-                image_tf = tf.expand_dims(image_tf, 0)
-                image_tf = transform_images_for_yolo(image_tf, size)
-                t1 = time()
-                boxes, scores, classes, nums = yolo.predict(image_tf)
-                times.append(time() - t1)
-                times = times[-20:]
-                boxes_squeezed,scores_squeezed,classes_squeezed,nums = keep_person_only(np.squeeze(boxes), 
-                                                                                        np.squeeze(scores), 
-                                                                                        np.squeeze(classes).astype(np.int32), 
-                                                                                        confidence=0.2,
-                                                                                        detector=detector)
-                if nums > 0:    # A person was detected
-                    print(f'yolo nums: {nums}')
-                    print(f'score: {scores_squeezed}')
-                    try:
-                        current_altitude = await get_relative_altitude(drone)
-                        _,_,current_yaw = await get_euler_angles(drone)
-                        current_lat, current_lon = await get_lat_lon(drone)
-                        person_lats, person_lons = localize_person(img=img, boxes=boxes_squeezed, 
-                                                    nums=nums, alt=current_altitude, yaw=current_yaw, 
-                                                    drone_lat=current_lat, drone_lon=current_lon)
-                        # await drone.mission.pause_mission()
-                        # await land(drone)
-                        # print('Mission is paused.. \n\tA person is detected!')
-                        person_lats_all.extend(person_lats)
-                        person_lons_all.extend(person_lons)
-                    except:
-                        pass
-                # Display Output
+                # Pose interpolated at the capture time of the frame, not at the end of inference
+                person_lats, person_lons = localize_person(img=img, boxes=track_boxes, nums=len(tracks),
+                                                           pose_history=telemetry.history,
+                                                           timestamp=result['timestamp'], camera=camera)
                 if show_frames:
-                    img = draw_outputs(img, (boxes_squeezed,
-                                             scores_squeezed, 
-                                             classes_squeezed, 
-                                             nums), class_names, detector=detector)
-                    img = cv2.putText(img, "Time: {:,.2f}ms | FPS: {:.2f}fps".format(times[-1]*1000, 1/times[-1]),
-                                            (0, 20), cv2.FONT_HERSHEY_COMPLEX_SMALL, 1, (255, 0, 255), 2)
-                    cv2.imshow('object detection', img)
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        cv2.destroyAllWindows()
-                        if len(person_lats_all):
-                            coordinates_plot(person_lat=np.mean(person_lats_all), person_lon=np.mean(person_lons_all), 
-                                            home_lat=home_lat, home_lon=home_lon)
-                        break
-
-        elif detector == 'ssd':
-            detection_graph, category_index = initialize_ssd_detector()
-            with detection_graph.as_default():
-                with tf.Session(graph=detection_graph, config=config) as sess:
-                    # Starting the pre-planned mission after starting the tf session to eliminate the delayed start of the detection
-                    drone, home_lat, home_lon = await search_mission(search_lat=search_lat, search_lon=search_lon,
-                                                                     mission_alt=5, mission_spd=50, mission_north=12, 
-                                                                                                    mission_east=-20, 
-                                                                                                    mission_south=-3, 
-                                                                                                    RTL_alt=5, 
-                                                                                                    CAM_pitch=-90, 
-                                                                                                    CAM_yaw=0)
-                    # Detection loop
-                    while True:
-                        if not video.frame_available():
-                            continue
-
-                        image_np = video.frame()
-                        image_np_expanded = np.expand_dims(image_np, axis=0)
-                        image_tensor = detection_graph.get_tensor_by_name('image_tensor:0')
-                        boxes = detection_graph.get_tensor_by_name('detection_boxes:0')
-                        scores = detection_graph.get_tensor_by_name('detection_scores:0')
-                        classes = detection_graph.get_tensor_by_name('detection_classes:0')
-                        num_detections = detection_graph.get_tensor_by_name('num_detections:0')
-                        # Actual detection.
-                        t1 = time()
-                        (boxes, scores, classes, num_detections) = sess.run(
-                        [boxes, scores, classes, num_detections],
-                        feed_dict={image_tensor: image_np_expanded})
-                        times.append(time() - t1)
-                        times = times[-20:]
-                        boxes_squeezed,scores_squeezed,classes_squeezed,nums = keep_person_only(np.squeeze(boxes), 
-                                                                                                np.squeeze(scores), 
-                                                                                                np.squeeze(classes).astype(np.int32), 
-                                                                                                confidence=0.5)
-                        if nums > 0:    # A person was detected
-                            try:
-                                current_altitude = await get_relative_altitude(drone)
-                                _,_,current_yaw = await get_euler_angles(drone)
-                                current_lat, current_lon = await get_lat_lon(drone)
-                                person_lats, person_lons = localize_person(img=image_np, boxes=boxes_squeezed, 
-                                                            nums=nums, alt=current_altitude, yaw=current_yaw, 
-                                                            drone_lat=current_lat, drone_lon=current_lon)
-                                # await drone.mission.pause_mission()
-                                # await land(drone)
-                                # print('Mission is paused.. \n\tA person is detected!')
-                                person_lats_all.extend(person_lats)
-                                person_lons_all.extend(person_lons)
-                            except:
-                                pass
-                        # Display output
-                        if show_frames:
-                            # Visualization of the results of a detection.
-                            image_np = draw_outputs(image_np, (boxes_squeezed,
-                                                        scores_squeezed, 
-                                                        classes_squeezed, 
-                                                        nums), category_index)
-                            
-                            image_np = cv2.putText(image_np, "Time: {:,.2f}ms | FPS: {:.2f}fps".format(times[-1]*1000, 1/times[-1]),
-                                                (0, 20), cv2.FONT_HERSHEY_COMPLEX_SMALL, 1, (255, 0, 255), 2)
-                            
-                            # cv2.imshow('object detection', cv2.resize(image_np, (800, 600)))
-                            cv2.imshow('object detection', image_np)
-                            if cv2.waitKey(1) & 0xFF == ord('q'):
-                                cv2.destroyAllWindows()
-                                if len(person_lats_all):
-                                    coordinates_plot(person_lat=np.mean(person_lats_all), person_lon=np.mean(person_lons_all), 
-                                                    home_lat=home_lat, home_lon=home_lon)
-                                break
-        else:
-            print('select a valid detector!')
+                    img = draw_locations(img, track_boxes, person_lats, person_lons)
+                # await drone.mission.pause_mission()
+                # await land(drone)
+                # print('Mission is paused.. \n\tA person is detected!')
+                targets.update(person_lats, person_lons, [track.score for track in tracks])
+            except ValueError as error:    # no pose for the frame yet
+                print(f'Localization failed: {error}')
+        # Display Output
+        if show_frames:
+            img = draw_outputs(img, (boxes_squeezed,
+                                     scores_squeezed,
+                                     classes_squeezed,
+                                     nums), backend.category_index)
+            if times:   # none yet while the first frames are gated
+                img = cv2.putText(img, "Time: {:,.2f}ms | FPS: {:.2f}fps".format(times[-1]*1000, 1/times[-1]),
+                                        (0, 20), cv2.FONT_HERSHEY_COMPLEX_SMALL, 1, (255, 0, 255), 2)
+            cv2.imshow('object detection', img)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                cv2.destroyAllWindows()
+                confirmed = targets.targets(min_hits=3)
+                if len(confirmed):
+                    coordinates_plot(person_lat=[target['lat'] for target in confirmed],
+                                     person_lon=[target['lon'] for target in confirmed],
+                                     home_lat=home_lat, home_lon=home_lon)
+                break
+    engine.stop()
+    telemetry.stop()
+    if gate is not None:
+        print(f'Motion gate skipped {gate.skip_rate:.1%} of the frames and {gate.tile_skip_rate:.1%} of the tiles')
+
 
-    
-        
 def button_callback():
-    global detector
-    detector = detector_feild.get()
+    detector = detector_feild.get() or 'yolo-tiny'
     search_lat = float(lat_feild.get())
     search_lon = float(lon_feild.get())
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(mission(search_lat, search_lon))
+    loop.run_until_complete(mission(search_lat, search_lon, detector=detector, show_frames=args.show_frames,
+                                    motion_gate=args.motion_gate, **detector_args_from(args, detector)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Search mission around a location picked in the GUI')
+    parser.add_argument('--model', default=None,
+                        help='model path for the onnx/tflite backends (weights for yolo, model dir for ssd)')
+    parser.add_argument('--classes', nargs='+', default=['person'],
+                        help='classes to detect, the model head / NMS is pruned to them where possible')
+    parser.add_argument('--tiles', type=int, nargs=2, default=None, metavar=('ROWS', 'COLS'),
+                        help='run the detector on overlapping tiles of each frame, for small targets at altitude')
+    parser.add_argument('--motion-gate', action='store_true',
+                        help='only run the detector where the scene changed, compensated by the telemetry')
+    parser.add_argument('--no-show', dest='show_frames', action='store_false',
+                        help='do not display the detection window')
+    return parser.parse_args()
+
+def detector_args_from(args, detector):
+    """ Maps the --model, --classes and --tiles CLI options onto the constructor arguments of the detector typed in the GUI """
+    detector_args = {'target_classes': args.classes, 'tiles': args.tiles}
+    if args.model is not None:
+        key = {'yolo': 'weights', 'yolo-tiny': 'weights', 'ssd': 'model_name'}.get(detector, 'model_path')
+        detector_args[key] = args.model
+    return detector_args
 
 
 if __name__ == "__main__":
+    args = parse_args()
     app = tk.Tk()
     app.title('Drone Manager')
     app.geometry('420x220')
@@ -1,7 +1,14 @@
 import asyncio
+import os
+import threading
+from time import time
 from mavsdk import System, MissionItem, OffboardError, PositionNedYaw, Action
-import math
-from path_planning_pruned import planned_path
+import numpy as np
+from functools import partial
+from geo import get_location_offset_meters
+from path_planner import field_grid, plan
+from geo_grid import load_zones
+from mission_replan import MissionReplanner, replan_mission, upload_mission_suffix
 
 
 async def connect_sitl():
@@ -98,16 +105,162 @@ async def get_lat_lon(drone):
         break
     return lat, lon
 
-def get_location_offset_meters(original_lat, original_lon, dNorth, dEast):
-    earth_radius = 6378137.0    # Radius of "spherical" earth
-    # Coordinate offsets in radians
-    dLat = dNorth/earth_radius
-    dLon = dEast/(earth_radius*math.cos(math.pi*original_lat/180))
+class _SampleRing():
+    """ Fixed size ring of timestamped samples stored in preallocated arrays
+    Telemetry appends on the event loop while the detection threads read, so both hold the lock.
+    """
 
-    #New position in decimal degrees
-    newlat = original_lat + (dLat * 180/math.pi)
-    newlon = original_lon + (dLon * 180/math.pi)
-    return newlat, newlon
+    def __init__(self, size, columns):
+        self.times = np.zeros(size)
+        self.values = np.zeros((size, columns))
+        self.size = size
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def append(self, timestamp, values):
+        with self._lock:
+            i = self.count % self.size
+            self.times[i] = timestamp
+            self.values[i] = values
+            self.count += 1
+
+    def ordered(self):
+        """ Returns a (times, values) snapshot, oldest first """
+        with self._lock:
+            if self.count <= self.size:
+                return self.times[:self.count].copy(), self.values[:self.count].copy()
+            i = self.count % self.size
+            return np.roll(self.times, -i), np.roll(self.values, -i, axis=0)
+
+
+class PoseHistory():
+    """Pose history ring buffer with timestamp interpolation
+    Position and attitude arrive on separate telemetry streams at their own rates, so each has
+    its own ring. interpolate() linearly interpolates both at any timestamp inside the history
+    (yaw is unwrapped first) and clamps to the oldest/newest sample outside of it.
+    Attributes:
+        positions (_SampleRing): (lat, lon, rel_alt) samples
+        attitudes (_SampleRing): (roll, pitch, yaw) samples
+    """
+
+    def __init__(self, size=200):
+        self.positions = _SampleRing(size, 3)
+        self.attitudes = _SampleRing(size, 3)
+
+    def add_position(self, timestamp, lat, lon, rel_alt):
+        self.positions.append(timestamp, (lat, lon, rel_alt))
+
+    def add_attitude(self, timestamp, roll, pitch, yaw):
+        self.attitudes.append(timestamp, (roll, pitch, yaw))
+
+    def ready(self):
+        return self.positions.count > 0 and self.attitudes.count > 0
+
+    def interpolate(self, timestamp):
+        """ Pose of the vehicle at `timestamp`
+        Args:
+            timestamp (float): time.time() based timestamp, e.g. a frame capture time
+        Returns:
+            dict: lat, lon, alt (relative, m), roll, pitch, yaw (deg)
+        """
+        if not self.ready():
+            raise ValueError('No telemetry received yet')
+        t_pos, positions = self.positions.ordered()
+        t_att, attitudes = self.attitudes.ordered()
+        lat, lon, alt = (np.interp(timestamp, t_pos, positions[:, i]) for i in range(3))
+        roll, pitch = (np.interp(timestamp, t_att, attitudes[:, i]) for i in range(2))
+        yaw = np.degrees(np.interp(timestamp, t_att, np.unwrap(np.radians(attitudes[:, 2]))))
+        yaw = (yaw + 180) % 360 - 180
+        return {'lat': lat, 'lon': lon, 'alt': alt, 'roll': roll, 'pitch': pitch, 'yaw': yaw}
+
+
+class TelemetryCache():
+    """Keeps the latest vehicle telemetry in memory
+    Subscribes once to the position and attitude streams and stores the latest sample plus a
+    short timestamped history, so lookups are plain synchronous reads instead of a telemetry
+    round trip per query.
+    Attributes:
+        drone (System): connected MAVSDK system
+        position (dict): latest lat, lon, rel_alt, abs_alt and its timestamp
+        attitude (dict): latest roll, pitch, yaw and its timestamp
+        history (PoseHistory): timestamped pose history used for interpolation
+    """
+
+    def __init__(self, drone, history_size=200):
+        self.drone = drone
+        self.position = {}
+        self.attitude = {}
+        self.history = PoseHistory(history_size)
+        self._tasks = []
+
+    def start(self):
+        """ Start the background subscriptions, returns self for chaining """
+        self._tasks = [asyncio.ensure_future(self._watch_position()),
+                       asyncio.ensure_future(self._watch_attitude())]
+        return self
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def wait_ready(self, timeout=10.0, poll=0.05):
+        """ Wait until both streams have delivered their first sample, TimeoutError after `timeout` seconds
+        (None waits forever) """
+        async def first_samples():
+            while not (self.position and self.attitude):
+                await asyncio.sleep(poll)
+        try:
+            await asyncio.wait_for(first_samples(), timeout)
+        except asyncio.TimeoutError:
+            missing = [name for name, sample in (('position', self.position), ('attitude', self.attitude)) if not sample]
+            raise TimeoutError(f'No {" and ".join(missing)} telemetry after {timeout}s') from None
+
+    async def _watch_position(self):
+        async for position in self.drone.telemetry.position():
+            timestamp = time()
+            self.position = {'lat': position.latitude_deg,
+                             'lon': position.longitude_deg,
+                             'rel_alt': position.relative_altitude_m,
+                             'abs_alt': position.absolute_altitude_m,
+                             'timestamp': timestamp}
+            self.history.add_position(timestamp, position.latitude_deg, position.longitude_deg,
+                                      position.relative_altitude_m)
+
+    async def _watch_attitude(self):
+        async for angle in self.drone.telemetry.attitude_euler():
+            timestamp = time()
+            self.attitude = {'roll': angle.roll_deg,
+                             'pitch': angle.pitch_deg,
+                             'yaw': angle.yaw_deg,
+                             'timestamp': timestamp}
+            self.history.add_attitude(timestamp, angle.roll_deg, angle.pitch_deg, angle.yaw_deg)
+
+    def relative_altitude(self):
+        return self.position.get('rel_alt')
+
+    def euler_angles(self):
+        return self.attitude.get('roll'), self.attitude.get('pitch'), self.attitude.get('yaw')
+
+    def lat_lon(self):
+        return self.position.get('lat'), self.position.get('lon')
+
+    def pose_at(self, timestamp):
+        """ Interpolated pose at `timestamp`, see PoseHistory.interpolate() """
+        return self.history.interpolate(timestamp)
+
+def mission_item(lat, lon, mission_alt, mission_spd, CAM_pitch=0, CAM_yaw=0):
+    """ Fly-through waypoint as used by the planned missions """
+    return MissionItem(lat,
+                       lon,
+                       mission_alt,
+                       mission_spd,
+                       is_fly_through=True,
+                       gimbal_pitch_deg=CAM_pitch,
+                       gimbal_yaw_deg=CAM_yaw,
+                       camera_action=MissionItem.CameraAction.NONE,
+                       loiter_time_s=float('nan'),
+                       camera_photo_interval_s=float('nan'))
 
 async def square_mission(mission_alt=20, mission_spd=10, mission_north=10, mission_east=10, 
                          mission_south=-10, RTL_alt=10, CAM_pitch=0, CAM_yaw=0):
@@ -293,7 +446,45 @@ async def search_mission(search_lat, search_lon, mission_alt=20, mission_spd=10,
     # await termination_task
     return drone, home_lat, home_lon
 
-async def path_mission(goal_loc, mission_alt=20, mission_spd=10, RTL_alt=10, CAM_pitch=0, CAM_yaw=0, VTOL=False):
+async def coverage_mission(polygon, mission_alt=20, mission_spd=10, RTL_alt=10, CAM_pitch=-90, CAM_yaw=0,
+                           pattern='lawnmower', overlap=0.2, camera=None, zones=None):
+    '''
+    Searches a [lat, lon] polygon with a lawnmower/spiral pattern whose lanes are spaced by the
+    camera footprint at mission_alt, avoiding the no-fly zones of the `zones` file
+    '''
+    from coverage_planner import coverage_path
+    from geo_grid import GeoGrid, load_zones, zone_points
+    drone = await connect_sitl()
+    asyncio.ensure_future(print_mission_progress(drone)) # Parallel task
+
+    home_lat, home_lon = await get_lat_lon(drone)
+    grid = None
+    if zones is not None:
+        zones = load_zones(zones)
+        grid = GeoGrid.around(np.concatenate((zone_points([{'polygon': polygon}]), zone_points(zones))))
+        grid.add_zones(zones)
+    path = await asyncio.get_event_loop().run_in_executor(
+        None, partial(coverage_path, polygon, mission_alt, pattern, camera, overlap, grid))
+    print(f'{pattern} coverage: {len(path)} waypoints')
+    mission_items = [mission_item(home_lat, home_lon, mission_alt, mission_spd, CAM_pitch, CAM_yaw)]    # Takeoff
+    for waypoint in path:
+        mission_items.append(mission_item(waypoint[0], waypoint[1], mission_alt, mission_spd, CAM_pitch, CAM_yaw))
+
+    await drone.mission.set_return_to_launch_after_mission(True)    # RTL after last wp
+    await drone.param.set_float_param("MIS_TAKEOFF_ALT", mission_alt)   # Setting takeoff ALT
+    await drone.param.set_float_param("RTL_DESCEND_ALT", RTL_alt)   # Setting RTL ALT
+    await drone.param.set_float_param("RTL_RETURN_ALT", RTL_alt)   # Setting RTL ALT
+
+    await drone.mission.upload_mission(mission_items)
+    await drone.action.arm()
+    await drone.mission.start_mission()
+    return drone, home_lat, home_lon
+
+async def path_mission(goal_loc, mission_alt=20, mission_spd=10, RTL_alt=10, CAM_pitch=0, CAM_yaw=0, VTOL=False,
+                       planner='a_star_fast', zones=None, editor=False):
+    '''
+    Plans from home to goal_loc without a display in an executor, or with the matplotlib editor if editor=True
+    '''
     drone = await connect_sitl()
     asyncio.ensure_future(print_mission_progress(drone)) # Parallel task
     # termination_task = asyncio.ensure_future(observe_is_in_air(drone)) # keeps script running if drone in air
@@ -302,32 +493,24 @@ async def path_mission(goal_loc, mission_alt=20, mission_spd=10, RTL_alt=10, CAM
     home_loc = home_lat, home_lon
     print(f'home location:\n\t>lat:{home_lat}\n\t>lon:{home_lon}')
     # await drone.mission.clear_mission()     # Clear previous missions stored on drone
-    path = planned_path(home_loc, goal_loc, GRID_SIZE=200)
+    replanner = None
+    if editor:
+        from path_planning_pruned import planned_path     # needs a display, blocks until the window is closed
+        path = planned_path(home_loc, goal_loc, GRID_SIZE=200, planner=planner, zones=zones)
+    elif planner == 'd_star_lite':
+        # The search is kept, so the mission is repaired in flight when the zones file changes
+        replanner = MissionReplanner(field_grid(GRID_SIZE=200, zones=zones), home_loc, goal_loc)
+        path = await asyncio.get_event_loop().run_in_executor(None, replanner.waypoints)
+    else:
+        grid = field_grid(GRID_SIZE=200, zones=zones)
+        path = await asyncio.get_event_loop().run_in_executor(None, partial(plan, home_loc, goal_loc, grid, planner))
     mission_items = []
     # Takeoff
     if not VTOL:
-        mission_items.append(MissionItem(home_lat,
-                                        home_lon,
-                                        mission_alt,
-                                        mission_spd,
-                                        is_fly_through=True,
-                                        gimbal_pitch_deg=CAM_pitch,
-                                        gimbal_yaw_deg=CAM_yaw,
-                                        camera_action=MissionItem.CameraAction.NONE,
-                                        loiter_time_s=float('nan'),
-                                        camera_photo_interval_s=float('nan')))
+        mission_items.append(mission_item(home_lat, home_lon, mission_alt, mission_spd, CAM_pitch, CAM_yaw))
     # Setting Mission waypoints
     for waypoint in path:
-        mission_items.append(MissionItem(waypoint[0],
-                                        waypoint[1],
-                                        mission_alt,
-                                        mission_spd,
-                                        is_fly_through=True,
-                                        gimbal_pitch_deg=CAM_pitch,
-                                        gimbal_yaw_deg=CAM_yaw,
-                                        camera_action=MissionItem.CameraAction.NONE,
-                                        loiter_time_s=float('nan'),
-                                        camera_photo_interval_s=float('nan')))
+        mission_items.append(mission_item(waypoint[0], waypoint[1], mission_alt, mission_spd, CAM_pitch, CAM_yaw))
     
     await drone.mission.set_return_to_launch_after_mission(True)    # RTL after last wp
     await drone.param.set_float_param("MIS_TAKEOFF_ALT", mission_alt)   # Setting takeoff ALT
@@ -344,9 +527,34 @@ async def path_mission(goal_loc, mission_alt=20, mission_spd=10, RTL_alt=10, CAM
         await asyncio.sleep(30)
 
     await drone.mission.start_mission()
+    if replanner is not None and zones is not None:
+        make_item = partial(mission_item, mission_alt=mission_alt, mission_spd=mission_spd,
+                            CAM_pitch=CAM_pitch, CAM_yaw=CAM_yaw)
+        asyncio.ensure_future(watch_zones(drone, replanner, mission_items, zones, make_item)) # Parallel task
     # await termination_task
     return drone, home_lat, home_lon
 
+async def watch_zones(drone, replanner, mission_items, zones, make_item, period=1.0):
+    '''
+    Replans the rest of the mission whenever the `zones` file changes, e.g. a no-fly zone added in flight.
+    Only the cells that flipped are repaired (MissionReplanner) and only the changed suffix is uploaded.
+    '''
+    modified = os.path.getmtime(zones)
+    while True:
+        await asyncio.sleep(period)
+        if os.path.getmtime(zones) == modified:
+            continue
+        modified = os.path.getmtime(zones)
+        try:
+            changed = replanner.add_zones(load_zones(zones))
+        except ValueError as error:     # e.g. the file is still being written
+            print(f'Could not load {zones}: {error}')
+            continue
+        if changed:
+            print(f'{len(changed)} cells blocked by new zones, replanning')
+            location = await get_lat_lon(drone)
+            mission_items = await replan_mission(drone, replanner, mission_items, location, make_item)
+
 
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
@@ -0,0 +1,109 @@
+import numpy as np
+
+from geo_grid import GeoGrid
+from path_planner import prune_path
+from planning_utils import DStarLite, string_pull
+
+
+class MissionReplanner():
+    """Keeps a D* Lite search from the vehicle to the goal on a GeoGrid between replans
+    When no-fly zones appear in flight, add_zones() hands only the cells that flipped to
+    DStarLite.update_cells() and waypoints(location) moves the start to the vehicle with
+    DStarLite.move_start(), so a repair costs in proportion to the change instead of the map.
+    Attributes:
+        grid (GeoGrid): planning grid, its occupancy follows add_zones()
+        planner (DStarLite): the incremental search on the cells of the grid
+        prune (bool): pulled and pruned waypoints instead of every cell
+    """
+
+    def __init__(self, grid, home, goal, prune=True):
+        home_cell, goal_cell = grid.to_cell(*home), grid.to_cell(*goal)
+        for name, cell in (('home', home_cell), ('goal', goal_cell)):
+            if not grid.contains(*cell):
+                raise ValueError(f'{name} location is outside of the planning grid')
+        self.grid = grid
+        self.planner = DStarLite(grid.grid, home_cell, goal_cell)
+        self.prune = prune
+
+    def add_zones(self, zones, inflation=None):
+        """ Blocks the zones returned by load_zones()
+        Returns:
+            list: the (row, col) cells that became occupied
+        """
+        grid = GeoGrid(self.grid.lat0, self.grid.lon0, self.grid.dlat, self.grid.dlon, *self.grid.shape,
+                       inflation=self.grid.inflation)
+        grid.add_zones(zones, inflation)
+        changed = self.planner.update_cells(np.argwhere((grid.grid == 1) & (self.grid.grid != 1)))
+        self.grid.grid |= grid.grid
+        return changed
+
+    def waypoints(self, location=None):
+        """ [lat, lon] waypoints to the goal, from `location` (the vehicle) if given
+        Returns:
+            np.ndarray: (N,2) waypoints starting at the start cell, empty if there is no path
+        """
+        if location is not None:
+            cell = self.grid.to_cell(*location)
+            if not self.grid.contains(*cell):
+                raise ValueError('vehicle location is outside of the planning grid')
+            self.planner.move_start(cell)
+        path, _ = self.planner.plan()
+        if self.prune and len(path):
+            path = prune_path(string_pull(self.planner.grid, path))
+        cells = np.asarray(path, dtype=np.int64).reshape(-1, 2)
+        waypoints = np.empty(cells.shape)
+        waypoints[:, 0], waypoints[:, 1] = self.grid.to_latlon(cells[:, 0], cells[:, 1])
+        return waypoints
+
+
+def _item_key(item):
+    # MissionItem equality is useless with the NaN fields, compare where the item flies to
+    return item.latitude_deg, item.longitude_deg, item.relative_altitude_m, item.speed_m_s
+
+def changed_item(remaining, remaining_items):
+    '''
+    Index of the first item where two mission suffixes differ, None if they are the same
+    '''
+    old, new = [_item_key(item) for item in remaining], [_item_key(item) for item in remaining_items]
+    if old == new:
+        return None
+    return next((i for i, (a, b) in enumerate(zip(old, new)) if a != b), min(len(old), len(new)))
+
+async def upload_mission_suffix(drone, mission_items, remaining_items):
+    '''
+    Replaces the part of the mission the drone has not flown yet, e.g. after MissionReplanner repaired the path
+    Args:
+        mission_items (list): MissionItems currently stored on the drone
+        remaining_items (list): MissionItems to fly from the current mission item on
+    Returns:
+        list: the MissionItems stored on the drone afterwards
+    Nothing is sent when the remaining items did not change. Otherwise only the remaining suffix
+    is uploaded (uploading replaces the stored mission) and the mission continues with its first item.
+    '''
+    async for mission_progress in drone.mission.mission_progress():
+        current = mission_progress.current_item_index
+        break
+    changed = changed_item(mission_items[current:], remaining_items)
+    if changed is None:
+        return mission_items
+    print(f'Mission changed from item {current + changed}, uploading the {len(remaining_items)} remaining items')
+    await drone.mission.upload_mission(remaining_items)
+    await drone.mission.set_current_mission_item(0)
+    await drone.mission.start_mission()
+    return remaining_items
+
+async def replan_mission(drone, replanner, mission_items, location, make_item):
+    '''
+    Repairs the path from the vehicle `location` and uploads the changed suffix of the mission
+    make_item: make_item(lat, lon) -> MissionItem, e.g. a partial of mavsdk_utils.mission_item
+    Returns:
+        list: the MissionItems stored on the drone afterwards, unchanged if there is no path anymore
+    '''
+    waypoints = replanner.waypoints(location)
+    if len(waypoints) == 0:
+        print('No path to the goal anymore, the mission is left unchanged')
+    if len(waypoints) < 2:
+        return mission_items
+    # The first waypoint is the cell the vehicle is in
+    remaining_items = [make_item(lat, lon) for lat, lon in waypoints[1:]]
+    return await upload_mission_suffix(drone, mission_items, remaining_items)
@@ -0,0 +1,141 @@
+"""Tests for mission_replan, the in-flight D* Lite repair and the mission suffix upload."""
+import asyncio
+import contextlib
+import io
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+from geo_grid import GeoGrid
+from mission_replan import MissionReplanner, changed_item, replan_mission, upload_mission_suffix
+from planning_utils import DStarLite, a_star_fast
+
+LAT, LON = 38.16, -122.455
+
+
+def _quiet(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def _item(lat, lon, alt=20.0, speed=10.0):
+    # Same fields as a MissionItem, NaN where MissionItem has NaNs
+    return SimpleNamespace(latitude_deg=lat, longitude_deg=lon, relative_altitude_m=alt, speed_m_s=speed,
+                           loiter_time_s=float('nan'))
+
+
+def _drone(current):
+    """ drone with a mocked drone.mission at mission item `current` """
+    async def mission_progress():
+        yield SimpleNamespace(current_item_index=current, mission_count=10)
+    mission = mock.Mock(mission_progress=mission_progress, upload_mission=mock.AsyncMock(),
+                        set_current_mission_item=mock.AsyncMock(), start_mission=mock.AsyncMock())
+    return SimpleNamespace(mission=mission)
+
+
+class MissionReplannerTest(unittest.TestCase):
+
+    def setUp(self):
+        # 1 m cells, 100 x 100 m
+        self.grid = GeoGrid.from_bounds(LAT, LON, LAT + 0.0009, LON + 0.00114, resolution=1.0)
+        self.home, self.goal = self.grid.to_latlon(50, 5), self.grid.to_latlon(50, 95)
+
+    def _zone(self, r0, c0, r1, c1):
+        return {'polygon': [self.grid.to_latlon(r, c) for r, c in ((r0, c0), (r0, c1), (r1, c1), (r1, c0))],
+                'inclusion': False}
+
+    def _cells(self, waypoints):
+        rows, cols = self.grid.to_cell(waypoints[:, 0], waypoints[:, 1])
+        return list(zip(rows.tolist(), cols.tolist()))
+
+    def test_repair_matches_a_fresh_search(self):
+        replanner = MissionReplanner(self.grid, self.home, self.goal, prune=False)
+        self.assertEqual(len(_quiet(replanner.waypoints)), 91)
+        changed = replanner.add_zones([self._zone(20, 40, 80, 45)])
+        self.assertEqual(len(changed), 61*6)
+        self.assertTrue(replanner.planner.grid[50, 42] and self.grid.grid[50, 42])
+        # Nothing new to block
+        self.assertEqual(replanner.add_zones([self._zone(30, 40, 70, 45)]), [])
+        cells = self._cells(_quiet(replanner.waypoints, self.grid.to_latlon(50, 20)))
+        self.assertEqual(cells[0], (50, 20))
+        self.assertEqual(cells[-1], (50, 95))
+        self.assertFalse(any(self.grid.grid[r, c] for r, c in cells))
+        path, _ = _quiet(a_star_fast, self.grid.grid, (50, 20), (50, 95))
+        self.assertEqual(len(cells), len(path))
+
+    def test_repair_expands_less_than_a_fresh_search(self):
+        rng = np.random.default_rng(0)
+        self.grid.grid[:] = rng.random(self.grid.shape) < 0.2
+        self.grid.grid[50] = 0
+        replanner = MissionReplanner(self.grid, self.home, self.goal)
+        _quiet(replanner.waypoints)
+        # A zone appears just ahead of the vehicle
+        replanner.add_zones([self._zone(47, 35, 53, 37)])
+        _quiet(replanner.waypoints, self.grid.to_latlon(50, 30))
+        fresh = DStarLite(self.grid.grid, (50, 30), (50, 95))
+        _quiet(fresh.plan)
+        self.assertLess(replanner.planner.expansions, fresh.expansions)
+
+    def test_pruned_waypoints(self):
+        waypoints = _quiet(MissionReplanner(self.grid, self.home, self.goal).waypoints)
+        self.assertEqual(self._cells(waypoints), [(50, 5), (50, 95)])
+
+    def test_outside_of_the_grid(self):
+        with self.assertRaises(ValueError):
+            MissionReplanner(self.grid, (0.0, 0.0), self.goal)
+        replanner = MissionReplanner(self.grid, self.home, self.goal)
+        with self.assertRaises(ValueError):
+            replanner.waypoints((0.0, 0.0))
+
+
+class UploadMissionSuffixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mission_items = [_item(38.0, -122.0 + 0.001*i) for i in range(6)]
+
+    def _upload(self, drone, remaining_items):
+        return _quiet(asyncio.run, upload_mission_suffix(drone, self.mission_items, remaining_items))
+
+    def test_changed_item(self):
+        items = self.mission_items
+        self.assertIsNone(changed_item(items[2:], [_item(i.latitude_deg, i.longitude_deg) for i in items[2:]]))
+        self.assertEqual(changed_item(items[2:], items[2:4] + [_item(39.0, -122.0)] + items[5:]), 2)
+        self.assertEqual(changed_item(items[2:], items[2:5]), 3)
+        self.assertEqual(changed_item(items[2:], items[2:] + [_item(39.0, -122.0)]), 4)
+
+    def test_unchanged_suffix_is_not_sent(self):
+        drone = _drone(current=3)
+        stored = self._upload(drone, [_item(i.latitude_deg, i.longitude_deg) for i in self.mission_items[3:]])
+        self.assertIs(stored, self.mission_items)
+        drone.mission.upload_mission.assert_not_awaited()
+        drone.mission.start_mission.assert_not_awaited()
+
+    def test_changed_suffix_replaces_the_mission(self):
+        drone = _drone(current=3)
+        remaining_items = self.mission_items[3:4] + [_item(38.5, -122.0)] + self.mission_items[5:]
+        stored = self._upload(drone, remaining_items)
+        self.assertIs(stored, remaining_items)
+        # The flown items are not uploaded again, the drone continues with the first remaining one
+        drone.mission.upload_mission.assert_awaited_once_with(remaining_items)
+        drone.mission.set_current_mission_item.assert_awaited_once_with(0)
+        drone.mission.start_mission.assert_awaited_once()
+
+    def test_replan_mission(self):
+        grid = GeoGrid.from_bounds(LAT, LON, LAT + 0.0009, LON + 0.00114, resolution=1.0)
+        replanner = MissionReplanner(grid, grid.to_latlon(50, 5), grid.to_latlon(50, 95))
+        mission_items = [_item(lat, lon) for lat, lon in _quiet(replanner.waypoints)]
+        grid_zone = [grid.to_latlon(r, c) for r, c in ((20, 60), (20, 65), (80, 65), (80, 60))]
+        replanner.add_zones([{'polygon': grid_zone, 'inclusion': False}])
+        drone = _drone(current=1)
+        stored = _quiet(asyncio.run, replan_mission(drone, replanner, mission_items, grid.to_latlon(50, 30), _item))
+        # Around the zone instead of straight to the goal
+        self.assertGreater(len(stored), 1)
+        rows, cols = grid.to_cell(np.array([i.latitude_deg for i in stored]), np.array([i.longitude_deg for i in stored]))
+        self.assertEqual((rows[-1], cols[-1]), (50, 95))
+        drone.mission.upload_mission.assert_awaited_once_with(stored)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import cv2
+import numpy as np
+
+from detectors import tile_layout
+from geo import EARTH_RADIUS
+
+
+def _box_sum(integral, top, left, bottom, right):
+    return integral[bottom, right] - integral[top, right] - integral[bottom, left] + integral[top, left]
+
+
+class MotionGate():
+    """Decides per frame (or per tile) whether the detector has to run
+    Frames are downsampled to grayscale and compared with the last frame the detector ran on,
+    after warping that reference by the ground-plane homography between the two telemetry poses,
+    so the drone's own motion does not count as change. The detector only runs where more than
+    `min_changed` pixels changed (a person far below is only a few of them) or the ground the reference did not cover exceeds
+    `new_ground` (new ground enters at the edge of the view, so it is still visible when the
+    detector runs). The reference is not advanced on skipped frames, so slow change and new
+    ground accumulate until they trigger a pass.
+    Attributes:
+        camera (CameraModel): projects the reference into the current frame, None for plain differencing
+        pose_history (PoseHistory): telemetry poses, e.g. TelemetryCache.history
+        tiles (tuple): (rows, cols) to gate tiles of a TiledDetector, None to gate whole frames
+        width (int): width of the downsampled frames
+        pixel_threshold (int): gray level difference of a changed pixel
+        min_changed (int): changed pixels of the downsampled frame that trigger the detector
+        new_ground (float): fraction of pixels outside of the reference view that triggers the detector
+        max_skip (int): the detector runs at least every max_skip + 1 frames
+        force (callable): force() -> True to run the detector regardless, e.g. while tracks are not stable
+        frames, skipped (int): frames seen and frames the detector was skipped on
+        tiles_run, tiles_total (int): tiles the detector ran on and tiles seen
+    """
+
+    def __init__(self, camera=None, pose_history=None, tiles=None, overlap=0.2, width=160,
+                 pixel_threshold=25, min_changed=8, new_ground=0.25, max_skip=30, force=None):
+        self.camera = camera
+        self.pose_history = pose_history
+        self.tiles = tiles
+        self.overlap = overlap
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.new_ground = new_ground
+        self.max_skip = max_skip
+        self.force = force
+        self.frames = self.skipped = self.tiles_run = self.tiles_total = 0
+        self._shape = self._bounds = None
+        self._references = {}   # key -> (small frame, pose) the detector last ran on
+        self._tile_refs = None  # reference key of every tile
+        self._since_run = None
+
+    @property
+    def skip_rate(self):
+        """ Fraction of the frames the detector was skipped on """
+        return self.skipped/self.frames if self.frames else 0.0
+
+    @property
+    def tile_skip_rate(self):
+        """ Fraction of the tiles the detector was skipped on """
+        return 1 - self.tiles_run/self.tiles_total if self.tiles_total else 0.0
+
+    def _pose(self, timestamp):
+        if self.pose_history is None or not self.pose_history.ready():
+            return None
+        return self.pose_history.interpolate(timestamp)
+
+    def _homography(self, reference_pose, pose, shape):
+        """ Maps pixels of the reference onto the current frame through the ground plane, None if it does not fill the view """
+        if self.camera is None or reference_pose is None or pose is None:
+            return np.eye(3)    # no ego-motion compensation, plain differencing
+        h, w = shape
+        corners = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float64)
+        rays = self.camera.pixel_rays(corners, shape, reference_pose['roll'], reference_pose['pitch'],
+                                      reference_pose['yaw'])
+        ground = self.camera.ground_offsets(rays, reference_pose['alt'])
+        # Ground points relative to the current position, then into the current camera frame
+        north = np.radians(pose['lat'] - reference_pose['lat'])*EARTH_RADIUS
+        east = np.radians(pose['lon'] - reference_pose['lon'])*EARTH_RADIUS*np.cos(np.radians(pose['lat']))
+        points = np.column_stack((ground - (north, east), np.full(4, float(pose['alt']))))
+        camera = points @ self.camera.camera_to_ned(pose['roll'], pose['pitch'], pose['yaw'])
+        if not np.isfinite(camera).all() or (camera[:, 2] <= 1e-6).any():
+            return None
+        pixels = camera @ self.camera.intrinsics(shape).T
+        pixels = pixels[:, 0:2]/pixels[:, 2:3]
+        return cv2.getPerspectiveTransform(corners.astype(np.float32), pixels.astype(np.float32))
+
+    def _novel(self, small, reference, homography):
+        """ Integral images of the pixels that were not in view of the reference and of those that changed """
+        shape = small.shape[::-1]
+        if homography is None:
+            return cv2.integral(np.ones(small.shape, dtype=np.uint8)), cv2.integral(np.zeros(small.shape, dtype=np.uint8))
+        warped = cv2.warpPerspective(reference, homography, shape, flags=cv2.INTER_LINEAR)
+        valid = cv2.warpPerspective(np.ones(reference.shape, dtype=np.uint8), homography, shape,
+                                    flags=cv2.INTER_NEAREST)
+        # Blurred and warped borders are blended with the outside, they only count as unseen
+        inner = cv2.erode(valid, np.ones((5, 5), dtype=np.uint8), borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        changed = ((inner > 0) & (cv2.absdiff(small, warped) > self.pixel_threshold)).astype(np.uint8)
+        # Isolated pixels are resampling residue of the warp, a target is a blob
+        changed = cv2.morphologyEx(changed, cv2.MORPH_OPEN, np.ones((2, 2), dtype=np.uint8))
+        return cv2.integral(1 - valid), cv2.integral(changed)
+
+    def __call__(self, frame, timestamp):
+        """
+        Returns:
+            bool, or a (tiles,) bool array with tiles: where the detector has to run
+        """
+        height = max(int(round(self.width*frame.shape[0]/frame.shape[1])), 1)
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        pose = self._pose(timestamp)
+        if self._shape != frame.shape[0:2]:
+            self._shape = frame.shape[0:2]
+            layout = tile_layout(self._shape, self.tiles or (1, 1), self.overlap)
+            self._bounds = np.rint(layout*height/frame.shape[0]).astype(np.int64)
+            self._references, self._tile_refs = {}, None
+            self._since_run = np.zeros(len(layout), dtype=np.int64)
+        run = np.ones(len(self._bounds), dtype=bool)
+        if self._tile_refs is not None and not (self.force is not None and self.force()):
+            for key in set(self._tile_refs):
+                reference, reference_pose = self._references[key]
+                homography = self._homography(reference_pose, pose, small.shape)
+                unseen, changed = self._novel(small, reference, homography)
+                for i in np.flatnonzero(self._tile_refs == key):
+                    top, left, bottom, right = self._bounds[i]
+                    area = (bottom - top)*(right - left)
+                    run[i] = _box_sum(unseen, top, left, bottom, right) > self.new_ground*area or \
+                        _box_sum(changed, top, left, bottom, right) > self.min_changed
+            run |= self._since_run >= self.max_skip
+        if run.any():
+            self._references[timestamp] = (small, pose)
+            self._tile_refs = np.where(run, timestamp, self._tile_refs if self._tile_refs is not None else timestamp)
+            self._references = {key: self._references[key] for key in set(self._tile_refs)}
+        self._since_run = np.where(run, 0, self._since_run + 1)
+        self.frames += 1
+        self.skipped += int(not run.any())
+        self.tiles_run += int(run.sum())
+        self.tiles_total += len(run)
+        return run if self.tiles is not None else bool(run[0])
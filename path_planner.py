@@ -0,0 +1,127 @@
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+
+from distance_field import inflate
+from geo_grid import GeoGrid, load_zones, zone_points
+from planning_utils import PLANNERS, string_pull
+
+# Flying field the planning grid covers by default (lat_min, lon_min, lat_max, lon_max)
+FIELD = (38.1598, -122.457, 38.163, -122.451)
+
+
+def field_grid(GRID_SIZE=200, zones=None, inflation=0.0, field=FIELD):
+    '''
+    GRID_SIZE x GRID_SIZE GeoGrid over the field, with the no-fly zones of the `zones` file if given
+    '''
+    lat_min, lon_min, lat_max, lon_max = field
+    geo = GeoGrid(lat_min, lon_min, (lat_max - lat_min)/(GRID_SIZE - 1), (lon_max - lon_min)/(GRID_SIZE - 1),
+                  GRID_SIZE, GRID_SIZE, inflation=inflation)
+    if zones is not None:
+        geo.add_zones(load_zones(zones))
+    return geo
+
+def collinearity_check(p1, p2, p3, epsilon=1e-6):
+    '''
+    returns True if points are collinear, all arguments may be (N,2) arrays of points
+    '''
+    p1, p2, p3 = np.asarray(p1, dtype=float), np.asarray(p2, dtype=float), np.asarray(p3, dtype=float)
+    d1, d2 = p2 - p1, p3 - p2
+    return np.abs(d1[..., 0]*d2[..., 1] - d1[..., 1]*d2[..., 0]) < epsilon
+
+def prune_path(path):
+    '''
+    drops every waypoint that is collinear with its neighbours, in one vectorized pass
+    '''
+    points = np.asarray(path).reshape(-1, 2)
+    if len(points) < 3:
+        return points.tolist()
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:-1] = ~collinearity_check(points[:-2], points[1:-1], points[2:])
+    return points[keep].tolist()
+
+def plan_cells(grid, start, goal, algorithm='a_star_fast', prune=True):
+    '''
+    Runs a planner of planning_utils.PLANNERS on an occupancy array (1 = obstacle)
+    Returns:
+        (path, waypoints, cost): every cell of the path, the cells to fly to (pulled and pruned
+        if prune) and the path cost in cells
+    '''
+    if algorithm not in PLANNERS:
+        raise ValueError(f'Unknown planner {algorithm!r}, choose one of {", ".join(PLANNERS)}')
+    path, cost = PLANNERS[algorithm](grid, start, goal)
+    waypoints = prune_path(string_pull(grid, path)) if prune and len(path) else [list(p) for p in path]
+    return path, waypoints, cost
+
+def plan(home, goal, grid, algorithm='a_star_fast', prune=True, margin=0.0):
+    '''
+    Headless planning between two [lat, lon] locations on a GeoGrid, safe to run in an executor
+    margin: keep this many meters away from obstacles (inflation through the cached distance field)
+    Returns:
+        np.ndarray: (N,2) [lat, lon] waypoints from home to goal, empty if there is no path
+    '''
+    home_cell, goal_cell = grid.to_cell(*home), grid.to_cell(*goal)
+    for name, cell in (('home', home_cell), ('goal', goal_cell)):
+        if not grid.contains(*cell):
+            raise ValueError(f'{name} location is outside of the planning grid')
+    occupancy = inflate(grid.grid, margin, grid.cell_size) if margin > 0 else grid.grid
+    _, waypoints, _ = plan_cells(occupancy, home_cell, goal_cell, algorithm, prune)
+    waypoints = np.asarray(waypoints, dtype=np.int64).reshape(-1, 2)
+    path = np.empty(waypoints.shape)
+    path[:,0], path[:,1] = grid.to_latlon(waypoints[:,0], waypoints[:,1])
+    return path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Plan a path between two locations without the GUI')
+    parser.add_argument('--home', type=float, nargs=2, required=True, metavar=('LAT', 'LON'))
+    parser.add_argument('--goal', type=float, nargs=2, required=True, metavar=('LAT', 'LON'))
+    parser.add_argument('--algorithm', default='a_star_fast', choices=list(PLANNERS),
+                        help='grid planner')
+    parser.add_argument('--zones', default=None,
+                        help='no-fly zones (GeoJSON, KML, QGC .plan or ArduPilot fence file)')
+    parser.add_argument('--inflation', type=float, default=0.0,
+                        help='safety margin around the zones in meters')
+    parser.add_argument('--margin', type=float, default=0.0,
+                        help='safety margin around every obstacle in meters, from the cached distance field')
+    parser.add_argument('--grid-size', type=int, default=200,
+                        help='cells per side of the field grid')
+    parser.add_argument('--resolution', type=float, default=None,
+                        help='square cells of this size in meters around home, goal and zones instead of the field grid')
+    parser.add_argument('--no-prune', dest='prune', action='store_false',
+                        help='return every cell instead of the pulled and pruned waypoints')
+    parser.add_argument('--output', default=None,
+                        help='write the waypoints to a .json or .csv file instead of stdout')
+    return parser.parse_args(argv)
+
+def grid_from_args(args):
+    if args.resolution is None:
+        return field_grid(args.grid_size, args.zones, args.inflation)
+    zones = load_zones(args.zones) if args.zones is not None else []
+    points = np.concatenate(([args.home, args.goal], zone_points(zones)))
+    geo = GeoGrid.around(points, resolution=args.resolution, inflation=args.inflation)
+    geo.add_zones(zones)
+    return geo
+
+def main(argv=None):
+    args = parse_args(argv)
+    path = plan(args.home, args.goal, grid_from_args(args), args.algorithm, args.prune, args.margin)
+    if args.output is None:
+        for waypoint in path:
+            print(waypoint)
+    elif args.output.endswith('.json'):
+        with open(args.output, 'w') as f:
+            json.dump(path.tolist(), f, indent=1)
+    else:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['lat', 'lon'])
+            writer.writerows(path.tolist())
+    return 0 if len(path) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
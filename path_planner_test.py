@@ -0,0 +1,118 @@
+"""Tests for path_planner, the headless planning pipeline and its CLI."""
+import contextlib
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import path_planner
+from geo_grid import GeoGrid
+
+HOME = (38.161437, -122.454534)
+GOAL = (38.16210, -122.45653)
+
+
+def _quiet(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+class PrunePathTest(unittest.TestCase):
+
+    def test_collinearity_check(self):
+        self.assertTrue(path_planner.collinearity_check((0, 0), (1, 1), (3, 3)))
+        self.assertFalse(path_planner.collinearity_check((0, 0), (1, 1), (3, 2)))
+        np.testing.assert_array_equal(
+            path_planner.collinearity_check([[0, 0], [0, 0]], [[1, 0], [1, 0]], [[2, 0], [2, 1]]), [True, False])
+
+    def test_prune_path(self):
+        path = [(0, 0), (1, 1), (2, 2), (2, 3), (2, 4), (3, 4)]
+        self.assertEqual(path_planner.prune_path(path), [[0, 0], [2, 2], [2, 4], [3, 4]])
+        self.assertEqual(path_planner.prune_path([(0, 0), (5, 5)]), [[0, 0], [5, 5]])
+
+
+class PlanTest(unittest.TestCase):
+
+    def setUp(self):
+        # The margin goes through the distance field disk cache, keep it out of the home directory
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        environment = mock.patch.dict(os.environ, {'UAV_PLANNING_CACHE': directory.name})
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.geo = path_planner.field_grid(GRID_SIZE=100)
+        self.geo.grid[40:60, 20:80] = 1
+
+    def test_plan_cells(self):
+        grid = np.zeros((20, 20), dtype=np.int64)
+        grid[5:15, 10] = 1
+        path, waypoints, cost = _quiet(path_planner.plan_cells, grid, (10, 0), (10, 19))
+        self.assertEqual(tuple(path[0]), (10, 0))
+        self.assertEqual(tuple(waypoints[-1]), (10, 19))
+        self.assertLess(len(waypoints), len(path))
+        _, cells, _ = _quiet(path_planner.plan_cells, grid, (10, 0), (10, 19), prune=False)
+        self.assertEqual([tuple(cell) for cell in cells], [tuple(cell) for cell in path])
+        with self.assertRaises(ValueError):
+            path_planner.plan_cells(grid, (0, 0), (1, 1), 'dijkstra')
+
+    def test_waypoints_avoid_the_obstacles(self):
+        home, goal = self.geo.to_latlon(20, 50), self.geo.to_latlon(80, 50)
+        for algorithm in ('a_star_fast', 'jps', 'theta_star', 'hpa_star'):
+            path = _quiet(path_planner.plan, home, goal, self.geo, algorithm)
+            rows, cols = self.geo.to_cell(path[:, 0], path[:, 1])
+            self.assertEqual((rows[0], cols[0]), (20, 50))
+            self.assertEqual((rows[-1], cols[-1]), (80, 50))
+            # Every leg between two waypoints stays clear of the block
+            for (r0, c0), (r1, c1) in zip(zip(rows, cols), zip(rows[1:], cols[1:])):
+                t = np.linspace(0, 1, 200)
+                self.assertFalse(self.geo.grid[np.rint(r0 + (r1 - r0)*t).astype(int),
+                                               np.rint(c0 + (c1 - c0)*t).astype(int)].any())
+
+    def test_margin_keeps_away_from_obstacles(self):
+        home, goal = self.geo.to_latlon(20, 50), self.geo.to_latlon(80, 50)
+        path = _quiet(path_planner.plan, home, goal, self.geo, margin=10.0)
+        rows, cols = self.geo.to_cell(path[:, 0], path[:, 1])
+        cell_w = self.geo.cell_size[1]
+        self.assertTrue((np.minimum(np.abs(cols - 20), np.abs(cols - 79))*cell_w >= 10.0 - cell_w).all())
+
+    def test_outside_of_the_grid(self):
+        with self.assertRaises(ValueError):
+            path_planner.plan((0.0, 0.0), GOAL, self.geo)
+
+    def test_no_path(self):
+        self.geo.grid[:, 50] = 1
+        home, goal = self.geo.to_latlon(50, 10), self.geo.to_latlon(50, 90)
+        self.assertEqual(_quiet(path_planner.plan, home, goal, self.geo).shape, (0, 2))
+
+
+class MainTest(unittest.TestCase):
+
+    def test_outputs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            json_path, csv_path = os.path.join(directory, 'path.json'), os.path.join(directory, 'path.csv')
+            argv = ['--home', *map(str, HOME), '--goal', *map(str, GOAL), '--grid-size', '100']
+            self.assertEqual(_quiet(path_planner.main, argv + ['--output', json_path]), 0)
+            self.assertEqual(_quiet(path_planner.main, argv + ['--output', csv_path]), 0)
+            with open(json_path) as f:
+                waypoints = json.load(f)
+            with open(csv_path) as f:
+                rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['lat', 'lon'])
+        np.testing.assert_allclose([[float(v) for v in row] for row in rows[1:]], waypoints)
+        np.testing.assert_allclose(waypoints[0], HOME, atol=1e-5)
+        np.testing.assert_allclose(waypoints[-1], GOAL, atol=1e-5)
+
+    def test_resolution_grid(self):
+        args = path_planner.parse_args(['--home', *map(str, HOME), '--goal', *map(str, GOAL), '--resolution', '2'])
+        geo = path_planner.grid_from_args(args)
+        self.assertIsInstance(geo, GeoGrid)
+        np.testing.assert_allclose(geo.cell_size, (2.0, 2.0), rtol=1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Button
-from planning_utils import a_star
+from path_planner import field_grid, plan_cells
 
 x_old, y_old = None, None
 def onclick(event):
@@ -33,23 +33,28 @@ def onclick(event):
         print('Free')
 
 pp = []
+algorithm = 'a_star_fast'
 def button_callback(event):
     global pp
-    path, cost = a_star(grid=grid, start=home_grid, goal=goal_grid)
+    path, _, cost = plan_cells(grid, home_grid, goal_grid, algorithm, prune=False)
     pp = np.array(path)
     # ax.imshow(grid, cmap='Greys')
     ax.plot(pp[:, 1], pp[:, 0], linewidth=3)
     plt.draw()
 
-def planned_path(home_loc, goal_loc, GRID_SIZE=200):
-    global pp, grid, home_grid, goal_grid, ax
-    grid = np.zeros((GRID_SIZE,GRID_SIZE))
+def planned_path(home_loc, goal_loc, GRID_SIZE=200, planner='a_star_fast', zones=None, inflation=0.0):
+    '''
+    Interactive front end of path_planner.plan(): obstacles are drawn with the mouse and "Find" plans
+    planner: one of planning_utils.PLANNERS, 'jps'/'theta_star'/'lazy_theta_star' return sparse waypoints
+    zones: optional GeoJSON/KML/.plan/fence file with no-fly zones, inflated by `inflation` meters
+    '''
+    global pp, grid, home_grid, goal_grid, ax, algorithm
+    algorithm = planner
+    geo = field_grid(GRID_SIZE, zones, inflation)
+    grid = geo.grid
 
-    lats = np.linspace(38.1598, 38.163, num=GRID_SIZE, endpoint=True)
-    longs = np.linspace(-122.457, -122.451, num=GRID_SIZE, endpoint=True)
-
-    home_grid = np.nonzero(lats>=home_loc[0])[0][0], np.nonzero(longs>=home_loc[1])[0][0]
-    goal_grid = np.nonzero(lats>=goal_loc[0])[0][0], np.nonzero(longs>=goal_loc[1])[0][0]
+    home_grid = geo.to_cell(*home_loc)
+    goal_grid = geo.to_cell(*goal_loc)
 
     print(home_grid, '>>>', goal_grid)
 
@@ -74,8 +79,7 @@ def planned_path(home_loc, goal_loc, GRID_SIZE=200):
     plt.show()
     
     path = np.empty(pp.shape)
-    path[:,0] = lats[pp[:,0]]
-    path[:,1] = longs[pp[:,1]]
+    path[:,0], path[:,1] = geo.to_latlon(pp[:,0], pp[:,1])
     return path
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Button
-from planning_utils import a_star
+from path_planner import collinearity_check, field_grid, plan_cells, prune_path
 
 x_old, y_old = None, None
 def onclick(event):
@@ -33,51 +33,33 @@ def onclick(event):
         print('Free')
 
 pp = []
+waypoints = []
+algorithm = 'a_star_fast'
 def button_callback(event):
-    global pp
-    path, cost = a_star(grid=grid, start=home_grid, goal=goal_grid)
+    global pp, waypoints
+    path, waypoints, cost = plan_cells(grid, home_grid, goal_grid, algorithm)
     pp = np.array(path)
     # ax.imshow(grid, cmap='Greys')
     ax.plot(pp[:, 1], pp[:, 0], linewidth=3)
-    pruned_path = np.array(prune_path(path))
+    pruned_path = np.array(waypoints)
     ax.plot(pruned_path[:, 1], pruned_path[:, 0], 'g')
     ax.scatter(pruned_path[:, 1], pruned_path[:, 0])
     plt.draw()
 
-def point(p):
-    return np.array([p[0], p[1], 1.]).reshape(1, -1)
-
-def collinearity_check(p1, p2, p3, epsilon=1e-6):
+def planned_path(home_loc, goal_loc, GRID_SIZE=200, planner='a_star_fast', zones=None, inflation=0.0):
     '''
-    returns True if points are collinear
+    Interactive front end of path_planner.plan(): obstacles are drawn with the mouse and "Find" plans
+    planner: one of planning_utils.PLANNERS, 'jps'/'theta_star'/'lazy_theta_star' return sparse waypoints
+    zones: optional GeoJSON/KML/.plan/fence file with no-fly zones, inflated by `inflation` meters
     '''
-    m = np.concatenate((p1, p2, p3), 0)
-    det = np.linalg.det(m)
-    return abs(det) < epsilon
-
-def prune_path(path):
-    pruned_path = [list(p) for p in path]
-    
-    i = 0
-    while i < len(pruned_path) - 2:
-        p1 = point(pruned_path[i])
-        p2 = point(pruned_path[i+1])
-        p3 = point(pruned_path[i+2])
-        if collinearity_check(p1, p2, p3):
-            pruned_path.remove(pruned_path[i+1])
-        else:
-            i += 1
-    return pruned_path
-
-def planned_path(home_loc, goal_loc, GRID_SIZE=200):
-    global pp, grid, home_grid, goal_grid, ax
-    grid = np.zeros((GRID_SIZE,GRID_SIZE))
-
-    lats = np.linspace(38.1598, 38.163, num=GRID_SIZE, endpoint=True)
-    longs = np.linspace(-122.457, -122.451, num=GRID_SIZE, endpoint=True)
+    global pp, waypoints, grid, home_grid, goal_grid, ax, algorithm
+    algorithm = planner
+    pp, waypoints = [], []
+    geo = field_grid(GRID_SIZE, zones, inflation)
+    grid = geo.grid
 
-    home_grid = np.nonzero(lats>=home_loc[0])[0][0], np.nonzero(longs>=home_loc[1])[0][0]
-    goal_grid = np.nonzero(lats>=goal_loc[0])[0][0], np.nonzero(longs>=goal_loc[1])[0][0]
+    home_grid = geo.to_cell(*home_loc)
+    goal_grid = geo.to_cell(*goal_loc)
 
     print(home_grid, '>>>', goal_grid)
 
@@ -101,10 +83,10 @@ def planned_path(home_loc, goal_loc, GRID_SIZE=200):
     ax.grid(b=True, which='minor', color='#999999', linestyle='-', alpha=0.2)
     plt.show()
     
-    pp_pruned = np.array(prune_path(pp))
+    # Waypoints of the last "Find", pulled and pruned by plan_cells(), empty if nothing was planned
+    pp_pruned = np.asarray(waypoints, dtype=np.int64).reshape(-1, 2)
     pruned_path = np.empty(pp_pruned.shape)
-    pruned_path[:,0] = lats[pp_pruned[:,0]]
-    pruned_path[:,1] = longs[pp_pruned[:,1]]
+    pruned_path[:,0], pruned_path[:,1] = geo.to_latlon(pp_pruned[:,0], pp_pruned[:,1])
     return pruned_path
 
 if __name__ == "__main__":
@@ -1,7 +1,16 @@
 from enum import Enum
 from queue import PriorityQueue
+import heapq
+import math
+from array import array
 import numpy as np
 
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+except ImportError:     # scipy is optional, fall back to a pure Python Dijkstra
+    csr_matrix = csgraph_dijkstra = None
+
 class Action(Enum):
     """
     An action is represented by a 3 element tuple.
@@ -78,11 +87,12 @@ def visualize_path(grid, path, start):
     return sgrid
 
 def heuristic(position, goal_position):
-    h = np.linalg.norm(np.array(goal_position) - np.array(position))
+    h = math.hypot(goal_position[0] - position[0], goal_position[1] - position[1])
     return h
 
-def a_star(grid, start, goal, h=heuristic):
+def a_star(grid, start, goal, h=heuristic, stats=None):
     path = []
+    expanded = 0
     path_cost = 0
     queue = PriorityQueue()
     queue.put((0, start))
@@ -92,6 +102,7 @@ def a_star(grid, start, goal, h=heuristic):
     while not queue.empty():
         item = queue.get()
         current_node = item[1]
+        expanded += 1
         if current_node == start:
             current_cost = 0.0
         else:              
@@ -125,9 +136,779 @@ def a_star(grid, start, goal, h=heuristic):
         print('**********************')
         print('Failed to find a path!')
         print('**********************')
+    if stats is not None:
+        stats['expansions'] = expanded
         
     return path[::-1], path_cost
 
+SQRT2 = math.sqrt(2)
+# (d_row, d_col, cost) of the 8-connected moves, same as Action
+MOVES = [(a.value[0], a.value[1], a.value[2]) for a in Action]
+
+def octile(position, goal_position):
+    """
+    Exact cost of the obstacle free 8-connected path, admissible & consistent for a_star_fast.
+    """
+    dx, dy = abs(goal_position[0] - position[0]), abs(goal_position[1] - position[1])
+    return dx + dy + (SQRT2 - 2)*min(dx, dy)
+
+def a_star_fast(grid, start, goal, stats=None, cell_cost=None):
+    """
+    A* on the 8-connected grid with the same moves and costs as a_star(), for large grids.
+    Cells are flat ids (row*width + col), g-scores and parents live in flat typed arrays, the
+    open list is a heapq (ties broken towards deeper nodes) and the octile heuristic replaces the
+    euclidean norm. Unlike a_star() nodes are closed when popped, so the returned cost is optimal.
+    Returns the same (path, path_cost) as a_star(): a list of (row, col) from start to goal.
+    If a stats dict is given the number of expanded nodes is stored in stats['expansions'].
+    cell_cost: optional non-negative (rows, cols) array added to the cost of every move into a
+    cell (e.g. distance_field.clearance_cost), the heuristic stays admissible.
+    """
+    height, width = grid.shape
+    size = height*width
+    blocked = bytearray(np.ascontiguousarray(grid == 1, dtype=np.uint8).tobytes())
+    g_score = array('d', bytes(8*size))
+    parent = array('q', bytes(8*size))
+    opened = bytearray(size)    # 0: unseen, 1: open, 2: closed
+    extra = array('d', bytes(8*size)) if cell_cost is None else \
+        array('d', np.ascontiguousarray(cell_cost, dtype=np.float64).tobytes())
+    moves = [(dr, dc, dr*width + dc, cost) for dr, dc, cost in MOVES]
+    goal_r, goal_c = int(goal[0]), int(goal[1])
+    start_id = int(start[0])*width + int(start[1])
+    goal_id = goal_r*width + goal_c
+    diagonal = SQRT2 - 2
+    heappush, heappop = heapq.heappush, heapq.heappop
+
+    opened[start_id] = 1
+    queue = [(octile(start, goal), 0.0, start_id)]
+    found = False
+    expanded = 0
+    while queue:
+        _, neg_g, node = heappop(queue)
+        if opened[node] == 2:
+            continue
+        if node == goal_id:
+            found = True
+            break
+        opened[node] = 2
+        expanded += 1
+        g = -neg_g
+        r, c = divmod(node, width)
+        for dr, dc, offset, cost in moves:
+            nr, nc = r + dr, c + dc
+            if nr < 0 or nr >= height or nc < 0 or nc >= width:
+                continue
+            next_node = node + offset
+            state = opened[next_node]
+            if state == 2 or blocked[next_node]:
+                continue
+            next_g = g + cost + extra[next_node]
+            if state == 0 or next_g < g_score[next_node]:
+                opened[next_node] = 1
+                g_score[next_node] = next_g
+                parent[next_node] = node
+                dx, dy = abs(goal_r - nr), abs(goal_c - nc)
+                h = dx + dy + diagonal*(dx if dx < dy else dy)
+                heappush(queue, (next_g + h, -next_g, next_node))
+    if stats is not None:
+        stats['expansions'] = expanded
+    if not found:
+        print('**********************')
+        print('Failed to find a path!')
+        print('**********************')
+        return [], 0
+    print('Found a path.')
+    path = [goal_id]
+    while path[-1] != start_id:
+        path.append(parent[path[-1]])
+    path = [divmod(node, width) for node in path[::-1]]
+    return path, g_score[goal_id]
+
+def _flat_grid(grid):
+    height, width = grid.shape
+    return bytearray(np.ascontiguousarray(grid == 1, dtype=np.uint8).tobytes()), height, width
+
+def _line_of_sight(blocked, height, width, a, b):
+    """
+    Supercover walk over every cell the segment between the centers of cells a and b touches.
+    Where the segment passes exactly through a cell corner both side cells have to be free.
+    """
+    r, c = a
+    dr, dc = b[0] - r, b[1] - c
+    nr, nc = abs(dr), abs(dc)
+    sr = 1 if dr > 0 else -1
+    sc = 1 if dc > 0 else -1
+    ir = ic = 0
+    if blocked[r*width + c]:
+        return False
+    while ir < nr or ic < nc:
+        decision = (1 + 2*ir)*nc - (1 + 2*ic)*nr
+        if decision == 0:
+            if blocked[(r + sr)*width + c] or blocked[r*width + c + sc]:
+                return False
+            r += sr
+            c += sc
+            ir += 1
+            ic += 1
+        elif decision < 0:
+            r += sr
+            ir += 1
+        else:
+            c += sc
+            ic += 1
+        if blocked[r*width + c]:
+            return False
+    return True
+
+def line_of_sight(grid, a, b):
+    """
+    True if the straight segment between the centers of cells a and b only crosses free cells.
+    """
+    blocked, height, width = _flat_grid(grid)
+    return _line_of_sight(blocked, height, width, (int(a[0]), int(a[1])), (int(b[0]), int(b[1])))
+
+def string_pull(grid, path):
+    """
+    Shortens a grid path to waypoints with line of sight between them.
+    Only the corners of the path (where its direction changes) are candidate waypoints. From each
+    kept waypoint the farthest visible corner is found by doubling the step along the corners and
+    bisecting, so a waypoint costs O(log corners) line-of-sight checks instead of one per cell.
+    Visibility along a path is not monotone, so a few more waypoints than a full scan may be kept.
+    The straight runs between neighbouring corners are moves of the path and are always kept, even
+    the corner cutting diagonals a supercover line would reject.
+    """
+    path = np.asarray(path, dtype=np.int64).reshape(-1, 2)
+    if len(path) < 3:
+        return [tuple(p) for p in path.tolist()]
+    steps = np.diff(path, axis=0)
+    turns = np.flatnonzero((steps[1:] != steps[:-1]).any(axis=1)) + 1
+    corners = [tuple(p) for p in path[np.concatenate(([0], turns, [len(path) - 1]))].tolist()]
+    blocked, height, width = _flat_grid(grid)
+    last = len(corners) - 1
+    pulled = [corners[0]]
+    anchor = 0
+    while anchor < last:
+        visible = lambda i: _line_of_sight(blocked, height, width, corners[anchor], corners[i])
+        good, bad, step = anchor + 1, last + 1, 2
+        while good < last:
+            probe = min(anchor + step, last)
+            if not visible(probe):
+                bad = probe
+                break
+            good, step = probe, 2*step
+        while bad - good > 1:
+            middle = (good + bad)//2
+            if visible(middle):
+                good = middle
+            else:
+                bad = middle
+        pulled.append(corners[good])
+        anchor = good
+    return pulled
+
+def _euclidean(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+def _report(found):
+    if found:
+        print('Found a path.')
+    else:
+        print('**********************')
+        print('Failed to find a path!')
+        print('**********************')
+
+def jps(grid, start, goal, stats=None):
+    """
+    Jump Point Search on the same 8-connected grid as a_star() (diagonal moves may cut corners).
+    Symmetric paths are pruned and only jump points are expanded, the returned path is the
+    sparse list of jump points from start to goal with the optimal path cost.
+    """
+    blocked, height, width = _flat_grid(grid)
+    start = (int(start[0]), int(start[1]))
+    goal = (int(goal[0]), int(goal[1]))
+
+    def free(r, c):
+        return 0 <= r < height and 0 <= c < width and not blocked[r*width + c]
+
+    def jump(r, c, dr, dc):
+        while True:
+            r += dr
+            c += dc
+            if not free(r, c):
+                return None
+            if (r, c) == goal:
+                return r, c
+            if dr and dc:
+                if (not free(r, c - dc) and free(r + dr, c - dc)) or \
+                   (not free(r - dr, c) and free(r - dr, c + dc)):
+                    return r, c
+                if jump(r, c, dr, 0) is not None or jump(r, c, 0, dc) is not None:
+                    return r, c
+            elif dr == 0:
+                if (not free(r + 1, c) and free(r + 1, c + dc)) or \
+                   (not free(r - 1, c) and free(r - 1, c + dc)):
+                    return r, c
+            else:
+                if (not free(r, c + 1) and free(r + dr, c + 1)) or \
+                   (not free(r, c - 1) and free(r + dr, c - 1)):
+                    return r, c
+
+    def directions(node, parent):
+        if parent is None:
+            return [(dr, dc) for dr, dc, _ in MOVES]
+        r, c = node
+        dr = (r > parent[0]) - (r < parent[0])
+        dc = (c > parent[1]) - (c < parent[1])
+        if dr and dc:
+            dirs = [(dr, 0), (0, dc), (dr, dc)]
+            if not free(r, c - dc):
+                dirs.append((dr, -dc))
+            if not free(r - dr, c):
+                dirs.append((-dr, dc))
+        elif dr == 0:
+            dirs = [(0, dc)]
+            if not free(r + 1, c):
+                dirs.append((1, dc))
+            if not free(r - 1, c):
+                dirs.append((-1, dc))
+        else:
+            dirs = [(dr, 0)]
+            if not free(r, c + 1):
+                dirs.append((dr, 1))
+            if not free(r, c - 1):
+                dirs.append((dr, -1))
+        return dirs
+
+    g_score = {start: 0.0}
+    parent = {start: None}
+    closed = set()
+    queue = [(octile(start, goal), 0.0, start)]
+    found = False
+    while queue:
+        _, neg_g, node = heapq.heappop(queue)
+        if node in closed:
+            continue
+        if node == goal:
+            found = True
+            break
+        closed.add(node)
+        g = -neg_g
+        for dr, dc in directions(node, parent[node]):
+            point = jump(node[0], node[1], dr, dc)
+            if point is None or point in closed:
+                continue
+            next_g = g + octile(node, point)
+            if next_g < g_score.get(point, math.inf):
+                g_score[point] = next_g
+                parent[point] = node
+                heapq.heappush(queue, (next_g + octile(point, goal), -next_g, point))
+    if stats is not None:
+        stats['expansions'] = len(closed)
+    _report(found)
+    if not found:
+        return [], 0
+    path = [goal]
+    while parent[path[-1]] is not None:
+        path.append(parent[path[-1]])
+    return path[::-1], g_score[goal]
+
+def theta_star(grid, start, goal, lazy=False, stats=None):
+    """
+    Any-angle Theta* (or Lazy Theta* with lazy=True) on the 8-connected grid.
+    A node inherits its grandparent as parent whenever the two see each other, so the returned
+    path is a sparse list of directly flyable waypoints with its euclidean length as cost.
+    Lazy Theta* postpones the line-of-sight check until a node is expanded.
+    """
+    blocked, height, width = _flat_grid(grid)
+    start = (int(start[0]), int(start[1]))
+    goal = (int(goal[0]), int(goal[1]))
+    los = lambda a, b: _line_of_sight(blocked, height, width, a, b)
+
+    g_score = {start: 0.0}
+    parent = {start: start}
+    closed = set()
+    queue = [(_euclidean(start, goal), 0.0, start)]
+    found = False
+    while queue:
+        _, neg_g, node = heapq.heappop(queue)
+        if node in closed or -neg_g > g_score[node]:
+            continue
+        if lazy and not los(parent[node], node):
+            # Fall back to the best expanded neighbor
+            best = None
+            for dr, dc, cost in MOVES:
+                neighbor = (node[0] + dr, node[1] + dc)
+                if neighbor in closed and (best is None or g_score[neighbor] + cost < best[0]):
+                    best = (g_score[neighbor] + cost, neighbor)
+            g_score[node], parent[node] = best
+        if node == goal:
+            found = True
+            break
+        closed.add(node)
+        r, c = node
+        for dr, dc, cost in MOVES:
+            nr, nc = r + dr, c + dc
+            if nr < 0 or nr >= height or nc < 0 or nc >= width or blocked[nr*width + nc]:
+                continue
+            neighbor = (nr, nc)
+            if neighbor in closed:
+                continue
+            grand = parent[node]
+            best = g_score.get(neighbor, math.inf)
+            candidate, candidate_parent = g_score[grand] + _euclidean(grand, neighbor), grand
+            # Only trace the line of sight when going through the grandparent would improve
+            if candidate >= best or not (lazy or los(grand, neighbor)):
+                candidate, candidate_parent = g_score[node] + cost, node
+            if candidate < best:
+                g_score[neighbor] = candidate
+                parent[neighbor] = candidate_parent
+                heapq.heappush(queue, (candidate + _euclidean(neighbor, goal), -candidate, neighbor))
+    if stats is not None:
+        stats['expansions'] = len(closed)
+    _report(found)
+    if not found:
+        return [], 0
+    path = [goal]
+    while path[-1] != start:
+        path.append(parent[path[-1]])
+    return path[::-1], g_score[goal]
+
+def lazy_theta_star(grid, start, goal, stats=None):
+    return theta_star(grid, start, goal, lazy=True, stats=stats)
+
+def a_star_clearance(grid, start, goal, stats=None, safe_distance=5.0, weight=1.0):
+    """
+    a_star_fast() with a clearance cost from the cached distance field, distances in cells.
+    """
+    from distance_field import clearance_cost
+    return a_star_fast(grid, start, goal, stats, clearance_cost(grid, safe_distance, weight))
+
+def _grid_edges(free):
+    """
+    Directed 8-connected edges between the free cells of a boolean grid as flat (src, dst, cost) arrays.
+    """
+    height, width = free.shape
+    index = np.arange(height*width).reshape(height, width)
+    src, dst, costs = [], [], []
+    for dr, dc, cost in MOVES:
+        rows, next_rows = slice(max(0, -dr), height - max(0, dr)), slice(max(0, dr), height + min(0, dr))
+        cols, next_cols = slice(max(0, -dc), width - max(0, dc)), slice(max(0, dc), width + min(0, dc))
+        ok = free[rows, cols] & free[next_rows, next_cols]
+        src.append(index[rows, cols][ok])
+        dst.append(index[next_rows, next_cols][ok])
+        costs.append(np.full(len(src[-1]), cost))
+    return np.concatenate(src), np.concatenate(dst), np.concatenate(costs)
+
+def _dijkstra(free, sources):
+    """
+    Shortest path distances and predecessors from each flat index in sources over the free cells
+    of a (small) boolean grid. Returns (len(sources), cells) arrays, inf / -1 where unreachable.
+    """
+    size = free.size
+    if csgraph_dijkstra is not None:
+        src, dst, costs = _grid_edges(free)
+        graph = csr_matrix((costs, (src, dst)), shape=(size, size))
+        distances, parents = csgraph_dijkstra(graph, indices=sources, return_predecessors=True)
+        return distances, np.where(parents < 0, -1, parents)
+    height, width = free.shape
+    open_cells = free.ravel().tolist()
+    distances = np.full((len(sources), size), np.inf)
+    parents = np.full((len(sources), size), -1, dtype=np.int64)
+    for k, source in enumerate(sources):
+        dist, parent = [math.inf]*size, [-1]*size
+        dist[source] = 0.0
+        queue = [(0.0, source)]
+        while queue:
+            g, node = heapq.heappop(queue)
+            if g > dist[node]:
+                continue
+            r, c = divmod(node, width)
+            for dr, dc, cost in MOVES:
+                nr, nc = r + dr, c + dc
+                if 0 <= nr < height and 0 <= nc < width and open_cells[nr*width + nc] \
+                   and g + cost < dist[nr*width + nc]:
+                    dist[nr*width + nc] = g + cost
+                    parent[nr*width + nc] = node
+                    heapq.heappush(queue, (g + cost, nr*width + nc))
+        distances[k], parents[k] = dist, parent
+    return distances, parents
+
+def _free_runs(free):
+    """
+    [start, end) index pairs of the runs of True in a 1D boolean array.
+    """
+    edges = np.diff(np.concatenate(([0], free.astype(np.int8), [0])))
+    return zip(np.nonzero(edges == 1)[0], np.nonzero(edges == -1)[0])
+
+class HierarchicalPlanner():
+    """HPA* planner for large occupancy grids
+    The grid is split into square clusters. Entrances are placed on the free runs along the borders
+    of neighbouring clusters (one in the middle of short runs, one at each end of long ones) and
+    the distances between the entrances of every cluster are precomputed into an abstract graph.
+    A query links start and goal to the entrances of their clusters, runs A* on the abstract graph
+    and refines each abstract edge with a search confined to its cluster, so the cost of a query
+    grows with the number of clusters on the route instead of the number of cells in the map.
+    Attributes:
+        grid (np.ndarray): occupancy grid, 1 = obstacle
+        cluster_size (int): side of a cluster in cells
+        nodes (list): (row, col) cell of every abstract node
+        edges (list): per node, a list of (neighbor node, cost)
+        cells (np.ndarray): (nodes, 2) array of the node cells
+    """
+
+    def __init__(self, grid, cluster_size=32, long_entrance=6):
+        self.grid = np.asarray(grid)
+        self.free = self.grid != 1
+        self.cluster_size = cluster_size
+        self.long_entrance = long_entrance
+        self.nodes = []
+        self.edges = []
+        self._ids = {}
+        self._members = {}      # cluster -> abstract nodes on its border
+        self._build()
+
+    def cluster(self, cell):
+        return cell[0]//self.cluster_size, cell[1]//self.cluster_size
+
+    def _bounds(self, cluster, other=None):
+        """ (r0, c0, r1, c1) cells of a cluster, or of the block spanning it and another cluster """
+        other = cluster if other is None else other
+        r0, c0 = min(cluster[0], other[0])*self.cluster_size, min(cluster[1], other[1])*self.cluster_size
+        r1, c1 = (max(cluster[0], other[0]) + 1)*self.cluster_size, (max(cluster[1], other[1]) + 1)*self.cluster_size
+        return r0, c0, min(r1, self.grid.shape[0]), min(c1, self.grid.shape[1])
+
+    def _node(self, cell):
+        if cell not in self._ids:
+            self._ids[cell] = len(self.nodes)
+            self.nodes.append(cell)
+            self.edges.append([])
+            self._members.setdefault(self.cluster(cell), []).append(self._ids[cell])
+        return self._ids[cell]
+
+    def _link(self, cell_a, cell_b, cost):
+        a, b = self._node(cell_a), self._node(cell_b)
+        self.edges[a].append((b, cost))
+        self.edges[b].append((a, cost))
+
+    def _entrances(self, line_a, line_b, cell_a, cell_b):
+        """ Transition nodes between two facing border lines, cell_x(i) maps an offset to a cell """
+        straight = line_a & line_b
+        for start, end in _free_runs(straight):
+            offsets = [(start + end - 1)//2] if end - start < self.long_entrance else [start, end - 1]
+            for i in offsets:
+                self._link(cell_a(i), cell_b(i), 1.0)
+        # Diagonal moves are the only way across where no straight crossing is next to them
+        isolated = ~straight[:-1] & ~straight[1:]
+        for i in np.nonzero(line_a[:-1] & line_b[1:] & isolated)[0]:
+            self._link(cell_a(i), cell_b(i + 1), SQRT2)
+        for i in np.nonzero(line_a[1:] & line_b[:-1] & isolated)[0]:
+            self._link(cell_a(i + 1), cell_b(i), SQRT2)
+
+    def _build(self):
+        height, width = self.grid.shape
+        size = self.cluster_size
+        for r0 in range(0, height, size):
+            r1 = min(r0 + size, height)
+            for c in range(size, width, size):
+                self._entrances(self.free[r0:r1, c - 1], self.free[r0:r1, c],
+                                lambda i: (r0 + i, c - 1), lambda i: (r0 + i, c))
+        for c0 in range(0, width, size):
+            c1 = min(c0 + size, width)
+            for r in range(size, height, size):
+                self._entrances(self.free[r - 1, c0:c1], self.free[r, c0:c1],
+                                lambda i: (r - 1, c0 + i), lambda i: (r, c0 + i))
+        # Diagonal moves across the corners where four clusters meet
+        for r in range(size, height, size):
+            for c in range(size, width, size):
+                if self.free[r - 1, c - 1] and self.free[r, c]:
+                    self._link((r - 1, c - 1), (r, c), SQRT2)
+                if self.free[r - 1, c] and self.free[r, c - 1]:
+                    self._link((r - 1, c), (r, c - 1), SQRT2)
+        for cluster, members in self._members.items():
+            cells = [self.nodes[n] for n in members]
+            bounds = self._bounds(cluster)
+            distances, _ = self._search(bounds, cells)
+            local = [self._local(bounds, cell) for cell in cells]
+            for a, costs in zip(members, distances[:, local].tolist()):
+                self.edges[a] += [(b, cost) for b, cost in zip(members, costs)
+                                  if b != a and cost != math.inf]
+        self.cells = np.array(self.nodes, dtype=np.int64).reshape(-1, 2)
+
+    def _local(self, bounds, cell):
+        r0, c0, r1, c1 = bounds
+        return (cell[0] - r0)*(c1 - c0) + cell[1] - c0
+
+    def _search(self, bounds, cells):
+        r0, c0, r1, c1 = bounds
+        return _dijkstra(self.free[r0:r1, c0:c1], [self._local(bounds, cell) for cell in cells])
+
+    def _near(self, a, b):
+        """ True if the cells are in the same or in neighbouring (also diagonal) clusters """
+        (ra, ca), (rb, cb) = self.cluster(a), self.cluster(b)
+        return abs(ra - rb) <= 1 and abs(ca - cb) <= 1
+
+    def _refine(self, a, b, bounds=None):
+        """ Cells after a up to b along the shortest path inside bounds, by default their common cluster """
+        if bounds is None:
+            if self.cluster(a) != self.cluster(b):
+                return [b]
+            bounds = self._bounds(self.cluster(a))
+        r0, c0, r1, c1 = bounds
+        _, parents = self._search(bounds, [a])
+        node, source, cells = self._local(bounds, b), self._local(bounds, a), []
+        while node != source:
+            cells.append((r0 + node//(c1 - c0), c0 + node % (c1 - c0)))
+            node = parents[0][node]
+        return cells[::-1]
+
+    def _links(self, cell):
+        """ Cost from cell to every entrance of its cluster it can reach """
+        cluster = self.cluster(cell)
+        members = self._members.get(cluster, [])
+        bounds = self._bounds(cluster)
+        distances, _ = self._search(bounds, [cell])
+        costs = {n: distances[0][self._local(bounds, self.nodes[n])] for n in members}
+        return {n: float(cost) for n, cost in costs.items() if np.isfinite(cost)}
+
+    def plan(self, start, goal, stats=None):
+        """
+        Returns (path, path_cost) in the format of a_star_fast(), path as a list of (row, col).
+        The path is near-optimal, not optimal: between clusters it passes through the entrances.
+        Start and goal in the same or neighbouring clusters are also searched directly inside
+        those clusters, which avoids the entrance detours on short queries.
+        """
+        start = (int(start[0]), int(start[1]))
+        goal = (int(goal[0]), int(goal[1]))
+        if not (self.free[start] and self.free[goal]):
+            _report(False)
+            return [], 0
+        START, GOAL = -2, -1      # ids of the temporary start and goal nodes
+        # Temporary edges linking start and goal to the entrances of their clusters
+        start_edges = self._links(start)
+        goal_edges = self._links(goal)
+        direct = self._bounds(self.cluster(start), self.cluster(goal)) if self._near(start, goal) else None
+        if direct is not None:
+            distances, _ = self._search(direct, [start])
+            cost = distances[0][self._local(direct, goal)]
+            if np.isfinite(cost):
+                start_edges[GOAL] = float(cost)
+
+        g_score = {START: 0.0}
+        parent = {START: None}
+        closed = set()
+        queue = [(octile(start, goal), 0.0, START)]
+        cell_of = lambda n: start if n == START else goal if n == GOAL else self.nodes[n]
+        delta = np.abs(self.cells - goal)
+        h = (delta.sum(axis=1) + (SQRT2 - 2)*delta.min(axis=1)).tolist() + [0.0]    # h[GOAL] = 0
+        found = False
+        while queue:
+            _, neg_g, node = heapq.heappop(queue)
+            if node in closed:
+                continue
+            if node == GOAL:
+                found = True
+                break
+            closed.add(node)
+            g = -neg_g
+            neighbors = start_edges.items() if node == START else self.edges[node]
+            if node in goal_edges:
+                neighbors = list(neighbors) + [(GOAL, goal_edges[node])]
+            for neighbor, cost in neighbors:
+                if neighbor in closed or g + cost >= g_score.get(neighbor, math.inf):
+                    continue
+                g_score[neighbor] = g + cost
+                parent[neighbor] = node
+                heapq.heappush(queue, (g + cost + h[neighbor], -(g + cost), neighbor))
+        if stats is not None:
+            stats['expansions'] = len(closed)
+        _report(found)
+        if not found:
+            return [], 0
+        abstract = [GOAL]
+        while parent[abstract[-1]] is not None:
+            abstract.append(parent[abstract[-1]])
+        cells = [cell_of(n) for n in abstract[::-1]]
+        if parent[GOAL] == START:
+            return [start] + self._refine(start, goal, direct), g_score[GOAL]
+        path = [start]
+        for a, b in zip(cells, cells[1:]):
+            if a != b:
+                path += self._refine(a, b)
+        return path, g_score[GOAL]
+
+def hpa_star(grid, start, goal, cluster_size=32, stats=None):
+    """
+    One-shot HPA*, keep a HierarchicalPlanner around to reuse its abstract graph between queries.
+    """
+    return HierarchicalPlanner(grid, cluster_size).plan(start, goal, stats)
+
+def _key_less(a, b, epsilon=1e-9):
+    """ Lexicographic key comparison that ignores rounding noise in the first component """
+    if abs(a[0] - b[0]) > epsilon:
+        return a[0] < b[0]
+    return a[1] < b[1]
+
+class DStarLite():
+    """Incremental planner (D* Lite) on the occupancy grid
+    The search runs backwards from the goal and its g/rhs values are kept between calls, so when
+    cells flip (e.g. a no-fly zone appears mid-mission) update_cells() only repairs the part of
+    the search the change affects instead of replanning from scratch. The start can follow the
+    vehicle along the path with move_start(). Vertices are flat cell ids as in a_star_fast().
+    Attributes:
+        grid (np.ndarray): copy of the occupancy grid, 1 = obstacle, kept in sync by update_cells()
+        start, goal (tuple): (row, col) cells
+        expansions (int): vertices expanded by the last plan()
+    """
+
+    def __init__(self, grid, start, goal):
+        self.grid = np.array(grid)
+        self.blocked, self.height, self.width = _flat_grid(self.grid)
+        self.start = (int(start[0]), int(start[1]))
+        self.goal = (int(goal[0]), int(goal[1]))
+        self.expansions = 0
+        size = self.height*self.width
+        self._moves = [(dr, dc, dr*self.width + dc, cost) for dr, dc, cost in MOVES]
+        self._k_m = 0.0
+        self._g = array('d', [math.inf])*size
+        self._rhs = array('d', [math.inf])*size
+        self._open = {}     # vertex -> key of its live queue entry
+        self._queue = []
+        goal_id = self._id(self.goal)
+        self._rhs[goal_id] = 0.0
+        self._push(goal_id)
+
+    def _id(self, cell):
+        return cell[0]*self.width + cell[1]
+
+    def _key(self, u):
+        g = min(self._g[u], self._rhs[u])
+        r, c = divmod(u, self.width)
+        dx, dy = abs(self.start[0] - r), abs(self.start[1] - c)
+        return (g + dx + dy + (SQRT2 - 2)*min(dx, dy) + self._k_m, g)
+
+    def _push(self, u):
+        key = self._key(u)
+        self._open[u] = key
+        heapq.heappush(self._queue, (key, u))
+
+    def _top(self):
+        """ Smallest live entry of the queue, stale entries are dropped on the way """
+        while self._queue:
+            key, u = self._queue[0]
+            if self._open.get(u) == key:
+                return key, u
+            heapq.heappop(self._queue)
+        return (math.inf, math.inf), None
+
+    def _neighbors(self, u):
+        r, c = divmod(u, self.width)
+        return [(u + offset, cost) for dr, dc, offset, cost in self._moves
+                if 0 <= r + dr < self.height and 0 <= c + dc < self.width]
+
+    def _update_vertex(self, u):
+        if u != self._goal_id:
+            rhs = math.inf
+            if not self.blocked[u]:
+                g, blocked = self._g, self.blocked
+                for v, cost in self._neighbors(u):
+                    if not blocked[v] and cost + g[v] < rhs:
+                        rhs = cost + g[v]
+            self._rhs[u] = rhs
+        self._open.pop(u, None)
+        if self._g[u] != self._rhs[u]:
+            self._push(u)
+
+    @property
+    def _goal_id(self):
+        return self._id(self.goal)
+
+    def _compute_shortest_path(self):
+        self.expansions = 0
+        start = self._id(self.start)
+        g, rhs = self._g, self._rhs
+        while True:
+            key, u = self._top()
+            if u is None or (not _key_less(key, self._key(start)) and rhs[start] == g[start]):
+                break
+            new_key = self._key(u)
+            if key < new_key:
+                self._push(u)
+                continue
+            heapq.heappop(self._queue)
+            del self._open[u]
+            self.expansions += 1
+            if g[u] > rhs[u]:
+                # g only went down, so the neighbors' rhs can be lowered without a full rescan
+                g[u] = rhs[u]
+                for v, cost in self._neighbors(u):
+                    if g[u] + cost < rhs[v] and not self.blocked[v]:
+                        rhs[v] = g[u] + cost
+                        self._open.pop(v, None)
+                        if g[v] != rhs[v]:
+                            self._push(v)
+            else:
+                g[u] = math.inf
+                self._update_vertex(u)
+                for v, _ in self._neighbors(u):
+                    self._update_vertex(v)
+
+    def move_start(self, start):
+        """ The vehicle moved on, keys already in the queue stay valid through k_m """
+        start = (int(start[0]), int(start[1]))
+        self._k_m += octile(self.start, start)
+        self.start = start
+
+    def update_cells(self, cells, occupied=True):
+        """ Sets the given (row, col) cells to occupied (1) or free (0) and marks them for repair
+        Returns:
+            list: the cells that actually changed
+        """
+        changed = []
+        for r, c in cells:
+            r, c = int(r), int(c)
+            if self.blocked[r*self.width + c] != bool(occupied):
+                self.blocked[r*self.width + c] = bool(occupied)
+                self.grid[r, c] = 1 if occupied else 0
+                changed.append((r, c))
+        for cell in changed:
+            u = self._id(cell)
+            self._update_vertex(u)
+            for v, _ in self._neighbors(u):
+                self._update_vertex(v)
+        return changed
+
+    def plan(self, stats=None):
+        """
+        Repairs the search and returns the same (path, path_cost) as a_star_fast().
+        """
+        self._compute_shortest_path()
+        if stats is not None:
+            stats['expansions'] = self.expansions
+        start = self._id(self.start)
+        found = self._g[start] < math.inf and not self.blocked[start]
+        _report(found)
+        if not found:
+            return [], 0
+        path = [start]
+        while path[-1] != self._goal_id:
+            path.append(min((v for v, cost in self._neighbors(path[-1]) if not self.blocked[v]),
+                            key=lambda v: octile(divmod(path[-1], self.width), divmod(v, self.width)) + self._g[v]))
+        return [divmod(u, self.width) for u in path], self._g[start]
+
+def d_star_lite(grid, start, goal, stats=None):
+    return DStarLite(grid, start, goal).plan(stats)
+
+# Grid planners selectable by name, all called as planner(grid, start, goal, stats=None) -> (path, cost)
+PLANNERS = {
+    'a_star': a_star,
+    'a_star_fast': a_star_fast,
+    'jps': jps,
+    'theta_star': theta_star,
+    'lazy_theta_star': lazy_theta_star,
+    'a_star_clearance': a_star_clearance,
+    'hpa_star': hpa_star,
+    'd_star_lite': d_star_lite,
+}
+
 def actual_path(path, grid_start):
     waypoint = grid_start
     waypoints = []
@@ -0,0 +1,263 @@
+"""Tests for the grid planners of planning_utils against a plain Dijkstra reference."""
+import contextlib
+import heapq
+import io
+import math
+import unittest
+
+import numpy as np
+
+import planning_utils
+
+MOVES = [(dr, dc, math.hypot(dr, dc)) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+
+
+def _reference_cost(grid, start, goal, cell_cost=None):
+    """ Optimal cost on the 8-connected grid (diagonals may cut corners), inf if unreachable """
+    height, width = grid.shape
+    distances = {tuple(start): 0.0}
+    queue = [(0.0, tuple(start))]
+    while queue:
+        g, (r, c) = heapq.heappop(queue)
+        if (r, c) == tuple(goal):
+            return g
+        if g > distances[(r, c)]:
+            continue
+        for dr, dc, cost in MOVES:
+            nr, nc = r + dr, c + dc
+            if 0 <= nr < height and 0 <= nc < width and grid[nr, nc] != 1:
+                next_g = g + cost + (0 if cell_cost is None else cell_cost[nr, nc])
+                if next_g < distances.get((nr, nc), math.inf):
+                    distances[(nr, nc)] = next_g
+                    heapq.heappush(queue, (next_g, (nr, nc)))
+    return math.inf
+
+
+def _random_problems(seed, count, size=40, density=0.3):
+    """ (grid, start, goal) with free start and goal cells """
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        grid = (rng.random((size, size)) < density).astype(np.int64)
+        free = np.argwhere(grid == 0)
+        start, goal = (tuple(int(v) for v in free[i]) for i in rng.choice(len(free), 2, replace=False))
+        yield grid, start, goal
+
+
+def _quiet(planner, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return planner(*args, **kwargs)
+
+
+class PlannerTestCase(unittest.TestCase):
+
+    def assertGridPath(self, grid, path, cost, start, goal):
+        """ path is a connected list of free cells from start to goal whose step lengths add up to cost """
+        path = np.asarray(path)
+        self.assertEqual(tuple(path[0]), tuple(start))
+        self.assertEqual(tuple(path[-1]), tuple(goal))
+        steps = np.abs(np.diff(path, axis=0))
+        self.assertTrue((steps.max(axis=1) == 1).all() if len(steps) else True)
+        self.assertFalse((grid[path[:, 0], path[:, 1]] == 1).any())
+        self.assertAlmostEqual(np.hypot(steps[:, 0], steps[:, 1]).sum(), cost, places=6)
+
+
+class AStarFastTest(PlannerTestCase):
+
+    def test_optimal_on_random_grids(self):
+        for grid, start, goal in _random_problems(0, 30):
+            path, cost = _quiet(planning_utils.a_star_fast, grid, start, goal)
+            expected = _reference_cost(grid, start, goal)
+            if expected == math.inf:
+                self.assertEqual(path, [])
+                continue
+            self.assertAlmostEqual(cost, expected, places=6)
+            self.assertGridPath(grid, path, cost, start, goal)
+
+    def test_cell_cost(self):
+        rng = np.random.default_rng(1)
+        for grid, start, goal in _random_problems(1, 10):
+            cell_cost = rng.random(grid.shape)*2
+            path, cost = _quiet(planning_utils.a_star_fast, grid, start, goal, cell_cost=cell_cost)
+            expected = _reference_cost(grid, start, goal, cell_cost)
+            if expected < math.inf:
+                self.assertAlmostEqual(cost, expected, places=6)
+
+    def test_unreachable_goal(self):
+        grid = np.zeros((10, 10), dtype=np.int64)
+        grid[:, 5] = 1
+        stats = {}
+        self.assertEqual(_quiet(planning_utils.a_star_fast, grid, (0, 0), (9, 9), stats=stats), ([], 0))
+        self.assertEqual(stats['expansions'], 50)
+
+    def test_expands_fewer_nodes_than_a_star(self):
+        grid, start, goal = next(_random_problems(2, 1, size=30, density=0.1))
+        fast, slow = {}, {}
+        _, cost = _quiet(planning_utils.a_star_fast, grid, start, goal, stats=fast)
+        _, slow_cost = _quiet(planning_utils.a_star, grid, start, goal, stats=slow)
+        self.assertLessEqual(cost, slow_cost + 1e-9)
+        self.assertLessEqual(fast['expansions'], slow['expansions'])
+
+
+class AnyAngleTest(PlannerTestCase):
+
+    def test_jps_cost_is_optimal(self):
+        for grid, start, goal in _random_problems(3, 30):
+            path, cost = _quiet(planning_utils.jps, grid, start, goal)
+            expected = _reference_cost(grid, start, goal)
+            if expected == math.inf:
+                self.assertEqual(path, [])
+                continue
+            self.assertAlmostEqual(cost, expected, places=6)
+            self.assertEqual((tuple(path[0]), tuple(path[-1])), (start, goal))
+            # Jump points are joined by straight or diagonal runs of free cells
+            for a, b in zip(path, path[1:]):
+                dr, dc = b[0] - a[0], b[1] - a[1]
+                self.assertTrue(dr == 0 or dc == 0 or abs(dr) == abs(dc))
+                steps = max(abs(dr), abs(dc))
+                for k in range(1, steps + 1):
+                    self.assertNotEqual(grid[a[0] + dr//steps*k, a[1] + dc//steps*k], 1)
+
+    def test_theta_star_waypoints_see_each_other(self):
+        for lazy in (False, True):
+            for grid, start, goal in _random_problems(4, 20, density=0.2):
+                path, cost = _quiet(planning_utils.theta_star, grid, start, goal, lazy=lazy)
+                expected = _reference_cost(grid, start, goal)
+                if expected == math.inf:
+                    self.assertEqual(path, [])
+                    continue
+                self.assertEqual((tuple(path[0]), tuple(path[-1])), (start, goal))
+                length = sum(math.hypot(b[0] - a[0], b[1] - a[1]) for a, b in zip(path, path[1:]))
+                self.assertAlmostEqual(cost, length, places=6)
+                # Shortcuts through line of sight make the paths no longer than the grid optimum here
+                self.assertLessEqual(cost, expected + 1e-6)
+                for a, b in zip(path, path[1:]):
+                    self.assertTrue(max(abs(b[0] - a[0]), abs(b[1] - a[1])) == 1
+                                    or planning_utils.line_of_sight(grid, a, b))
+
+    def test_planners_are_registered(self):
+        for name in ('a_star', 'a_star_fast', 'jps', 'theta_star', 'lazy_theta_star'):
+            self.assertIn(name, planning_utils.PLANNERS)
+
+
+class HierarchicalPlannerTest(PlannerTestCase):
+
+    def test_paths_are_valid_and_near_optimal(self):
+        ratios = []
+        for grid, start, goal in _random_problems(5, 10, size=64, density=0.25):
+            planner = planning_utils.HierarchicalPlanner(grid, cluster_size=16)
+            path, cost = _quiet(planner.plan, start, goal)
+            expected = _reference_cost(grid, start, goal)
+            if expected == math.inf:
+                self.assertEqual(path, [])
+                continue
+            self.assertGridPath(grid, path, cost, start, goal)
+            ratios.append(cost/expected)
+        self.assertGreaterEqual(min(ratios), 1 - 1e-9)
+        self.assertLess(max(ratios), 1.2)
+
+    def test_nearby_queries_search_directly(self):
+        grid = np.zeros((64, 64), dtype=np.int64)
+        planner = planning_utils.HierarchicalPlanner(grid, cluster_size=16)
+        # Straight across a cluster corner, away from the entrances
+        for start, goal in (((14, 3), (17, 3)), ((3, 3), (20, 20)), ((14, 14), (17, 17))):
+            path, cost = _quiet(planner.plan, start, goal)
+            self.assertAlmostEqual(cost, _reference_cost(grid, start, goal), places=6)
+            self.assertGridPath(grid, path, cost, start, goal)
+
+    def test_blocked_endpoints_and_same_cell(self):
+        grid = np.zeros((32, 32), dtype=np.int64)
+        grid[5, 5] = 1
+        planner = planning_utils.HierarchicalPlanner(grid, cluster_size=8)
+        self.assertEqual(_quiet(planner.plan, (5, 5), (20, 20)), ([], 0))
+        self.assertEqual(_quiet(planner.plan, (3, 3), (3, 3)), ([(3, 3)], 0.0))
+
+
+class DStarLiteTest(PlannerTestCase):
+
+    def test_initial_plan_is_optimal(self):
+        for grid, start, goal in _random_problems(6, 15):
+            path, cost = _quiet(planning_utils.d_star_lite, grid, start, goal)
+            expected = _reference_cost(grid, start, goal)
+            if expected == math.inf:
+                self.assertEqual(path, [])
+                continue
+            self.assertAlmostEqual(cost, expected, places=6)
+            self.assertGridPath(grid, path, cost, start, goal)
+
+    def test_repairs_match_a_fresh_search(self):
+        rng = np.random.default_rng(7)
+        for grid, start, goal in _random_problems(7, 8, density=0.2):
+            planner = planning_utils.DStarLite(grid, start, goal)
+            path, _ = _quiet(planner.plan)
+            for step in range(4):
+                # Move along the path, then close and open a few cells
+                if len(path) > 3:
+                    planner.move_start(path[2])
+                cells = [tuple(cell) for cell in rng.integers(0, grid.shape[0], (6, 2))
+                         if tuple(cell) not in (planner.start, goal)]
+                planner.update_cells(cells, occupied=step % 2 == 0)
+                path, cost = _quiet(planner.plan)
+                expected = _reference_cost(planner.grid, planner.start, goal)
+                if expected == math.inf:
+                    self.assertEqual(path, [])
+                    break
+                self.assertAlmostEqual(cost, expected, places=6)
+                self.assertGridPath(planner.grid, path, cost, planner.start, goal)
+
+    def test_update_cells_returns_the_changed_cells(self):
+        planner = planning_utils.DStarLite(np.zeros((8, 8), dtype=np.int64), (0, 0), (7, 7))
+        self.assertEqual(planner.update_cells([(3, 3), (3, 4)]), [(3, 3), (3, 4)])
+        self.assertEqual(planner.update_cells([(3, 3)]), [])
+        self.assertEqual(planner.update_cells([(3, 3)], occupied=False), [(3, 3)])
+        self.assertEqual(planner.grid[3, 4], 1)
+
+
+class StringPullTest(PlannerTestCase):
+
+    def test_line_of_sight(self):
+        grid = np.zeros((5, 5), dtype=np.int64)
+        grid[2, 2] = 1
+        self.assertTrue(planning_utils.line_of_sight(grid, (0, 0), (4, 1)))
+        self.assertFalse(planning_utils.line_of_sight(grid, (0, 0), (4, 4)))
+        self.assertFalse(planning_utils.line_of_sight(grid, (2, 0), (2, 4)))
+        # Through a corner both side cells have to be free
+        grid = np.zeros((2, 2), dtype=np.int64)
+        grid[0, 1] = 1
+        self.assertFalse(planning_utils.line_of_sight(grid, (0, 0), (1, 1)))
+
+    def test_pulled_waypoints_are_flyable(self):
+        for grid, start, goal in _random_problems(8, 40, size=60, density=0.2):
+            path, cost = _quiet(planning_utils.a_star_fast, grid, start, goal)
+            if not path:
+                continue
+            pulled = planning_utils.string_pull(grid, path)
+            self.assertEqual((pulled[0], pulled[-1]), (start, goal))
+            indices = [path.index(cell) for cell in pulled]
+            self.assertEqual(indices, sorted(indices))
+            for (a, b), (i, j) in zip(zip(pulled, pulled[1:]), zip(indices, indices[1:])):
+                # Either a straight run of the grid path or a segment in line of sight
+                run = np.diff(np.array(path[i:j + 1]), axis=0)
+                self.assertTrue((run == run[0]).all() or planning_utils.line_of_sight(grid, a, b))
+            length = sum(math.hypot(b[0] - a[0], b[1] - a[1]) for a, b in zip(pulled, pulled[1:]))
+            self.assertLessEqual(length, cost + 1e-6)
+
+    def test_open_paths_collapse(self):
+        grid = np.zeros((300, 300), dtype=np.int64)
+        staircase = [(i//2, (i + 1)//2) for i in range(500)]
+        self.assertEqual(planning_utils.string_pull(grid, staircase), [staircase[0], staircase[-1]])
+        corner = [(0, c) for c in range(300)] + [(r, 299) for r in range(1, 300)]
+        self.assertEqual(planning_utils.string_pull(grid, corner), [(0, 0), (299, 299)])
+        grid[200:, 150] = 1
+        self.assertEqual(len(planning_utils.string_pull(grid, corner)), 2)
+        grid[:, 150] = 1
+        grid[0, 150] = 0
+        self.assertEqual(planning_utils.string_pull(grid, corner), [(0, 0), (0, 299), (299, 299)])
+
+    def test_short_paths_are_unchanged(self):
+        grid = np.zeros((3, 3), dtype=np.int64)
+        self.assertEqual(planning_utils.string_pull(grid, []), [])
+        self.assertEqual(planning_utils.string_pull(grid, [(0, 0), (1, 1)]), [(0, 0), (1, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
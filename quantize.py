@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from detectors import category_index_from_names, class_ids, get_detector
+from tracker import assign, iou_matrix
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+SSD_OUTPUTS = ['TFLite_Detection_PostProcess', 'TFLite_Detection_PostProcess:1',
+               'TFLite_Detection_PostProcess:2', 'TFLite_Detection_PostProcess:3']
+
+
+def _files(sources):
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, names in sorted(os.walk(source)):
+                yield from (os.path.join(root, name) for name in sorted(names))
+        else:
+            yield source
+
+def sample_frames(sources, count=300, seed=0):
+    '''
+    BGR frames spread evenly over recorded Gazebo streams (video files) and image directories,
+    in random order (consecutive frames are near duplicates, so they are never sampled together)
+    '''
+    references = []
+    for path in _files(sources):
+        extension = os.path.splitext(path)[1].lower()
+        if extension in IMAGE_EXTENSIONS:
+            references.append((path, None))
+        elif extension in VIDEO_EXTENSIONS:
+            capture = cv2.VideoCapture(path)
+            references += [(path, i) for i in range(int(capture.get(cv2.CAP_PROP_FRAME_COUNT)))]
+            capture.release()
+    if not references:
+        raise ValueError(f'No video or image files in {", ".join(sources)}')
+    picked = np.unique(np.linspace(0, len(references) - 1, min(count, len(references))).round().astype(int))
+    frames = []
+    capture, opened = None, None
+    for path, index in (references[i] for i in picked):
+        if index is None:
+            frames.append(cv2.imread(path))
+            continue
+        if opened != path:
+            capture, opened = cv2.VideoCapture(path), path
+        capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ok, frame = capture.read()
+        if ok:
+            frames.append(frame)
+    np.random.default_rng(seed).shuffle(frames)
+    return frames
+
+def record(output, seconds=60, fps=10, port=5600):
+    '''
+    Records the Gazebo camera stream to a video file, for calibration and evaluation
+    '''
+    from gazebo_camera import Video
+    video = Video(port=port)
+    writer = None
+    seq = None
+    end = time.time() + seconds
+    while time.time() < end:
+        captured = video.next_frame(timeout=1.0, after=seq)
+        if captured is None:
+            continue
+        seq, _, frame = captured
+        if writer is None:
+            writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*'mp4v'), fps, frame.shape[1::-1])
+        writer.write(frame)
+        video.release(seq)
+        time.sleep(1/fps)
+    if writer is not None:
+        writer.release()
+    return output
+
+
+def _model_input(frame, size, mean, scale):
+    ''' float input of the converted graph: resized RGB, (x - mean)/scale '''
+    return (cv2.resize(frame[..., ::-1], (size, size)).astype(np.float32) - mean)/scale
+
+def representative_dataset(frames, size, mean, scale):
+    def generator():
+        for frame in frames:
+            yield [_model_input(frame, size, mean, scale)[None]]
+    return generator
+
+def _convert(converter, output, frames, size, mean, scale, quantize):
+    import tensorflow as tf
+    if quantize:
+        # Post-training full integer quantization, weights and activations calibrated on the frames.
+        # Only INT8 kernels are allowed, so conversion fails instead of silently keeping float ops.
+        # The uint8 input is the normalized input (x - mean)/scale quantized with the scale and zero
+        # point calibrated on the frames (the backends map it with q = x/scale + zero_point), the
+        # outputs stay float.
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset(frames, size, mean, scale)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+    with open(output, 'wb') as f:
+        f.write(converter.convert())
+    return output
+
+def convert_ssd(graph, output, frames, size=300, quantize=True):
+    '''
+    TFLite model of an SSD graph exported with the object detection API's export_tflite_ssd_graph.py
+    (tflite_graph.pb, with the TFLite_Detection_PostProcess op) for the tflite backend
+    '''
+    import tensorflow as tf
+    converter = tf.compat.v1.lite.TFLiteConverter.from_frozen_graph(
+        graph, input_arrays=['normalized_input_image_tensor'], output_arrays=SSD_OUTPUTS,
+        input_shapes={'normalized_input_image_tensor': [1, size, size, 3]})
+    converter.allow_custom_ops = True
+    return _convert(converter, output, frames, size, 127.5, 127.5, quantize)
+
+def convert_yolo(weights, output, frames, tiny=True, classes=80, size=416, target_classes=None, quantize=True):
+    '''
+    TFLite model of the raw YOLOv3(-Tiny) heads for the yolo-tflite backend
+    target_classes: class ids the head is pruned to (see yolov3_tf2.inference.prune_classes)
+    '''
+    import tensorflow as tf
+    from yolov3_tf2.inference import build_model, prune_classes
+    model, _, _ = build_model(tiny, classes, size)
+    model.load_weights(weights).expect_partial()
+    if target_classes is not None:
+        pruned, _, _ = build_model(tiny, len(target_classes), size)
+        model = prune_classes(model, pruned, target_classes, classes)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    return _convert(converter, output, frames, size, 0.0, 255.0, quantize)
+
+def quantize_onnx(model, output, frames, labels=os.path.join('data', 'mscoco_label_map.pbtxt')):
+    '''
+    Static INT8 quantization (QDQ, per-channel weights) of an ONNX model of the onnx backend
+    '''
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    detector = get_detector('onnx', model_path=model, labels=labels)
+    detector.load()
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.inputs = iter([{detector.input_name: detector.preprocess(frame[None])} for frame in frames])
+
+        def get_next(self):
+            return next(self.inputs, None)
+
+    quantize_static(model, output, Reader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    return output
+
+
+def _detections(detector, frame):
+    start = time.perf_counter()
+    boxes, scores, classes, nums = detector.detect(frame[None])
+    elapsed = time.perf_counter() - start
+    n = int(nums[0])
+    keep = scores[0][:n] >= detector.confidence
+    return boxes[0][:n][keep], scores[0][:n][keep], classes[0][:n][keep], elapsed
+
+def compare(reference, candidate, frames, iou_threshold=0.5):
+    '''
+    Accuracy of a quantized detector against its float model, the float detections (above the
+    backend confidence) are taken as ground truth
+    Returns:
+        dict: precision, recall, mean IoU and mean absolute score error of the matched detections,
+        and the mean latency of both models in ms
+    '''
+    for detector in (reference, candidate):
+        detector.warmup(frames[0].shape)
+    matched = false_positives = false_negatives = 0
+    ious, score_errors, times = [], [], {'reference': [], 'candidate': []}
+    for frame in frames:
+        ref_boxes, ref_scores, ref_classes, ref_time = _detections(reference, frame)
+        boxes, scores, classes, candidate_time = _detections(candidate, frame)
+        times['reference'].append(ref_time)
+        times['candidate'].append(candidate_time)
+        iou = iou_matrix(ref_boxes, boxes)*(ref_classes[:, None] == classes[None, :])
+        pairs = assign(1 - iou, 1 - iou_threshold)
+        matched += len(pairs)
+        false_negatives += len(ref_boxes) - len(pairs)
+        false_positives += len(boxes) - len(pairs)
+        ious += [iou[r, c] for r, c in pairs]
+        score_errors += [abs(ref_scores[r] - scores[c]) for r, c in pairs]
+    return {'frames': len(frames),
+            'reference_detections': matched + false_negatives,
+            'precision': matched/(matched + false_positives) if matched + false_positives else 1.0,
+            'recall': matched/(matched + false_negatives) if matched + false_negatives else 1.0,
+            'mean_iou': float(np.mean(ious)) if ious else None,
+            'mean_score_error': float(np.mean(score_errors)) if score_errors else None,
+            'reference_ms': 1000*float(np.mean(times['reference'])),
+            'candidate_ms': 1000*float(np.mean(times['candidate']))}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Post-training INT8 quantization of the detectors for CPU inference')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    recorder = commands.add_parser('record', help='record the Gazebo camera stream for calibration')
+    recorder.add_argument('--output', required=True, help='video file')
+    recorder.add_argument('--seconds', type=float, default=60)
+    recorder.add_argument('--fps', type=float, default=10)
+    recorder.add_argument('--port', type=int, default=5600)
+
+    def model_parser(name, help):
+        model = commands.add_parser(name, help=help)
+        model.add_argument('--frames', nargs='+', required=True,
+                           help='recorded Gazebo videos and/or image directories')
+        model.add_argument('--count', type=int, default=300, help='calibration frames')
+        model.add_argument('--eval-count', type=int, default=50, help='held out frames for the accuracy report')
+        model.add_argument('--seed', type=int, default=0)
+        model.add_argument('--output', required=True, help='quantized model')
+        model.add_argument('--report', default=None, help='write the accuracy report to this .json file')
+        return model
+
+    ssd = model_parser('ssd', 'SSD graph -> INT8 TFLite (tflite backend)')
+    ssd.add_argument('--graph', default='ssdlite_mobilenet_v2_coco_2018_05_09/tflite_graph.pb',
+                     help='graph exported with export_tflite_ssd_graph.py')
+    ssd.add_argument('--size', type=int, default=300)
+    ssd.add_argument('--labels', default=os.path.join('data', 'mscoco_label_map.pbtxt'))
+
+    yolo = model_parser('yolo', 'YOLOv3(-Tiny) checkpoint -> INT8 TFLite (yolo-tflite backend)')
+    yolo.add_argument('--weights', default='./checkpoints/yolov3-tiny.tf')
+    yolo.add_argument('--full', dest='tiny', action='store_false', help='YOLOv3 instead of YOLOv3-Tiny')
+    yolo.add_argument('--classes-file', default='./yolo_data/coco.names')
+    yolo.add_argument('--num-classes', type=int, default=80)
+    yolo.add_argument('--size', type=int, default=416)
+    yolo.add_argument('--classes', nargs='+', default=None, help='prune the head to these classes, e.g. person')
+
+    onnx = model_parser('onnx', 'ONNX model -> INT8 ONNX (onnx backend)')
+    onnx.add_argument('--model', required=True)
+    onnx.add_argument('--labels', default=os.path.join('data', 'mscoco_label_map.pbtxt'))
+    return parser.parse_args(argv)
+
+def float_path(output):
+    root, extension = os.path.splitext(output)
+    return root + '_float' + extension
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'record':
+        record(args.output, args.seconds, args.fps, args.port)
+        return 0
+    frames = sample_frames(args.frames, args.count + args.eval_count, args.seed)
+    calibration, evaluation = frames[:args.count], frames[args.count:]
+    print(f'{len(calibration)} calibration and {len(evaluation)} evaluation frames')
+    if args.command == 'ssd':
+        # The float model of the same graph is the reference of the accuracy report
+        for path, quantize in ((float_path(args.output), False), (args.output, True)):
+            convert_ssd(args.graph, path, calibration, args.size, quantize)
+        reference = get_detector('tflite', model_path=float_path(args.output), labels=args.labels)
+        candidate = get_detector('tflite', model_path=args.output, labels=args.labels)
+    elif args.command == 'yolo':
+        target_ids = None
+        if args.classes is not None:
+            target_ids = class_ids(category_index_from_names(args.classes_file), args.classes)
+        for path, quantize in ((float_path(args.output), False), (args.output, True)):
+            convert_yolo(args.weights, path, calibration, args.tiny, args.num_classes, args.size, target_ids, quantize)
+        reference = get_detector('yolo-tflite', model_path=float_path(args.output), classes_file=args.classes_file,
+                                 target_classes=args.classes)
+        candidate = get_detector('yolo-tflite', model_path=args.output, classes_file=args.classes_file,
+                                 target_classes=args.classes)
+    else:
+        quantize_onnx(args.model, args.output, calibration, args.labels)
+        reference = get_detector('onnx', model_path=args.model, labels=args.labels)
+        candidate = get_detector('onnx', model_path=args.output, labels=args.labels)
+    print(f'Wrote {args.output}')
+    if not evaluation:
+        return 0
+    reference.load()
+    candidate.load()
+    report = compare(reference, candidate, evaluation)
+    for key, value in report.items():
+        print(f'{key:<22} {value:.4g}' if isinstance(value, float) else f'{key:<22} {value}')
+    if args.report is not None:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Tests for quantize, the calibration frame sampling and the quantized vs float accuracy report."""
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from quantize import compare, sample_frames
+
+
+def _write_video(path, count, shape=(48, 64)):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, shape[::-1])
+    for i in range(count):
+        writer.write(np.full(shape + (3,), 10*i, dtype=np.uint8))
+    writer.release()
+
+
+class SampleFramesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        root = self.directory.name
+        os.mkdir(os.path.join(root, 'images'))
+        for i in range(4):
+            cv2.imwrite(os.path.join(root, 'images', f'{i}.png'), np.full((48, 64, 3), 200 + i, dtype=np.uint8))
+        self.video = os.path.join(root, 'flight.avi')
+        _write_video(self.video, 12)
+
+    def test_count_and_sources(self):
+        frames = sample_frames([self.directory.name], count=8)
+        self.assertEqual(len(frames), 8)
+        self.assertTrue(all(frame.shape == (48, 64, 3) for frame in frames))
+        # Picked evenly over the 12 video frames and the 4 images
+        self.assertTrue(any(frame.mean() >= 200 for frame in frames))
+        self.assertTrue(any(frame.mean() < 200 for frame in frames))
+        # Never more than there is
+        self.assertEqual(len(sample_frames([self.video], count=100)), 12)
+
+    def test_seed(self):
+        means = lambda frames: [round(float(frame.mean())) for frame in frames]
+        first, again = sample_frames([self.video], seed=1), sample_frames([self.video], seed=1)
+        self.assertEqual(means(first), means(again))
+        self.assertNotEqual(means(first), means(sample_frames([self.video], seed=2)))
+        self.assertEqual(sorted(means(first)), sorted(means(sample_frames([self.video], seed=2))))
+
+    def test_no_files(self):
+        empty = os.path.join(self.directory.name, 'empty')
+        os.mkdir(empty)
+        with self.assertRaises(ValueError):
+            sample_frames([empty])
+
+
+class FakeDetector():
+    """ Replays fixed (boxes, scores, classes) per frame index, frames are filled with their index """
+
+    confidence = 0.3
+
+    def __init__(self, detections):
+        self.detections = detections
+        self.warmed_up = None
+
+    def warmup(self, shape):
+        self.warmed_up = shape
+
+    def detect(self, frames):
+        boxes, scores, classes = (np.asarray(a, dtype=float) for a in self.detections[int(frames[0, 0, 0, 0])])
+        return boxes[None].reshape(1, -1, 4), scores[None], classes[None], np.array([len(scores)])
+
+
+class CompareTest(unittest.TestCase):
+
+    def test_metrics(self):
+        frames = [np.full((4, 4, 3), i, dtype=np.uint8) for i in range(2)]
+        reference = FakeDetector([
+            ([[0, 0, 10, 10], [20, 20, 30, 30]], [0.9, 0.8], [0, 0]),
+            ([[0, 0, 10, 10]], [0.7], [0]),
+        ])
+        candidate = FakeDetector([
+            # a shifted match, a box of the wrong class and one below the confidence
+            ([[0, 0, 10, 8], [20, 20, 30, 30], [50, 50, 60, 60]], [0.8, 0.9, 0.1], [0, 1, 0]),
+            ([[0, 0, 10, 10], [40, 40, 50, 50]], [0.6, 0.5], [0, 0]),
+        ])
+        report = compare(reference, candidate, frames)
+        self.assertEqual(reference.warmed_up, (4, 4, 3))
+        self.assertEqual(candidate.warmed_up, (4, 4, 3))
+        self.assertEqual(report['frames'], 2)
+        self.assertEqual(report['reference_detections'], 3)
+        self.assertAlmostEqual(report['precision'], 2/4)
+        self.assertAlmostEqual(report['recall'], 2/3)
+        self.assertAlmostEqual(report['mean_iou'], (0.8 + 1.0)/2)
+        self.assertAlmostEqual(report['mean_score_error'], 0.1)
+        self.assertGreaterEqual(report['candidate_ms'], 0)
+
+    def test_no_detections(self):
+        frames = [np.zeros((4, 4, 3), dtype=np.uint8)]
+        nothing = ([], [], [])
+        report = compare(FakeDetector([nothing]), FakeDetector([nothing]), frames)
+        self.assertEqual((report['precision'], report['recall']), (1.0, 1.0))
+        self.assertIsNone(report['mean_iou'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,259 @@
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:     # scipy is optional, fall back to greedy matching
+    linear_sum_assignment = None
+
+from geo import EARTH_RADIUS
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """ Pairwise IoU of (N,4) and (M,4) [top, left, bottom, right] boxes -> (N,M) """
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    top = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    left = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    bottom = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    right = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(bottom - top, 0, None)*np.clip(right - left, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0])*(boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0])*(boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection/np.where(union > 0, union, 1), 0)
+
+
+def assign(cost, max_cost):
+    """ Minimum cost matching, pairs costing more than max_cost are left unmatched
+    Returns:
+        list: (row, col) matched pairs
+    """
+    if cost.size == 0:
+        return []
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(cost)
+        return [(r, c) for r, c in zip(rows, cols) if cost[r, c] <= max_cost]
+    pairs = []
+    used_rows, used_cols = set(), set()
+    for flat in np.argsort(cost, axis=None):
+        r, c = np.unravel_index(flat, cost.shape)
+        if cost[r, c] > max_cost:
+            break
+        if r not in used_rows and c not in used_cols:
+            pairs.append((r, c))
+            used_rows.add(r)
+            used_cols.add(c)
+    return pairs
+
+
+def _inside(boxes, regions):
+    """ (N,) True where the center of a box lies in one of the (K,4) regions """
+    centers = (boxes[:, 0:2] + boxes[:, 2:4])/2
+    regions = np.asarray(regions, dtype=np.float64).reshape(-1, 4)
+    return ((centers[:, None] >= regions[None, :, 0:2]) & (centers[:, None] <= regions[None, :, 2:4])).all(-1).any(-1)
+
+
+class BoxTrack():
+    """Constant velocity Kalman filter on a box in normalized image coordinates
+    State: [cx, cy, w, h, vx, vy], velocities in normalized units per frame.
+    Attributes:
+        track_id (int): unique id of the track
+        hits (int): number of matched detections
+        streak (int): consecutive frames with a matched detection
+        time_since_update (int): frames since the last matched detection
+        score (float): score of the last matched detection
+    """
+
+    F = np.eye(6)
+    F[0, 4] = F[1, 5] = 1
+    H = np.eye(4, 6)
+
+    def __init__(self, box, score, track_id, process_std=0.01, measurement_std=0.02):
+        top, left, bottom, right = box
+        self.x = np.array([(left + right)/2, (top + bottom)/2, right - left, bottom - top, 0., 0.])
+        self.P = np.diag([measurement_std**2]*4 + [0.05**2]*2)
+        self.Q = np.eye(6)*process_std**2
+        self.R = np.eye(4)*measurement_std**2
+        self.track_id = track_id
+        self.score = score
+        self.hits = 1
+        self.streak = 1
+        self.time_since_update = 0
+
+    def predict(self):
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        if self.time_since_update > 0:     # missed the previous frame
+            self.streak = 0
+        self.time_since_update += 1
+
+    def update(self, box, score):
+        top, left, bottom, right = box
+        z = np.array([(left + right)/2, (top + bottom)/2, right - left, bottom - top])
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - self.H @ self.x)
+        self.P = (np.eye(6) - K @ self.H) @ self.P
+        self.score = score
+        self.hits += 1
+        self.streak += 1
+        self.time_since_update = 0
+
+    @property
+    def box(self):
+        cx, cy, w, h = self.x[0:4]
+        return np.array([cy - h/2, cx - w/2, cy + h/2, cx + w/2])
+
+
+class BoxTracker():
+    """Multi-target tracker in image space (Kalman prediction + IoU/Hungarian association)
+    Attributes:
+        iou_threshold (float): minimum IoU to associate a detection with a track
+        max_age (int): frames a track survives without detections
+        min_hits (int): matched detections before a track is confirmed
+        max_tracks (int): hard cap on live tracks, the stalest ones are dropped first
+        tracks (list): live BoxTrack objects
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=5, min_hits=2, max_tracks=32):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.max_tracks = max_tracks
+        self.tracks = []
+        self._next_id = 0
+
+    def update(self, boxes, scores, regions=None):
+        """ Advance one frame with the detections of that frame
+        regions: (K,4) normalized areas the detector ran on, e.g. tile_regions of the active tiles of a
+            MotionGate, None for the whole frame. Unmatched tracks predicted outside of them coast.
+        Returns:
+            list: confirmed tracks that were matched in this frame
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+        streaks = [track.streak for track in self.tracks]
+        for track in self.tracks:
+            track.predict()
+        predicted = np.array([track.box for track in self.tracks]).reshape(-1, 4)
+        pairs = assign(1 - iou_matrix(predicted, boxes), 1 - self.iou_threshold)
+        matched = set()
+        for t, d in pairs:
+            self.tracks[t].update(boxes[d], scores[d])
+            matched.add(d)
+        coasted = set()
+        if regions is not None:
+            for t in set(np.flatnonzero(~_inside(predicted, regions))) - {t for t, _ in pairs}:
+                self._unmiss(self.tracks[t], streaks[t])
+                coasted.add(self.tracks[t].track_id)
+        for d in range(len(boxes)):
+            if d not in matched:
+                self.tracks.append(BoxTrack(boxes[d], scores[d], self._next_id))
+                self._next_id += 1
+        self.tracks = [track for track in self.tracks if track.time_since_update <= self.max_age]
+        if len(self.tracks) > self.max_tracks:
+            self.tracks.sort(key=lambda track: (track.time_since_update, -track.hits))
+            self.tracks = self.tracks[:self.max_tracks]
+        return [track for track in self.tracks if track.time_since_update == 0
+                and track.hits >= self.min_hits and track.track_id not in coasted]
+
+    def coast(self):
+        """ Advance one frame the detector was skipped on: tracks are predicted, but not counted as missed """
+        for track in self.tracks:
+            streak = track.streak
+            track.predict()
+            self._unmiss(track, streak)
+
+    @staticmethod
+    def _unmiss(track, streak):
+        """ Undo the miss a predict() counted on a frame the track was not looked for """
+        track.time_since_update -= 1
+        track.streak = streak
+
+    def stable(self, min_streak=5):
+        """ True when every live track has been matched for min_streak consecutive frames,
+        i.e. the detector can be skipped and the tracks predicted instead """
+        return len(self.tracks) > 0 and all(track.time_since_update == 0 and track.streak >= min_streak
+                                            for track in self.tracks)
+
+
+class GeoFusion():
+    """Fuses geolocated detections into per-target estimates in world space
+    Each target is a static position with a 2x2 covariance in local north/east meters, updated
+    with a Kalman step per associated detection. Associations are gated by distance.
+    Attributes:
+        gate_m (float): maximum distance between a detection and a target to associate them
+        measurement_std_m (float): standard deviation of a single geolocation fix
+        max_targets (int): hard cap on targets, the least confident ones are dropped first
+    """
+
+    def __init__(self, gate_m=5.0, measurement_std_m=3.0, max_targets=16):
+        self.gate_m = gate_m
+        self.measurement_std_m = measurement_std_m
+        self.max_targets = max_targets
+        self.reference = None
+        self.means = np.zeros((0, 2))
+        self.covariances = np.zeros((0, 2, 2))
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.confidences = np.zeros(0)
+
+    def _to_local(self, lats, lons):
+        lat0, lon0 = self.reference
+        north = np.radians(np.asarray(lats) - lat0)*EARTH_RADIUS
+        east = np.radians(np.asarray(lons) - lon0)*EARTH_RADIUS*np.cos(np.radians(lat0))
+        return np.stack((north, east), axis=-1)
+
+    def _to_geo(self, points):
+        lat0, lon0 = self.reference
+        lats = lat0 + np.degrees(points[:, 0]/EARTH_RADIUS)
+        lons = lon0 + np.degrees(points[:, 1]/(EARTH_RADIUS*np.cos(np.radians(lat0))))
+        return lats, lons
+
+    def update(self, lats, lons, scores):
+        """ Associate a batch of geolocated detections with the targets """
+        lats = np.asarray(lats, dtype=np.float64).reshape(-1)
+        lons = np.asarray(lons, dtype=np.float64).reshape(-1)
+        scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+        valid = np.isfinite(lats) & np.isfinite(lons)
+        lats, lons, scores = lats[valid], lons[valid], scores[valid]
+        if len(lats) == 0:
+            return
+        if self.reference is None:
+            self.reference = (lats[0], lons[0])
+        points = self._to_local(lats, lons)
+        distances = np.linalg.norm(self.means[:, None, :] - points[None, :, :], axis=-1)
+        pairs = assign(distances, self.gate_m)
+        R = np.eye(2)*self.measurement_std_m**2
+        matched = set()
+        for t, d in pairs:
+            P = self.covariances[t]
+            K = P @ np.linalg.inv(P + R)
+            self.means[t] = self.means[t] + K @ (points[d] - self.means[t])
+            self.covariances[t] = (np.eye(2) - K) @ P
+            self.hits[t] += 1
+            self.confidences[t] = 1 - (1 - self.confidences[t])*(1 - scores[d])
+            matched.add(d)
+        new = [d for d in range(len(points)) if d not in matched]
+        if new:
+            self.means = np.concatenate((self.means, points[new]))
+            self.covariances = np.concatenate((self.covariances, np.repeat(R[None], len(new), axis=0)))
+            self.hits = np.concatenate((self.hits, np.ones(len(new), dtype=np.int64)))
+            self.confidences = np.concatenate((self.confidences, scores[new]))
+        if len(self.means) > self.max_targets:
+            keep = np.sort(np.argsort(-self.confidences, kind='stable')[:self.max_targets])
+            self.means, self.covariances = self.means[keep], self.covariances[keep]
+            self.hits, self.confidences = self.hits[keep], self.confidences[keep]
+
+    def targets(self, min_hits=1):
+        """ Targets seen at least min_hits times, most confident first
+        Returns:
+            list: dicts with lat, lon, std_m, hits and confidence
+        """
+        if self.reference is None:
+            return []
+        lats, lons = self._to_geo(self.means)
+        std_m = np.sqrt(np.trace(self.covariances, axis1=1, axis2=2)/2)
+        order = np.argsort(-self.confidences, kind='stable')
+        return [{'lat': lats[i], 'lon': lons[i], 'std_m': std_m[i],
+                 'hits': int(self.hits[i]), 'confidence': self.confidences[i]}
+                for i in order if self.hits[i] >= min_hits]
@@ -0,0 +1,132 @@
+"""Tests for tracker, image-space box tracking and world-space target fusion."""
+import unittest
+
+import numpy as np
+
+import tracker
+from tracker import BoxTracker, GeoFusion, assign, iou_matrix
+
+
+class AssignTest(unittest.TestCase):
+
+    def test_iou_matrix(self):
+        boxes_a = [[0, 0, 1, 1], [0, 0, 0, 0]]
+        boxes_b = [[0, 0, 1, 1], [0.5, 0, 1.5, 1], [2, 2, 3, 3]]
+        np.testing.assert_allclose(iou_matrix(boxes_a, boxes_b), [[1, 1/3, 0], [0, 0, 0]])
+
+    def test_assign_respects_max_cost(self):
+        # The optimal matching (0, 1), (1, 0) beats taking the cheapest pair (0, 0) first
+        cost = np.array([[0.1, 0.2], [0.15, 0.9]])
+        self.assertEqual(sorted(assign(cost, 1.0)), [(0, 1), (1, 0)])
+        self.assertEqual(sorted(assign(cost, 0.18)), [(1, 0)])
+
+    def test_greedy_fallback(self):
+        scipy_assignment = tracker.linear_sum_assignment
+        tracker.linear_sum_assignment = None
+        try:
+            cost = np.array([[0.1, 0.2], [0.3, 0.9]])
+            self.assertEqual(sorted(assign(cost, 0.5)), [(0, 0)])
+            self.assertEqual(assign(np.zeros((0, 3)), 0.5), [])
+        finally:
+            tracker.linear_sum_assignment = scipy_assignment
+
+
+class BoxTrackerTest(unittest.TestCase):
+
+    def test_tracks_confirm_after_min_hits(self):
+        boxes_tracker = BoxTracker(min_hits=3)
+        box = [0.4, 0.4, 0.5, 0.5]
+        self.assertEqual(boxes_tracker.update([box], [0.9]), [])
+        self.assertEqual(boxes_tracker.update([box], [0.9]), [])
+        confirmed = boxes_tracker.update([box], [0.8])
+        self.assertEqual(len(confirmed), 1)
+        self.assertEqual(confirmed[0].hits, 3)
+        self.assertEqual(confirmed[0].score, 0.8)
+
+    def test_identity_follows_a_moving_box(self):
+        boxes_tracker = BoxTracker()
+        ids = set()
+        for i in range(10):
+            x = 0.1 + 0.02*i
+            boxes_tracker.update([[0.4, x, 0.5, x + 0.1], [0.8, 0.8, 0.9, 0.9]], [0.9, 0.9])
+            ids |= {track.track_id for track in boxes_tracker.tracks}
+        self.assertEqual(len(ids), 2)
+        # The constant velocity model predicts the next position
+        boxes_tracker.update([], [])
+        moving = min(boxes_tracker.tracks, key=lambda track: track.box[0])
+        self.assertAlmostEqual(moving.box[1], 0.1 + 0.02*10, delta=0.01)
+
+    def test_missed_tracks_age_out(self):
+        boxes_tracker = BoxTracker(max_age=2)
+        boxes_tracker.update([[0.1, 0.1, 0.2, 0.2]], [0.9])
+        for _ in range(2):
+            boxes_tracker.update([], [])
+        self.assertEqual(len(boxes_tracker.tracks), 1)
+        boxes_tracker.update([], [])
+        self.assertEqual(boxes_tracker.tracks, [])
+
+    def test_skipped_frames_coast(self):
+        boxes_tracker = BoxTracker(max_age=2)
+        for _ in range(3):
+            boxes_tracker.update([[0.1, 0.1, 0.2, 0.2]], [0.9])
+        for _ in range(10):
+            boxes_tracker.coast()
+        self.assertEqual(len(boxes_tracker.tracks), 1)
+        self.assertTrue(boxes_tracker.stable(min_streak=3))
+
+    def test_tracks_outside_of_the_regions_coast(self):
+        boxes_tracker = BoxTracker(max_age=2)
+        boxes = [[0.1, 0.1, 0.2, 0.2], [0.7, 0.7, 0.8, 0.8]]
+        for _ in range(3):
+            boxes_tracker.update(boxes, [0.9, 0.9])
+        # Only the top left tile ran, the person in the bottom right one was not looked for
+        top_left = [[0, 0, 0.56, 0.56]]
+        for _ in range(10):
+            confirmed = boxes_tracker.update([boxes[0]], [0.9], regions=top_left)
+        self.assertEqual(len(confirmed), 1)
+        self.assertEqual(len(boxes_tracker.tracks), 2)
+        self.assertEqual(max(track.time_since_update for track in boxes_tracker.tracks), 0)
+        # Once its tile runs again without it, it is missed
+        for _ in range(3):
+            boxes_tracker.update([boxes[0]], [0.9], regions=top_left + [[0.44, 0.44, 1, 1]])
+        self.assertEqual([track.box[0] < 0.5 for track in boxes_tracker.tracks], [True])
+
+    def test_max_tracks(self):
+        boxes_tracker = BoxTracker(max_tracks=4)
+        boxes = [[0.1*i, 0, 0.1*i + 0.05, 0.05] for i in range(8)]
+        boxes_tracker.update(boxes, np.ones(8))
+        self.assertEqual(len(boxes_tracker.tracks), 4)
+
+
+class GeoFusionTest(unittest.TestCase):
+
+    def test_fixes_of_one_person_fuse(self):
+        rng = np.random.default_rng(0)
+        fusion = GeoFusion(gate_m=10.0, measurement_std_m=3.0)
+        lat, lon = 38.1614, -122.4545
+        for _ in range(20):
+            noise = rng.normal(0, 3.0, 2)/111320
+            fusion.update([lat + noise[0]], [lon + noise[1]/np.cos(np.radians(lat))], [0.5])
+        targets = fusion.targets()
+        self.assertEqual(len(targets), 1)
+        self.assertEqual(targets[0]['hits'], 20)
+        self.assertLess(abs(targets[0]['lat'] - lat)*111320, 3.0)
+        self.assertLess(targets[0]['std_m'], 1.0)
+        self.assertGreater(targets[0]['confidence'], 0.99)
+
+    def test_distant_fixes_are_separate_targets(self):
+        fusion = GeoFusion(gate_m=5.0)
+        fusion.update([38.0, 38.001], [-122.0, -122.0], [0.9, 0.6])
+        fusion.update([38.0, 38.001, np.nan], [-122.0, -122.0, -122.0], [0.9, 0.6, 0.9])
+        targets = fusion.targets(min_hits=2)
+        self.assertEqual(len(targets), 2)
+        self.assertGreater(targets[0]['confidence'], targets[1]['confidence'])
+
+    def test_no_targets_before_the_first_fix(self):
+        fusion = GeoFusion()
+        fusion.update([np.nan], [np.nan], [0.9])
+        self.assertEqual(fusion.targets(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
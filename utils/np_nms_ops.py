@@ -0,0 +1,261 @@
+"""Vectorized non-max suppression on NumPy boxes.
+
+CPU post-processing for detectors that return raw candidates (ONNX/TFLite exports without the
+in-graph NMS, tiled inference). Unlike np_box_list_ops.non_max_suppression, which checks the
+candidates one by one against np_box_ops.iou, the candidates are suppressed a block at a time: a
+block is first compared with every box kept so far in one overlap matrix, only its survivors are
+compared with each other, and the remaining greedy pass only touches boolean rows. The first
+blocks are small and only they are sorted up front, as they usually fill max_output_size.
+
+Boxes are [N, 4] arrays of [y_min, x_min, y_max, x_max], as everywhere in utils.
+"""
+import numpy as np
+
+BLOCK_SIZE = 256
+FIRST_BLOCK_SIZE = 64
+
+
+def area(boxes):
+    """Areas of [N, 4] boxes."""
+    return (boxes[:, 2] - boxes[:, 0])*(boxes[:, 3] - boxes[:, 1])
+
+
+def iou(boxes1, boxes2, area1=None, area2=None):
+    """Pairwise intersection-over-union.
+
+    Args:
+        boxes1: [N, 4] boxes.
+        boxes2: [M, 4] boxes.
+        area1, area2: optional precomputed areas of the boxes.
+
+    Returns:
+        [N, M] float array, 0 where the union is empty.
+    """
+    area1 = area(boxes1) if area1 is None else area1
+    area2 = area(boxes2) if area2 is None else area2
+    y_min = np.maximum(boxes1[:, None, 0], boxes2[None, :, 0])
+    x_min = np.maximum(boxes1[:, None, 1], boxes2[None, :, 1])
+    y_max = np.minimum(boxes1[:, None, 2], boxes2[None, :, 2])
+    x_max = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3])
+    intersection = np.maximum(y_max - y_min, 0)*np.maximum(x_max - x_min, 0)
+    union = area1[:, None] + area2[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def _float(boxes):
+    boxes = np.asarray(boxes)
+    return (boxes if boxes.dtype.kind == 'f' else boxes.astype(np.float32)).reshape(-1, 4)
+
+
+def _overlaps(columns1, columns2, area1, area2, iou_threshold):
+    """[N, M] iou > iou_threshold of [4, N] and [4, M] box columns, without the division."""
+    intersection = np.minimum(columns1[2][:, None], columns2[2])
+    intersection -= np.maximum(columns1[0][:, None], columns2[0])
+    np.maximum(intersection, 0, out=intersection)
+    width = np.minimum(columns1[3][:, None], columns2[3])
+    width -= np.maximum(columns1[1][:, None], columns2[1])
+    np.maximum(width, 0, out=width)
+    intersection *= width
+    # intersection/union > t  <=>  intersection*(1 + t) > t*(area1 + area2), also for an empty union
+    intersection *= 1 + iou_threshold
+    areas = area1[:, None] + area2
+    areas *= iou_threshold
+    return intersection > areas
+
+
+def _valid(scores, score_threshold):
+    """Indices of the scores above the threshold."""
+    return np.flatnonzero(scores >= score_threshold) if score_threshold > -np.inf \
+        else np.arange(len(scores))
+
+
+def _best_first(scores, valid, top_k=None):
+    """The valid indices sorted by score, only the top_k best if given.
+
+    Ties keep the index order, so the top_k best are the first top_k of the full order.
+    """
+    if top_k is not None and top_k < len(valid):
+        valid_scores = scores[valid]
+        kth = -np.partition(-valid_scores, top_k - 1)[top_k - 1]
+        above = valid[valid_scores > kth]
+        valid = np.concatenate((above, valid[valid_scores == kth][:top_k - len(above)]))
+    return valid[np.argsort(-scores[valid], kind='stable')]
+
+
+def _non_max_suppression(boxes, scores, classes, iou_threshold, score_threshold, max_output_size, block_size):
+    if not 0 <= iou_threshold <= 1.0:
+        raise ValueError('IOU threshold must be in [0, 1].')
+    boxes = _float(boxes)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    if len(boxes) != len(scores):
+        raise ValueError('boxes and scores must have the same number of entries.')
+    valid = _valid(scores, score_threshold)
+    keep = np.empty(min(max_output_size, len(valid)), dtype=np.int64)
+    # Coordinates as contiguous [4, N] columns, the pairwise tests broadcast rows of them
+    columns = np.ascontiguousarray(boxes.T)
+    kept_columns = np.empty((4, len(keep)), dtype=boxes.dtype)
+    kept_areas = np.empty(len(keep), dtype=boxes.dtype)
+    kept_classes = None if classes is None else np.empty(len(keep), dtype=classes.dtype)
+    # The first blocks usually fill keep: they start small and only their candidates are sorted up front
+    size = min(block_size, FIRST_BLOCK_SIZE)
+    order = _best_first(scores, valid, 2*size)
+    num_kept = start = 0
+    while num_kept < len(keep) and start < len(valid):
+        if start + size > len(order) < len(valid):
+            order = _best_first(scores, valid)
+        block = order[start:start + size]
+        start += len(block)
+        size = min(2*size, block_size)
+        block_columns = columns[:, block]
+        block_areas = (block_columns[2] - block_columns[0])*(block_columns[3] - block_columns[1])
+        block_classes = None if classes is None else classes[block]
+        if num_kept:
+            overlap = _overlaps(block_columns, kept_columns[:, :num_kept], block_areas, kept_areas[:num_kept],
+                                iou_threshold)
+            if classes is not None:
+                overlap &= block_classes[:, None] == kept_classes[:num_kept]
+            # Only boxes that survived the kept ones can still suppress each other
+            alive = np.flatnonzero(~overlap.any(axis=1))
+            block, block_columns, block_areas = block[alive], block_columns[:, alive], block_areas[alive]
+            block_classes = None if classes is None else block_classes[alive]
+        overlap = _overlaps(block_columns, block_columns, block_areas, block_areas, iou_threshold)
+        if classes is not None:
+            overlap &= block_classes[:, None] == block_classes
+        np.fill_diagonal(overlap, False)
+        # Greedy pass in score order: a kept row suppresses its overlaps, a row overlapping an earlier
+        # kept one is suppressed by it before it is reached, so the lower triangle changes nothing
+        suppressed = np.zeros(len(block), dtype=bool)
+        for i in np.flatnonzero(overlap.any(axis=1)):
+            if not suppressed[i]:
+                suppressed |= overlap[i]
+        kept = np.flatnonzero(~suppressed)[:len(keep) - num_kept]
+        new = slice(num_kept, num_kept + len(kept))
+        keep[new], kept_columns[:, new], kept_areas[new] = block[kept], block_columns[:, kept], block_areas[kept]
+        if classes is not None:
+            kept_classes[new] = block_classes[kept]
+        num_kept += len(kept)
+    return keep[:num_kept]
+
+
+def non_max_suppression(boxes, scores, iou_threshold=0.5, score_threshold=-np.inf,
+                        max_output_size=100, block_size=BLOCK_SIZE):
+    """Greedy non-max suppression.
+
+    Candidates below score_threshold are dropped and only the best block is sorted before any IoU
+    is computed, and the search stops as soon as max_output_size boxes are kept.
+
+    Args:
+        boxes: [N, 4] boxes.
+        scores: [N] scores.
+        iou_threshold: a box is suppressed by a better kept box it overlaps by more than this.
+        score_threshold: minimum score of a kept box.
+        max_output_size: maximum number of kept boxes.
+        block_size: number of sorted candidates suppressed at once.
+
+    Returns:
+        int array of the kept indices into boxes, best first.
+
+    Raises:
+        ValueError: if iou_threshold is not in [0, 1] or boxes and scores do not match.
+    """
+    return _non_max_suppression(boxes, scores, None, iou_threshold, score_threshold, max_output_size, block_size)
+
+
+def multiclass_non_max_suppression(boxes, scores, classes, iou_threshold=0.5, score_threshold=-np.inf,
+                                   max_output_size=100, block_size=BLOCK_SIZE):
+    """Class-aware non-max suppression: boxes only suppress boxes of their own class.
+
+    All classes go through a single greedy pass instead of one per class, the overlaps are masked
+    to the pairs of the same class.
+
+    Args:
+        boxes: [N, 4] boxes.
+        scores: [N] scores.
+        classes: [N] integer class ids.
+        (other arguments as in non_max_suppression)
+
+    Returns:
+        int array of the kept indices into boxes, best first.
+    """
+    return _non_max_suppression(boxes, scores, np.asarray(classes).reshape(-1), iou_threshold, score_threshold,
+                                max_output_size, block_size)
+
+
+def soft_non_max_suppression(boxes, scores, iou_threshold=0.3, sigma=0.5, method='gaussian',
+                             score_threshold=0.001, max_output_size=100):
+    """Soft-NMS (Bodla et al. 2017): overlapping boxes get their scores decayed instead of removed.
+
+    Each step keeps the best remaining box and decays the scores of all remaining boxes at once,
+    the search stops when no remaining score reaches score_threshold.
+
+    Args:
+        boxes: [N, 4] boxes.
+        scores: [N] scores.
+        iou_threshold: 'linear' only decays boxes that overlap by more than this.
+        sigma: width of the 'gaussian' decay exp(-iou^2/sigma).
+        method: 'gaussian' or 'linear'.
+        score_threshold: minimum decayed score of a kept box.
+        max_output_size: maximum number of kept boxes.
+
+    Returns:
+        (indices, scores): kept indices into boxes and their decayed scores, best first.
+
+    Raises:
+        ValueError: for an unknown method.
+    """
+    if method not in ('gaussian', 'linear'):
+        raise ValueError(f'Unknown Soft-NMS method "{method}".')
+    boxes = _float(boxes)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    remaining = _best_first(scores, _valid(scores, score_threshold))
+    boxes, current = boxes[remaining], scores[remaining].copy()
+    areas = area(boxes)
+    alive = np.arange(len(remaining))
+    keep = np.empty(min(max_output_size, len(remaining)), dtype=np.int64)
+    kept_scores = np.empty(len(keep), dtype=np.float32)
+    num_kept = 0
+    while len(alive) and num_kept < len(keep):
+        best = np.argmax(current[alive])
+        index = alive[best]
+        if current[index] < score_threshold:
+            break
+        keep[num_kept], kept_scores[num_kept] = index, current[index]
+        num_kept += 1
+        alive = np.delete(alive, best)
+        overlaps = iou(boxes[index:index + 1], boxes[alive], areas[index:index + 1], areas[alive])[0]
+        if method == 'gaussian':
+            current[alive] *= np.exp(-overlaps**2/sigma)
+        else:
+            current[alive] *= np.where(overlaps > iou_threshold, 1 - overlaps, 1)
+        alive = alive[current[alive] >= score_threshold]
+    return remaining[keep[:num_kept]], kept_scores[:num_kept]
+
+
+def batched_non_max_suppression(boxes, scores, classes=None, iou_threshold=0.5, score_threshold=-np.inf,
+                                max_output_size=100):
+    """Non-max suppression of a batch, in the padded format of the Detector backends.
+
+    Args:
+        boxes: [B, N, 4] boxes.
+        scores: [B, N] scores.
+        classes: optional [B, N] class ids, class-aware NMS if given.
+        (other arguments as in non_max_suppression)
+
+    Returns:
+        (boxes [B, max_output_size, 4], scores [B, max_output_size], classes [B, max_output_size],
+        nums [B]) zero padded after the nums[i] valid detections.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32)
+    scores = np.asarray(scores, dtype=np.float32)
+    classes = np.zeros(scores.shape, dtype=np.int32) if classes is None else np.asarray(classes)
+    batch = len(boxes)
+    out_boxes = np.zeros((batch, max_output_size, 4), dtype=np.float32)
+    out_scores = np.zeros((batch, max_output_size), dtype=np.float32)
+    out_classes = np.zeros((batch, max_output_size), dtype=classes.dtype)
+    nums = np.zeros(batch, dtype=np.int32)
+    for i in range(batch):
+        keep = multiclass_non_max_suppression(boxes[i], scores[i], classes[i], iou_threshold,
+                                              score_threshold, max_output_size)
+        n = nums[i] = len(keep)
+        out_boxes[i, :n], out_scores[i, :n], out_classes[i, :n] = boxes[i][keep], scores[i][keep], classes[i][keep]
+    return out_boxes, out_scores, out_classes, nums
@@ -0,0 +1,158 @@
+"""Tests for utils.np_nms_ops against brute-force references."""
+import unittest
+
+import numpy as np
+
+from utils import np_nms_ops
+
+
+def _reference_iou(box1, box2):
+    y_min, x_min = max(box1[0], box2[0]), max(box1[1], box2[1])
+    y_max, x_max = min(box1[2], box2[2]), min(box1[3], box2[3])
+    intersection = max(y_max - y_min, 0)*max(x_max - x_min, 0)
+    union = (box1[2] - box1[0])*(box1[3] - box1[1]) + (box2[2] - box2[0])*(box2[3] - box2[1]) - intersection
+    return intersection/union if union > 0 else 0.0
+
+
+def _reference_nms(boxes, scores, iou_threshold, score_threshold=-np.inf, max_output_size=100):
+    keep = []
+    for i in sorted(range(len(scores)), key=lambda i: -scores[i]):
+        if len(keep) == max_output_size:
+            break
+        if scores[i] < score_threshold:
+            continue
+        if all(_reference_iou(boxes[i], boxes[j]) <= iou_threshold for j in keep):
+            keep.append(i)
+    return keep
+
+
+def _reference_multiclass_nms(boxes, scores, classes, iou_threshold, max_output_size=100):
+    keep = []
+    for i in sorted(range(len(scores)), key=lambda i: -scores[i]):
+        if len(keep) == max_output_size:
+            break
+        if all(classes[i] != classes[j] or _reference_iou(boxes[i], boxes[j]) <= iou_threshold for j in keep):
+            keep.append(i)
+    return keep
+
+
+def _reference_soft_nms(boxes, scores, iou_threshold, sigma, method, score_threshold, max_output_size=100):
+    scores = [float(s) for s in scores]
+    remaining = [i for i in range(len(scores)) if scores[i] >= score_threshold]
+    keep, kept_scores = [], []
+    while remaining and len(keep) < max_output_size:
+        best = max(remaining, key=lambda i: scores[i])
+        if scores[best] < score_threshold:
+            break
+        keep.append(best)
+        kept_scores.append(scores[best])
+        remaining.remove(best)
+        for i in remaining:
+            overlap = _reference_iou(boxes[best], boxes[i])
+            if method == 'gaussian':
+                scores[i] *= np.exp(-overlap**2/sigma)
+            elif overlap > iou_threshold:
+                scores[i] *= 1 - overlap
+        remaining = [i for i in remaining if scores[i] >= score_threshold]
+    return keep, kept_scores
+
+
+def _random_boxes(rng, count, clusters=8):
+    """Boxes around a few centers, so that many of them overlap."""
+    centers = rng.uniform(0.1, 0.9, (clusters, 2))[rng.integers(0, clusters, count)]
+    centers += rng.normal(0, 0.03, (count, 2))
+    sizes = rng.uniform(0.05, 0.2, (count, 2))
+    boxes = np.concatenate((centers - sizes/2, centers + sizes/2), axis=1)
+    return boxes.astype(np.float32), rng.random(count).astype(np.float32)
+
+
+class NonMaxSuppressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_iou(self):
+        boxes1 = np.array([[0.0, 0.0, 1.0, 1.0], [0.0, 0.0, 2.0, 2.0]], dtype=np.float32)
+        boxes2 = np.array([[0.0, 0.0, 1.0, 1.0], [0.5, 0.5, 1.5, 1.5], [3.0, 3.0, 3.0, 3.0]],
+                          dtype=np.float32)
+        expected = [[_reference_iou(b1, b2) for b2 in boxes2] for b1 in boxes1]
+        np.testing.assert_allclose(np_nms_ops.iou(boxes1, boxes2), expected, rtol=1e-6)
+
+    def test_matches_reference(self):
+        for count in (0, 1, 5, 100, 700):
+            boxes, scores = _random_boxes(self.rng, count)
+            for iou_threshold in (0.0, 0.3, 0.5, 0.9):
+                keep = np_nms_ops.non_max_suppression(boxes, scores, iou_threshold, block_size=32)
+                self.assertEqual(keep.tolist(), _reference_nms(boxes, scores, iou_threshold))
+
+    def test_score_threshold_and_max_output_size(self):
+        boxes, scores = _random_boxes(self.rng, 300)
+        keep = np_nms_ops.non_max_suppression(boxes, scores, 0.5, score_threshold=0.4, max_output_size=7,
+                                              block_size=16)
+        self.assertEqual(keep.tolist(), _reference_nms(boxes, scores, 0.5, 0.4, 7))
+
+    def test_tied_scores_across_blocks(self):
+        # Ties at the end of the first sorted block keep the index order
+        boxes, _ = _random_boxes(self.rng, 400)
+        scores = np.round(self.rng.random(400), 1).astype(np.float32)
+        for block_size in (8, 64, 256):
+            keep = np_nms_ops.non_max_suppression(boxes, scores, 0.5, max_output_size=300, block_size=block_size)
+            self.assertEqual(keep.tolist(), _reference_nms(boxes, scores, 0.5, max_output_size=300))
+
+    def test_disjoint_boxes_are_all_kept(self):
+        boxes = np.array([[i, 0, i + 1, 1] for i in range(10)], dtype=np.float32)
+        scores = np.arange(10, dtype=np.float32)
+        self.assertEqual(np_nms_ops.non_max_suppression(boxes, scores).tolist(), list(range(9, -1, -1)))
+
+    def test_invalid_arguments(self):
+        boxes, scores = _random_boxes(self.rng, 4)
+        with self.assertRaises(ValueError):
+            np_nms_ops.non_max_suppression(boxes, scores, iou_threshold=1.5)
+        with self.assertRaises(ValueError):
+            np_nms_ops.non_max_suppression(boxes, scores[:3])
+
+    def test_multiclass_matches_reference(self):
+        for count in (1, 50, 400):
+            boxes, scores = _random_boxes(self.rng, count)
+            classes = self.rng.integers(0, 4, count)
+            keep = np_nms_ops.multiclass_non_max_suppression(boxes, scores, classes, 0.4, block_size=32)
+            self.assertEqual(keep.tolist(), _reference_multiclass_nms(boxes, scores, classes, 0.4))
+
+    def test_multiclass_keeps_overlapping_boxes_of_other_classes(self):
+        boxes = np.array([[0, 0, 1, 1], [0, 0, 1, 1], [0, 0, 1, 1]], dtype=np.float32)
+        scores = np.array([0.9, 0.8, 0.7], dtype=np.float32)
+        keep = np_nms_ops.multiclass_non_max_suppression(boxes, scores, [1, 1, 2])
+        self.assertEqual(keep.tolist(), [0, 2])
+
+    def test_soft_nms_matches_reference(self):
+        for method in ('gaussian', 'linear'):
+            for count in (0, 1, 60, 300):
+                boxes, scores = _random_boxes(self.rng, count)
+                keep, kept_scores = np_nms_ops.soft_non_max_suppression(boxes, scores, 0.3, 0.5, method, 0.05)
+                expected, expected_scores = _reference_soft_nms(boxes, scores, 0.3, 0.5, method, 0.05)
+                self.assertEqual(keep.tolist(), expected)
+                np.testing.assert_allclose(kept_scores, expected_scores, rtol=1e-5)
+
+    def test_soft_nms_unknown_method(self):
+        boxes, scores = _random_boxes(self.rng, 4)
+        with self.assertRaises(ValueError):
+            np_nms_ops.soft_non_max_suppression(boxes, scores, method='hard')
+
+    def test_batched_padding(self):
+        boxes, scores = zip(*(_random_boxes(self.rng, 80) for _ in range(3)))
+        boxes, scores = np.stack(boxes), np.stack(scores)
+        classes = self.rng.integers(0, 3, scores.shape)
+        out_boxes, out_scores, out_classes, nums = np_nms_ops.batched_non_max_suppression(
+            boxes, scores, classes, 0.5, max_output_size=20)
+        self.assertEqual(out_boxes.shape, (3, 20, 4))
+        for i in range(3):
+            keep = _reference_multiclass_nms(boxes[i], scores[i], classes[i], 0.5, 20)
+            self.assertEqual(nums[i], len(keep))
+            np.testing.assert_array_equal(out_boxes[i, :nums[i]], boxes[i][keep])
+            np.testing.assert_array_equal(out_scores[i, :nums[i]], scores[i][keep])
+            np.testing.assert_array_equal(out_classes[i, :nums[i]], classes[i][keep])
+            self.assertFalse(out_scores[i, nums[i]:].any())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import numpy as np
+import tensorflow as tf
+from yolov3_tf2.models import (YoloV3, YoloV3Tiny, yolo_boxes, yolo_anchors, yolo_anchor_masks,
+                               yolo_tiny_anchors, yolo_tiny_anchor_masks)
+
+
+def yolo_decode(outputs, anchors, masks, classes):
+    """ Raw head outputs -> (N, boxes, 4) [x1, y1, x2, y2], (N, boxes, classes) scores """
+    bbox, scores = [], []
+    for output, mask in zip(outputs, masks):
+        box, objectness, class_probs, _ = yolo_boxes(output, anchors[mask], classes)
+        batch = tf.shape(box)[0]
+        bbox.append(tf.reshape(box, (batch, -1, 4)))
+        scores.append(tf.reshape(objectness*class_probs, (batch, -1, classes)))
+    return tf.concat(bbox, axis=1), tf.concat(scores, axis=1)
+
+
+def class_channels(classes, target_classes, anchors):
+    """ Channels of a YOLO output conv that are kept for target_classes: x, y, w, h, obj + their scores """
+    channels = list(range(5)) + [5 + c for c in target_classes]
+    return [a*(classes + 5) + c for a in range(anchors) for c in channels]
+
+
+def prune_classes(model, pruned, target_classes, classes):
+    """Copies the weights of a full model into one built with len(target_classes) classes
+    Only the last conv of every yolo_output_* head changes: its filters are kept for the box,
+    objectness and target class channels of each anchor, everything else is copied as is.
+    """
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if layer.name.startswith('yolo_output') and weights:
+            kernel, bias = weights[-2:]
+            keep = class_channels(classes, target_classes, kernel.shape[-1]//(classes + 5))
+            weights = weights[:-2] + [kernel[..., keep], bias[keep]]
+        if weights:
+            pruned.get_layer(layer.name).set_weights(weights)
+    return pruned
+
+
+def build_model(tiny=True, classes=80, size=416):
+    """ Training graph (raw head outputs, no decoding/NMS Lambda layers) and its anchors/masks """
+    if tiny:
+        return YoloV3Tiny(size, classes=classes, training=True), yolo_tiny_anchors, yolo_tiny_anchor_masks
+    return YoloV3(size, classes=classes, training=True), yolo_anchors, yolo_anchor_masks
+
+
+def export_pruned_weights(weights, output, target_classes, tiny=True, classes=80, size=416):
+    """ Saves a checkpoint whose head only predicts target_classes, load it with pruned_weights=True """
+    model, _, _ = build_model(tiny, classes, size)
+    model.load_weights(weights).expect_partial()
+    pruned, _, _ = build_model(tiny, len(target_classes), size)
+    prune_classes(model, pruned, target_classes, classes).save_weights(output)
+    return output
+
+
+class YoloInference():
+    """Compiled YOLOv3 / YOLOv3-Tiny inference
+    Resize, normalization, the forward pass, box decoding and NMS are traced into one graph with
+    a static input signature, instead of going through Keras' predict() machinery per frame.
+    The forward pass can optionally be XLA compiled (NMS stays outside of XLA).
+    With target_classes (class ids, e.g. [0] for person) the classification head is pruned to
+    those classes, so decoding and NMS only see them (single-class NMS for one class); the
+    returned classes are still the original ids.
+    Attributes:
+        size (int): network input size
+        batch_size (int): static batch size of the input signature, None for any
+        bgr (bool): inputs are OpenCV BGR frames, converted to RGB inside the graph
+        target_classes (list): class ids the head predicts, None for all
+    """
+
+    def __init__(self, weights, tiny=True, classes=80, size=416, batch_size=1, bgr=True,
+                 max_boxes=100, iou_threshold=0.5, score_threshold=0.5, jit_compile=False,
+                 target_classes=None, pruned_weights=False):
+        self.size = size
+        self.target_classes = None if target_classes is None else list(target_classes)
+        self.classes = classes if target_classes is None else len(self.target_classes)
+        self.batch_size = batch_size
+        self.bgr = bgr
+        self.max_boxes = max_boxes
+        self.iou_threshold = iou_threshold
+        self.score_threshold = score_threshold
+        # The training graph has the same weights, only without the decoding/NMS Lambda layers
+        self.model, self.anchors, self.masks = build_model(tiny, self.classes, size)
+        if self.target_classes is None or pruned_weights:
+            self.model.load_weights(weights).expect_partial()
+        else:
+            full_model, _, _ = build_model(tiny, classes, size)
+            full_model.load_weights(weights).expect_partial()
+            prune_classes(full_model, self.model, self.target_classes, classes)
+
+        self._forward = tf.function(lambda x: self.model(x, training=False), jit_compile=jit_compile)
+        signature = [tf.TensorSpec((batch_size, None, None, 3), tf.uint8)]
+        self._infer = tf.function(self._graph, input_signature=signature)
+
+    def _graph(self, images):
+        if self.bgr:
+            images = images[..., ::-1]
+        x = tf.image.resize(tf.cast(images, tf.float32), (self.size, self.size)) / 255
+        outputs = self._forward(x)
+        boxes, scores = self.decode(outputs)
+        return self.nms(boxes, scores)
+
+    def decode(self, outputs):
+        return yolo_decode(outputs, self.anchors, self.masks, self.classes)
+
+    def nms(self, boxes, scores):
+        boxes, scores, classes, nums = tf.image.combined_non_max_suppression(
+            boxes=tf.expand_dims(boxes, 2),
+            scores=scores,
+            max_output_size_per_class=self.max_boxes,
+            max_total_size=self.max_boxes,
+            iou_threshold=self.iou_threshold,
+            score_threshold=self.score_threshold)
+        if self.target_classes is not None:
+            class_ids = tf.constant(self.target_classes, dtype=classes.dtype)
+            classes = tf.gather(class_ids, tf.cast(classes, tf.int32))
+        return boxes, scores, classes, nums
+
+    def __call__(self, images):
+        """ (N,H,W,3) uint8 frames -> NumPy boxes [x1, y1, x2, y2], scores, classes, nums """
+        return [output.numpy() for output in self._infer(tf.convert_to_tensor(images, tf.uint8))]
+
+    def warmup(self, shape=(480, 640, 3)):
+        self(np.zeros((self.batch_size or 1,) + tuple(shape), dtype=np.uint8))